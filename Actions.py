@@ -34,3 +34,29 @@ class ActionKeyPressed(Action):
 
     def getKey(self):
         return self.key
+
+
+class ActionResult(Action):
+    '''
+    Action for results of computations made by a BackgroundWorker
+    '''
+    def __init__(self, requestId, value, done):
+        Action.__init__(self, "RESULT")
+        self.requestId = requestId
+        self.value = value
+        self.done = done
+
+
+    def getRequestId(self):
+        return self.requestId
+
+
+    def getValue(self):
+        return self.value
+
+
+    def isDone(self):
+        '''
+        Returns whether this is the final result, rather than a partial one
+        '''
+        return self.done
@@ -0,0 +1,165 @@
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+import Colours as colour
+from AnalysisStore import AnalysisStore
+from Search import AlphaBetaSearch, SearchTimeout, WIN_THRESHOLD
+from Symmetry import toCanonicalMove
+
+
+# Deepest search made by analysePosition
+MAX_ANALYSIS_DEPTH = 6
+
+# Positions whose analysis is remembered by AnalysisCache. The cache is emptied when full.
+MAX_CACHE_ENTRIES = 4096
+
+# Shades run from green for the best move to red for moves this much worse
+SHADE_RANGE = 24
+SHADE_LEVELS = 8
+SHADE_ALPHA = 112
+
+# Kept between analyses in the worker process, so its transposition table is reused
+_search = None
+
+# AnalysisStore opened by this process, by path
+_stores = {}
+
+
+def _getStore(path):
+    store = _stores.get(path)
+    if (store is None):
+        store = _stores[path] = AnalysisStore(path)
+    return store
+
+
+def analysePosition(rules, startDepth=1, maxDepth=MAX_ANALYSIS_DEPTH, storePath=None, isCancelled=None, report=None):
+    '''
+    Scores every move taking the turn (placements, removals and clearance
+    removals) with deeper searches in turn, from startDepth to maxDepth.
+    Each depth is passed to report as (depth, {move: value}) when it completes.
+    Values are from the point of view of the player to move.
+    Returns the deepest result, or None if none completed.
+    Meant to be run by BackgroundWorker.submit.
+
+    Given the path of an AnalysisStore, a stored analysis of every move is
+    reported first and searching continues from below it, and each depth
+    searched is added to the store.
+    '''
+    global _search
+    if (_search is None):
+        _search = AlphaBetaSearch()
+    _search.tt.newSearch()
+
+    moves = rules.getLegalMoves(includeShifts=False)
+    result = None
+    store = _getStore(storePath) if storePath else None
+    if (store is not None):
+        stored = store.lookup(rules)
+        if (stored is not None and stored[0] >= startDepth and all(move in stored[1] for move in moves)):
+            result = (stored[0], {move: stored[1][move] for move in moves})
+            if (report is not None):
+                report(result)
+            startDepth = stored[0] + 1
+
+    for depth in range(startDepth, maxDepth + 1):
+        try:
+            values = _search.scoreMoves(rules, moves, depth, isCancelled)
+        except SearchTimeout:
+            break
+        result = (depth, values)
+        if (store is not None):
+            store.store(rules, depth, values)
+        if (report is not None):
+            report(result)
+        if (all(abs(value) >= WIN_THRESHOLD for value in values.values())):
+            # Every result is forced, deeper searches will not change them
+            break
+    return result
+
+
+def getCellValues(values):
+    '''
+    Returns {coor: value} with the best value of the moves touching each space.
+    Removals count for both of the beads removed.
+    '''
+    cells = {}
+    for move, value in values.items():
+        for coor in (move.coor, move.coor2):
+            if (coor is not None and value > cells.get(coor, -WIN_THRESHOLD * 2)):
+                cells[coor] = value
+    return cells
+
+
+def getShadeColour(value, best):
+    '''
+    Returns the RGBA colour shading a space, from the value of its best move
+    and the best value of any move
+    '''
+    if (value <= -WIN_THRESHOLD):
+        level = SHADE_LEVELS
+    elif (value >= WIN_THRESHOLD or best >= WIN_THRESHOLD):
+        level = 0 if value >= best else SHADE_LEVELS
+    else:
+        level = min(SHADE_LEVELS, round(SHADE_LEVELS * (best - value) / float(SHADE_RANGE)))
+    t = level / float(SHADE_LEVELS)
+    (r1, g1, b1), (r2, g2, b2) = colour.GREEN, colour.RED
+    return (int(r1 + t * (r2 - r1)), int(g1 + t * (g2 - g1)), int(b1 + t * (b2 - b1)), SHADE_ALPHA)
+
+
+def formatValue(value):
+    if (value >= WIN_THRESHOLD):
+        return "wins"
+    elif (value <= -WIN_THRESHOLD):
+        return "loses"
+    return "{:+d}".format(value)
+
+
+class AnalysisCache:
+    '''
+    Remembers the deepest value found for each move of each position, keyed
+    by Rules.getCanonicalHash, so a position reached again by a shift,
+    rotation or reflection starts from what is already known.
+    Moves are stored in the canonical form's coordinates.
+    '''
+    def __init__(self, maxEntries=MAX_CACHE_ENTRIES):
+        self.maxEntries = maxEntries
+        self.entries = {}
+
+
+    def lookup(self, key, transform, moves):
+        '''
+        Returns (depth, {move: value}) for those of the moves which are known,
+        where depth is the shallowest of their searches, or 0 if some are
+        not known. Returns None if the position has not been analysed.
+        '''
+        entry = self.entries.get(key)
+        if (entry is None):
+            return None
+        depth = MAX_ANALYSIS_DEPTH
+        values = {}
+        for move in moves:
+            known = entry.get(toCanonicalMove(move, transform))
+            if (known is None):
+                depth = 0
+            else:
+                depth = min(depth, known[0])
+                values[move] = known[1]
+        return depth, values
+
+
+    def store(self, key, transform, depth, values):
+        '''
+        Adds the values of moves searched to depth, keeping deeper values already known
+        '''
+        entry = self.entries.get(key)
+        if (entry is None):
+            if (len(self.entries) >= self.maxEntries):
+                self.entries.clear()
+            entry = self.entries[key] = {}
+        for move, value in values.items():
+            move = toCanonicalMove(move, transform)
+            known = entry.get(move)
+            if (known is None or known[0] <= depth):
+                entry[move] = (depth, value)
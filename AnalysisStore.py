@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+from multiprocessing import Pool
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from BitBoard import BitBoard
+from Moves import Move
+from PositionCodec import encodeCanonicalPosition
+from Rules import Rules
+from Symmetry import toCanonicalMove, fromCanonicalMove
+
+
+# On-disk cache of position analyses.
+#
+# Entries are keyed by PositionCodec.encodeCanonicalPosition, so every
+# translation, rotation and reflection of a position shares one, and hold
+# the depth searched and the value of each move, in the canonical form's
+# coordinates and the notation of Move.toNotation.
+#
+# The store is an SQLite database in write-ahead logging mode, so any number
+# of processes can read it while one at a time appends. Each entry records
+# when it was last used. Once the store holds more than maxEntries, the
+# least recently used are deleted to bring it back down to EVICT_TO of it.
+
+# Fraction of maxEntries kept by an eviction
+EVICT_TO = 0.9
+
+# Entries written between checks of the store's size
+EVICT_CHECK_INTERVAL = 256
+
+# Seconds before a read records again that an entry was used. Recording
+# every read would make each read a write.
+TOUCH_INTERVAL = 60.
+
+# Seconds a process waits for another's write to finish
+BUSY_TIMEOUT = 30.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    position BLOB PRIMARY KEY,
+    depth INTEGER NOT NULL,
+    moves TEXT NOT NULL,
+    lastUsed REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS analysesByUse ON analyses (lastUsed);
+"""
+
+
+class AnalysisStore:
+    '''
+    Persistent cache of the analysis of positions, see the top of AnalysisStore.py.
+    Each process should open its own AnalysisStore on the same path.
+    '''
+    def __init__(self, path, maxEntries=1000000):
+        self.path = path
+        self.maxEntries = maxEntries
+        self.connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(_SCHEMA)
+        self.nWrites = 0
+
+        # Statistics for this connection
+        self.hits = 0
+        self.misses = 0
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+
+    def close(self):
+        self.connection.close()
+
+
+    ### Raw access by encoded position
+
+    def get(self, key):
+        '''
+        Returns (depth, {notation: value}) stored for an encoded position, or None
+        '''
+        row = self.connection.execute(
+            "SELECT depth, moves, lastUsed FROM analyses WHERE position = ?", (key,)).fetchone()
+        if (row is None):
+            self.misses += 1
+            return None
+        self.hits += 1
+        depth, moves, lastUsed = row
+        now = time.time()
+        if (now - lastUsed > TOUCH_INTERVAL):
+            self.connection.execute("UPDATE analyses SET lastUsed = ? WHERE position = ?", (now, key))
+        return depth, json.loads(moves)
+
+
+    def put(self, key, depth, moves):
+        '''
+        Stores {notation: value} searched to depth for an encoded position,
+        unless a deeper analysis is already stored
+        '''
+        self.connection.execute(
+            "INSERT INTO analyses (position, depth, moves, lastUsed) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (position) DO UPDATE SET depth = excluded.depth, moves = excluded.moves, "
+            "lastUsed = excluded.lastUsed WHERE excluded.depth >= analyses.depth",
+            (key, depth, json.dumps(moves, separators=(",", ":")), time.time()))
+        self.nWrites += 1
+        if (self.nWrites % EVICT_CHECK_INTERVAL == 0):
+            self.evict()
+
+
+    def evict(self):
+        '''
+        Deletes the least recently used entries if there are more than maxEntries
+        '''
+        excess = len(self) - self.maxEntries
+        if (excess <= 0):
+            return 0
+        nDeleted = excess + int(self.maxEntries * (1. - EVICT_TO))
+        self.connection.execute(
+            "DELETE FROM analyses WHERE position IN "
+            "(SELECT position FROM analyses ORDER BY lastUsed LIMIT ?)", (nDeleted,))
+        logging.info("Evicted {} analyses from {}".format(nDeleted, self.path))
+        return nDeleted
+
+
+    ### Access by position
+
+    def lookup(self, rules):
+        '''
+        Returns (depth, {move: value}) stored for the position of the rules,
+        with the moves in its coordinates, or None
+        '''
+        key, transform = encodeCanonicalPosition(rules)
+        entry = self.get(key)
+        if (entry is None):
+            return None
+        depth, moves = entry
+        return depth, {
+            fromCanonicalMove(Move.fromNotation(notation), transform): value for notation, value in moves.items()}
+
+
+    def store(self, rules, depth, values):
+        '''
+        Stores {move: value} searched to depth for the position of the rules
+        '''
+        key, transform = encodeCanonicalPosition(rules)
+        self.put(key, depth, {toCanonicalMove(move, transform).toNotation(): value for move, value in values.items()})
+
+
+### Warming
+
+def iterPositions(rules, plies):
+    '''
+    Yields the positions reached by up to plies moves taking the turn from
+    the rules' position, once per canonical form
+    '''
+    seen = set()
+    frontier = [rules.copy()]
+    for ply in range(plies + 1):
+        nextFrontier = []
+        for position in frontier:
+            key, _ = encodeCanonicalPosition(position)
+            if (key in seen or position.isFinished):
+                continue
+            seen.add(key)
+            yield position
+            if (ply < plies):
+                for move in position.getLegalMoves(includeShifts=False):
+                    child = position.copy()
+                    child.makeMove(move)
+                    nextFrontier.append(child)
+        frontier = nextFrontier
+
+
+_workerStore = None
+
+
+def _analyseForStore(args):
+    '''
+    Analyses a position in a worker process and adds it to the store
+    '''
+    # Imported here as Analysis itself uses the store
+    from Analysis import analysePosition
+    global _workerStore
+    rules, depth, path = args
+    if (_workerStore is None):
+        _workerStore = AnalysisStore(path)
+    stored = _workerStore.lookup(rules)
+    if (stored is not None and stored[0] >= depth):
+        return False
+    analysePosition(rules, depth, depth, path)
+    return True
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Inspects and warms an analysis store")
+    parser.add_argument("path", help="Analysis store file")
+    parser.add_argument("--warm-plies", type=int, default=0,
+        help="Analyse every position up to this many moves from the start (default: 0, only report)")
+    parser.add_argument("--depth", type=int, default=4, help="Depth to analyse positions to (default: 4)")
+    parser.add_argument("--size", type=int, default=5, help="Width of the square board (default: 5)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+        help="Number of worker processes (default: number of CPUs)")
+    return parser.parse_args()
+
+
+def main():
+    '''
+    Main function
+    '''
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%H:%M:%S')
+    args = parseArgs()
+
+    if (args.warm_plies):
+        positions = list(iterPositions(Rules(BitBoard(args.size)), args.warm_plies))
+        logging.info("Analysing {} positions to depth {}".format(len(positions), args.depth))
+        startTime = time.perf_counter()
+        jobs = [(position, args.depth, args.path) for position in positions]
+        if (args.workers > 1):
+            with Pool(args.workers) as pool:
+                nAnalysed = sum(pool.imap_unordered(_analyseForStore, jobs))
+        else:
+            nAnalysed = sum(map(_analyseForStore, jobs))
+        logging.info("Analysed {} positions in {:.1f} s, {} already stored".format(
+            nAnalysed, time.perf_counter() - startTime, len(positions) - nAnalysed))
+
+    with AnalysisStore(args.path) as store:
+        print("{} analyses in {} ({:.1f} MB)".format(len(store), args.path, os.path.getsize(args.path) / 1e6))
+
+
+if __name__ == "__main__":
+    main()
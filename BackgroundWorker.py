@@ -0,0 +1,179 @@
+import atexit
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+
+import pygame
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from Input import RESULT_EVENT
+
+
+# Background computation.
+#
+# The worker process runs one request at a time, in the order they were made.
+# Each request has an id, and making a new request or calling cancel
+# supersedes the current one: the worker skips superseded requests, asks a
+# running computation to stop early, and drops its result.
+#
+# Results are posted to the pygame event queue by a thread in the window's
+# process, so they wake an idle event-driven loop and arrive through Input
+# as ActionResult actions.
+
+# Added to the worker's niceness, so the window's loop is scheduled first
+WORKER_NICENESS = 5
+
+# Seconds between the worker's checks that the window's process is alive
+PARENT_CHECK_INTERVAL = 1.0
+
+
+def _runWorker(requests, results, latest, parentPid):
+    '''
+    Entry point for the worker process
+    '''
+    try:
+        os.nice(WORKER_NICENESS)
+    except OSError:
+        pass
+
+    players = {}
+    while True:
+        try:
+            request = requests.get(timeout=PARENT_CHECK_INTERVAL)
+        except queue.Empty:
+            if (os.getppid() != parentPid):
+                break
+            continue
+        if (request is None):
+            break
+
+        kind, requestId, args = request
+        if (kind == "player"):
+            key, player = args
+            if (key in players):
+                players[key].close()
+            players[key] = player
+            continue
+        if (latest.value != requestId):
+            # Superseded before it started
+            continue
+
+        def isCancelled():
+            return latest.value != requestId
+
+        def report(value):
+            '''
+            Sends a partial result, for computations which improve over time
+            '''
+            if (not isCancelled()):
+                results.put((requestId, value, False))
+
+        try:
+            if (kind == "move"):
+                key, rules = args
+                value = players[key].chooseMove(rules, isCancelled)
+            else:
+                function, functionArgs = args
+                value = function(*functionArgs, isCancelled=isCancelled, report=report)
+        except Exception:
+            logging.exception("Background computation failed")
+            value = None
+        if (not isCancelled()):
+            results.put((requestId, value, True))
+
+    for player in players.values():
+        player.close()
+
+
+class BackgroundWorker:
+    '''
+    Runs moves and analysis for the window in a separate process, so they
+    do not hold up drawing.
+
+    Computer players are sent to the worker once with setPlayer, and keep
+    their state there between moves. requestMove and submit return the id
+    of the request, which is given with its result in an ActionResult.
+    '''
+    def __init__(self):
+        self.requests = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.latest = multiprocessing.Value("q", 0, lock=False)
+        self.requestIds = itertools.count(1)
+
+        # Not a daemon, as MCTS players start processes of their own
+        self.process = multiprocessing.Process(
+            target=_runWorker, args=(self.requests, self.results, self.latest, os.getpid()))
+        self.process.start()
+
+        self.listener = threading.Thread(target=self._postResults, daemon=True)
+        self.listener.start()
+        atexit.register(self.close)
+
+
+    def setPlayer(self, key, player):
+        '''
+        Sends a copy of a computer player to the worker, to be used by requestMove
+        '''
+        self.requests.put(("player", None, (key, player)))
+
+
+    def requestMove(self, key, rules):
+        '''
+        Asks the player set for key to choose a move in a snapshot of the rules.
+        The result is the move.
+        '''
+        return self._request("move", (key, rules.copy()))
+
+
+    def submit(self, function, *args):
+        '''
+        Calls function(*args, isCancelled=..., report=...) in the worker.
+        The function must be importable by name. It should return early once
+        isCancelled() is True, and may pass partial results to report, which
+        arrive before its return value.
+        '''
+        return self._request("call", (function, args))
+
+
+    def cancel(self):
+        '''
+        Supersedes the current request, if any
+        '''
+        self.latest.value = next(self.requestIds)
+
+
+    def close(self):
+        if (self.process is None):
+            return
+        self.cancel()
+        self.requests.put(None)
+        self.process.join(PARENT_CHECK_INTERVAL)
+        if (self.process.is_alive()):
+            self.process.terminate()
+        self.process = None
+        self.results.put(None)
+        self.listener.join(PARENT_CHECK_INTERVAL)
+
+
+    def _request(self, kind, args):
+        requestId = next(self.requestIds)
+        self.latest.value = requestId
+        self.requests.put((kind, requestId, args))
+        return requestId
+
+
+    def _postResults(self):
+        while True:
+            result = self.results.get()
+            if (result is None):
+                break
+            requestId, value, done = result
+            # Dropped if the loop has moved on since the result was sent
+            if (requestId == self.latest.value and pygame.display.get_init()):
+                pygame.event.post(pygame.event.Event(RESULT_EVENT, requestId=requestId, value=value, done=done))
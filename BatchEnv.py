@@ -0,0 +1,366 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from BitBoard import BitBoard
+from Rules import Rules, getDefaultStartingBeads, getDefaultClearanceRemovals
+
+
+# Move types accepted by BatchEnv.step
+NONE = -1
+PLACE = 0
+REMOVE = 1
+CLEAR = 2
+SHIFT = 3
+
+# Shift directions accepted by BatchEnv.step
+UP = 0
+DOWN = 1
+LEFT = 2
+RIGHT = 3
+
+
+class BatchEnv:
+    '''
+    Steps many games in lockstep with vectorised NumPy operations.
+
+    Boards are held as a single (nGames, size, size) int8 array indexed
+    [game, x, y], holding 1 for player 1, -1 for player 2 and 0 when empty.
+    Each game has its own turn, finished and clearance state, following Rules.
+    Removal pairs are applied as single moves, as in Rules.makeMove.
+    Rules parameters left as None are derived from the board size.
+    '''
+    def __init__(self, nGames, size=5, startingBeads=None, clearanceRemovals=None):
+        self.nGames = nGames
+        self.size = size
+        self.startingBeads = startingBeads if startingBeads is not None else getDefaultStartingBeads(size)
+        self.clearanceRemovals = (
+            clearanceRemovals if clearanceRemovals is not None else getDefaultClearanceRemovals(size))
+
+        self.boards = np.zeros((nGames, size, size), dtype=np.int8)
+        self.p1Turn = np.ones(nGames, dtype=bool)
+        self.finished = np.zeros(nGames, dtype=bool)
+        self.inClearance = np.zeros(nGames, dtype=bool)
+        self.clearanceCount = np.zeros(nGames, dtype=np.int16)
+        self.plies = np.zeros(nGames, dtype=np.int32)
+
+        self.games = np.arange(nGames)
+
+
+    def reset(self, games=None):
+        '''
+        Resets all games, or those selected by an index or boolean array
+        '''
+        if (games is None):
+            games = slice(None)
+        self.boards[games] = 0
+        self.p1Turn[games] = True
+        self.finished[games] = False
+        self.inClearance[games] = False
+        self.clearanceCount[games] = 0
+        self.plies[games] = 0
+
+
+    ### Conversion functions
+
+    def setGame(self, i, rules):
+        '''
+        Copies the state of a Rules object into game i.
+        Rules must not have a bead staged for removal.
+        '''
+        assert(not rules.isStateRemoval())
+        assert(rules.board.size == self.size)
+        self.boards[i] = np.array(rules.board.array, dtype=np.int8)
+        self.p1Turn[i] = rules.isP1Turn()
+        self.finished[i] = rules.isStateFinished()
+        self.inClearance[i] = rules.isStateClearance()
+        self.clearanceCount[i] = rules.clearanceCount
+
+
+    def getRules(self, i):
+        '''
+        Returns a Rules object holding the state of game i
+        '''
+        rules = Rules(BitBoard(self.size), self.startingBeads, self.clearanceRemovals)
+        for x, y in zip(*np.nonzero(self.boards[i] > 0)):
+            rules.board.setP1((int(x), int(y)))
+        for x, y in zip(*np.nonzero(self.boards[i] < 0)):
+            rules.board.setP2((int(x), int(y)))
+        rules.p1Turn = bool(self.p1Turn[i])
+        rules.isFinished = bool(self.finished[i])
+        rules.inClearance = bool(self.inClearance[i])
+        rules.clearanceCount = int(self.clearanceCount[i])
+        return rules
+
+
+    ### Board queries, evaluated for every game at once
+
+    def getPlayers(self):
+        '''
+        Returns the value of the active player's beads in each game
+        '''
+        return np.where(self.p1Turn, 1, -1).astype(np.int8)
+
+
+    def countP1Beads(self):
+        return (self.boards > 0).sum(axis=(1, 2))
+
+
+    def countP2Beads(self):
+        return (self.boards < 0).sum(axis=(1, 2))
+
+
+    def getBeadsInHand(self):
+        '''
+        Returns the number of beads the active player can still place in each game
+        '''
+        return self.startingBeads - np.where(self.p1Turn, self.countP1Beads(), self.countP2Beads())
+
+
+    def isFull(self):
+        return (self.boards != 0).all(axis=(1, 2))
+
+
+    def getNeighbourSums(self):
+        '''
+        Returns the sum of the four neighbours of each interior space,
+        as an (nGames, size - 2, size - 2) array
+        '''
+        boards = self.boards
+        return (
+            boards[:, :-2, 1:-1] + boards[:, 2:, 1:-1] +
+            boards[:, 1:-1, :-2] + boards[:, 1:-1, 2:] )
+
+
+    def getSurroundedMask(self, player):
+        '''
+        Returns an (nGames, size, size) mask of spaces surrounded by player,
+        given per game as 1 or -1
+        '''
+        player = np.asarray(player, dtype=np.int8).reshape(-1, 1, 1)
+        surrounded = np.zeros(self.boards.shape, dtype=bool)
+        surrounded[:, 1:-1, 1:-1] = self.getNeighbourSums() == 4 * player
+        return surrounded
+
+
+    def isSpaceSurrounded(self, x, y):
+        '''
+        Returns whether space (x[i], y[i]) of each game i is surrounded by either player
+        '''
+        return self._isInterior(x, y) & (np.abs(self._getSumAt(x, y)) == 4)
+
+
+    def isVictory(self):
+        '''
+        Returns whether each game has a bead surrounded by the other player
+        '''
+        sums = self.getNeighbourSums()
+        centres = self.boards[:, 1:-1, 1:-1]
+        return (((sums == 4) & (centres < 0)) | ((sums == -4) & (centres > 0))).any(axis=(1, 2))
+
+
+    def getPlacementMask(self):
+        '''
+        Returns an (nGames, size, size) mask of spaces the active player can place in
+        '''
+        players = self.getPlayers()
+        mask = (self.boards == 0) & ~self.getSurroundedMask(-players)
+        mask &= (self.getBeadsInHand() > 0).reshape(-1, 1, 1)
+        mask &= ~self.finished.reshape(-1, 1, 1)
+        return mask
+
+
+    def getShiftMask(self):
+        '''
+        Returns an (nGames, 4) mask of the shifts which are possible, in the
+        order UP, DOWN, LEFT, RIGHT
+        '''
+        occupied = self.boards != 0
+        return ~np.stack([
+            occupied[:, :, 0].any(axis=1),
+            occupied[:, :, -1].any(axis=1),
+            occupied[:, 0, :].any(axis=1),
+            occupied[:, -1, :].any(axis=1),
+        ], axis=1)
+
+
+    ### Stepping functions
+
+    def step(self, moveTypes, x1, y1, x2=None, y2=None, directions=None):
+        '''
+        Applies one move to every game. Game i plays moveTypes[i] with
+        coordinates (x1[i], y1[i]), the second bead (x2[i], y2[i]) for REMOVE
+        and directions[i] for SHIFT. Games given NONE are left unchanged.
+        Illegal moves are ignored.
+        Returns a boolean array of the games in which a move was applied.
+        '''
+        n = self.nGames
+        moveTypes = np.asarray(moveTypes)
+        x1, y1 = np.asarray(x1), np.asarray(y1)
+        x2 = np.asarray(x2) if x2 is not None else np.zeros(n, dtype=np.intp)
+        y2 = np.asarray(y2) if y2 is not None else np.zeros(n, dtype=np.intp)
+        directions = np.asarray(directions) if directions is not None else np.zeros(n, dtype=np.intp)
+
+        games, boards = self.games, self.boards
+        players = self.getPlayers()
+        active = ~self.finished
+        first = boards[games, x1, y1]
+        second = boards[games, x2, y2]
+
+        # Placement: empty space, bead in hand, not surrounded by the opponent
+        surroundedByOpponent = self._isInterior(x1, y1) & (self._getSumAt(x1, y1) == -4 * players)
+        isPlace = (moveTypes == PLACE) & active & (first == 0) & (self.getBeadsInHand() > 0) & ~surroundedByOpponent
+        # Removal: a pair of beads of different colours, outside clearance
+        isRemove = (moveTypes == REMOVE) & active & ~self.inClearance & (first.astype(np.int16) * second < 0)
+        # Clearance: one of the active player's own beads
+        isClear = (moveTypes == CLEAR) & active & self.inClearance & (first == players)
+        # Shifts: the edge being moved towards must be empty
+        shiftMask = self.getShiftMask()
+        isShift = (moveTypes == SHIFT) & active & shiftMask[games, np.clip(directions, 0, 3)]
+
+        boards[games[isPlace], x1[isPlace], y1[isPlace]] = players[isPlace]
+        boards[games[isRemove], x1[isRemove], y1[isRemove]] = 0
+        boards[games[isRemove], x2[isRemove], y2[isRemove]] = 0
+        boards[games[isClear], x1[isClear], y1[isClear]] = 0
+        self.clearanceCount[isClear] -= 1
+
+        # Edges being moved towards are empty, so rolling does not wrap beads
+        for direction, axis, offset in [(UP, 2, -1), (DOWN, 2, 1), (LEFT, 1, -1), (RIGHT, 1, 1)]:
+            selected = isShift & (directions == direction)
+            if (selected.any()):
+                boards[selected] = np.roll(boards[selected], offset, axis=axis)
+
+        self._advanceState(isPlace | isRemove | isClear)
+        applied = isPlace | isRemove | isClear | isShift
+        self.plies[applied] += 1
+        return applied
+
+
+    def _isInterior(self, x, y):
+        x, y = np.asarray(x), np.asarray(y)
+        return (x > 0) & (x < self.size - 1) & (y > 0) & (y < self.size - 1)
+
+
+    def _getSumAt(self, x, y):
+        '''
+        Returns the neighbour sum at interior space (x[i], y[i]) of each game i
+        '''
+        size = self.size
+        xIn, yIn = np.clip(x, 1, size - 2), np.clip(y, 1, size - 2)
+        boards, games = self.boards, self.games
+        return (
+            boards[games, xIn - 1, yIn].astype(np.int16) + boards[games, xIn + 1, yIn] +
+            boards[games, xIn, yIn - 1] + boards[games, xIn, yIn + 1] )
+
+
+    def _advanceState(self, moved):
+        '''
+        Vectorised equivalent of Rules.processNewState for the games which moved
+        '''
+        victory = moved & self.isVictory()
+        self.finished |= victory
+
+        ongoing = moved & ~victory
+        full = ongoing & self.isFull()
+        self.inClearance[full] = True
+        self.clearanceCount[full] = self.clearanceRemovals
+        self.inClearance[ongoing & ~full & (self.clearanceCount == 0)] = False
+
+        self.p1Turn[ongoing] = ~self.p1Turn[ongoing]
+
+
+    def getWinners(self):
+        '''
+        Returns 1 or -1 for the winner of each finished game, and 0 otherwise
+        '''
+        return np.where(self.finished, self.getPlayers(), 0)
+
+
+    ### Random play
+
+    def sampleRandomMoves(self, rng, placeChance=0.8):
+        '''
+        Samples one lightly guided random move per game, following the MCTS
+        playout policy without the winning move check.
+        Returns the arguments for step.
+        '''
+        n, size = self.nGames, self.size
+        players = self.getPlayers().reshape(-1, 1, 1)
+
+        def sampleSpace(mask):
+            # Random scores, with spaces outside the mask never chosen
+            scores = np.where(mask.reshape(n, -1), rng.random((n, size * size)), -1.)
+            return divmod(scores.argmax(axis=1), size), mask.any(axis=(1, 2))
+
+        (xPlace, yPlace), canPlace = sampleSpace(self.getPlacementMask())
+        (xP1, yP1), hasP1 = sampleSpace(self.boards > 0)
+        (xP2, yP2), hasP2 = sampleSpace(self.boards < 0)
+        (xOwn, yOwn), _ = sampleSpace(self.boards == players)
+        canRemove = hasP1 & hasP2 & ~self.inClearance
+
+        usePlace = canPlace & ((rng.random(n) < placeChance) | ~canRemove)
+        moveTypes = np.full(n, NONE)
+        moveTypes[canRemove] = REMOVE
+        moveTypes[usePlace] = PLACE
+        moveTypes[self.inClearance & (self.boards == players).any(axis=(1, 2))] = CLEAR
+        moveTypes[self.finished] = NONE
+
+        # Coordinates follow the final move type, as clearance overrides placement
+        isPlace, isClear = moveTypes == PLACE, moveTypes == CLEAR
+        x1 = np.where(isPlace, xPlace, np.where(isClear, xOwn, xP1))
+        y1 = np.where(isPlace, yPlace, np.where(isClear, yOwn, yP1))
+        return moveTypes, x1, y1, xP2, yP2
+
+
+def checkRandomRollouts(nGames, rng, maxSteps=2000, size=5):
+    '''
+    Plays nGames random games with sampleRandomMoves for up to maxSteps steps.
+    Returns the env, in which every game should have finished, as random
+    moves always end a game before long.
+    '''
+    env = BatchEnv(nGames, size)
+    for _ in range(maxSteps):
+        if (env.finished.all()):
+            break
+        env.step(*env.sampleRandomMoves(rng))
+    return env
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Checks that random batched games all finish")
+    parser.add_argument("--games", type=int, default=2000, help="Number of games (default: 2000)")
+    parser.add_argument("--max-steps", type=int, default=2000,
+        help="Steps after which an unfinished game is reported as stuck (default: 2000)")
+    parser.add_argument("--size", type=int, default=5, help="Width of the square board (default: 5)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    return parser.parse_args()
+
+
+def main():
+    '''
+    Main function
+    '''
+    args = parseArgs()
+    startTime = time.perf_counter()
+    env = checkRandomRollouts(args.games, np.random.default_rng(args.seed), args.max_steps, args.size)
+    elapsed = time.perf_counter() - startTime
+
+    winners = env.getWinners()
+    print("{} games in {:.2f} s: red {}, blue {}, longest {} plies".format(
+        args.games, elapsed, (winners == 1).sum(), (winners == -1).sum(), env.plies.max()))
+    stuck = np.flatnonzero(~env.finished)
+    if (len(stuck)):
+        print("{} games unfinished after {} steps, {} of them in clearance, e.g. game {}".format(
+            len(stuck), args.max_steps, env.inClearance[stuck].sum(), stuck[0]))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
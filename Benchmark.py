@@ -0,0 +1,344 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from itertools import cycle
+
+# Render offscreen unless a display is chosen
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+import pygame.locals
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from Board import Board
+from DisplayInfo import DisplayInfo
+from Game import Game
+from Players import RandomPlayer
+from Renderer import Renderer
+from Rules import Rules
+from SelfPlay import playGame
+
+
+# Results file format version, stored with the results
+VERSION = 1
+
+# Default minimum time of one timed repeat, in seconds
+MIN_REPEAT_TIME = 0.2
+
+
+class Benchmark:
+    '''
+    A named operation to time.
+    setup is called once and returns a function which performs the operation
+    and returns the number of operations it performed.
+    '''
+    def __init__(self, name, setup, unit="op"):
+        self.name = name
+        self.setup = setup
+        self.unit = unit
+
+
+    def run(self, repeats=5, minRepeatTime=MIN_REPEAT_TIME):
+        '''
+        Returns timing statistics over repeats, each calling the operation
+        enough times to take at least minRepeatTime seconds
+        '''
+        function = self.setup()
+
+        # Calibrate the number of calls per repeat
+        nCalls = 1
+        while True:
+            elapsed, _ = self._time(function, nCalls)
+            if (elapsed >= minRepeatTime):
+                break
+            nCalls = max(nCalls + 1, int(nCalls * 1.2 * minRepeatTime/max(elapsed, 1e-9)))
+
+        times = []
+        for _ in range(repeats):
+            elapsed, nOps = self._time(function, nCalls)
+            times.append(elapsed/nOps)
+        return {
+            "unit": self.unit,
+            "median": statistics.median(times),
+            "min": min(times),
+            "stdev": statistics.stdev(times) if len(times) > 1 else 0.,
+            "repeats": repeats,
+            "calls": nCalls,
+        }
+
+
+    def _time(self, function, nCalls):
+        nOps = 0
+        startTime = time.perf_counter()
+        for _ in range(nCalls):
+            nOps += function()
+        return time.perf_counter() - startTime, nOps
+
+
+### Position setup
+
+def _getPlayedRules(nMoves, seed=0, size=5):
+    '''
+    Returns the rules after nMoves random moves without shifts, from a fixed seed
+    '''
+    rng = random.Random(seed)
+    rules = Rules(Board(pygame.Surface((720, 720)), size))
+    for _ in range(nMoves):
+        moves = rules.getLegalMoves(includeShifts=False)
+        if (rules.isFinished or not moves):
+            break
+        rules.makeMove(rng.choice(moves))
+    return rules
+
+
+def _getScriptedClicks(board, seed=0):
+    '''
+    Returns the pixel positions clicked in a random game without shifts,
+    from a fixed seed, ending when the game is won
+    '''
+    rng = random.Random(seed)
+    rules = Rules(board)
+    clicks = []
+    while (not rules.isFinished):
+        moves = rules.getLegalMoves(includeShifts=False)
+        if (not moves):
+            break
+        move = rng.choice(moves)
+        rules.makeMove(move)
+        clicks.append(board.grid.getBoxCentre(move.coor))
+        if (move.mType == "REMOVE"):
+            clicks.append(board.grid.getBoxCentre(move.coor2))
+    board.reset()
+    return clicks
+
+
+### Board benchmarks
+
+def _setupGetSpace():
+    board = _getPlayedRules(12).board
+    coors = [(x, y) for x in range(board.size) for y in range(board.size)]
+    def run():
+        for coor in coors:
+            board._getSpace(coor)
+        return len(coors)
+    return run
+
+
+def _setupBoardQuery(name):
+    def setup():
+        query = getattr(_getPlayedRules(12).board, name)
+        def run():
+            query()
+            return 1
+        return run
+    return setup
+
+
+def _setupShift(direction, opposite):
+    def setup():
+        board = _getPlayedRules(0).board
+        board.setP1((2, 2))
+        board.setP2((2, 3))
+        shift, unshift = getattr(board, "shift" + direction), getattr(board, "shift" + opposite)
+        def run():
+            # Shifting back keeps the beads away from the edges
+            shift()
+            unshift()
+            return 2
+        return run
+    return setup
+
+
+### Game benchmarks
+
+def _setupClicks():
+    '''
+    Clicks through a whole game, with removals, via the pygame front end
+    '''
+    surface = pygame.Surface((720, 720))
+    board = Board(surface)
+    game = Game(DisplayInfo(), board)
+    clicks = _getScriptedClicks(board)
+    def run():
+        game.reset()
+        for pos in clicks:
+            game.processClickOnBoard(pos)
+        assert(game.isFinished)
+        return len(clicks)
+    return run
+
+
+def _setupSimulation():
+    '''
+    Plays whole games between random players, cycling through a fixed set of seeds
+    '''
+    seeds = cycle(range(0, 200, 2))
+    def run():
+        seed = next(seeds)
+        players = {1: RandomPlayer(seed), -1: RandomPlayer(seed + 1)}
+        playGame(Rules(), players)
+        return 1
+    return run
+
+
+### Drawing benchmarks
+
+def _setupRenderer():
+    surface = pygame.display.set_mode((720, 720))
+    display = DisplayInfo()
+    board = Board(surface)
+    game = Game(display, board)
+    return game, Renderer(surface, display, board)
+
+
+def _setupFullFrame():
+    game, renderer = _setupRenderer()
+    for pos in _getScriptedClicks(game.board)[:12]:
+        game.processClickOnBoard(pos)
+    def run():
+        renderer.invalidate()
+        renderer.draw()
+        return 1
+    return run
+
+
+def _setupMoveFrame():
+    '''
+    Draws the frame after each move of a game, reusing unchanged parts
+    '''
+    game, renderer = _setupRenderer()
+    clicks = _getScriptedClicks(game.board)
+    def run():
+        game.reset()
+        renderer.draw()
+        for pos in clicks:
+            game.processClickOnBoard(pos)
+            renderer.draw()
+        return len(clicks)
+    return run
+
+
+def _setupIdleFrame():
+    game, renderer = _setupRenderer()
+    renderer.draw()
+    def run():
+        renderer.draw()
+        return 1
+    return run
+
+
+BENCHMARKS = [
+    Benchmark("board.getSpace", _setupGetSpace),
+    Benchmark("board.isVictory", _setupBoardQuery("isVictory")),
+    Benchmark("board.isFull", _setupBoardQuery("isFull")),
+    Benchmark("board.countP1Beads", _setupBoardQuery("countP1Beads")),
+    Benchmark("board.shiftUp", _setupShift("Up", "Down"), "shift"),
+    Benchmark("board.shiftLeft", _setupShift("Left", "Right"), "shift"),
+    Benchmark("game.processClickOnBoard", _setupClicks, "click"),
+    Benchmark("game.simulation", _setupSimulation, "game"),
+    Benchmark("draw.fullFrame", _setupFullFrame, "frame"),
+    Benchmark("draw.moveFrame", _setupMoveFrame, "frame"),
+    Benchmark("draw.idleFrame", _setupIdleFrame, "frame"),
+]
+
+
+### Results
+
+def getMachineInfo():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compareResults(results, baseline, threshold):
+    '''
+    Returns (name, baseline median, current median, ratio, regressed) for each
+    benchmark in both, where regressed means slower by more than threshold
+    '''
+    comparisons = []
+    for name, result in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if (base is None):
+            continue
+        ratio = result["median"]/base["median"]
+        comparisons.append((name, base["median"], result["median"], ratio, ratio > 1 + threshold))
+    return comparisons
+
+
+def formatTime(seconds):
+    for unit, scale in [("s", 1.), ("ms", 1e-3), ("us", 1e-6)]:
+        if (seconds >= scale):
+            return "{:.2f} {}".format(seconds/scale, unit)
+    return "{:.0f} ns".format(seconds/1e-9)
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Times board operations, game logic, simulation and drawing")
+    parser.add_argument("--output", help="File to write the results to as JSON")
+    parser.add_argument("--baseline", help="Results file from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+        help="Slowdown relative to the baseline reported as a regression (default: 0.1, i.e. 10%%)")
+    parser.add_argument("--filter", default="",
+        help="Only run benchmarks whose names contain this string")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed repeats per benchmark (default: 5)")
+    parser.add_argument("--min-time", type=float, default=MIN_REPEAT_TIME,
+        help="Minimum seconds per repeat (default: {})".format(MIN_REPEAT_TIME))
+    return parser.parse_args()
+
+
+def main():
+    '''
+    Main function
+    '''
+    args = parseArgs()
+    # Logging every move would dominate the timings of the game
+    logging.getLogger().setLevel(logging.WARNING)
+    pygame.init()
+
+    results = {"version": VERSION, "machine": getMachineInfo(), "benchmarks": {}}
+    for benchmark in BENCHMARKS:
+        if (args.filter not in benchmark.name):
+            continue
+        result = benchmark.run(args.repeats, args.min_time)
+        results["benchmarks"][benchmark.name] = result
+        print("{:<28} {:>10} per {:<6} (min {}, stdev {})".format(
+            benchmark.name, formatTime(result["median"]), result["unit"],
+            formatTime(result["min"]), formatTime(result["stdev"])))
+
+    if (args.output):
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if (args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline["machine"] != results["machine"]):
+            print("Warning: the baseline was recorded on a different machine or software versions")
+
+        print()
+        regressions = 0
+        for name, base, current, ratio, regressed in compareResults(results, baseline, args.threshold):
+            regressions += regressed
+            print("{:<28} {:>10} -> {:>10} {:>7.1%} {}".format(
+                name, formatTime(base), formatTime(current), ratio - 1, "REGRESSION" if regressed else ""))
+        if (regressions):
+            print("{} benchmark(s) slower than the baseline by more than {:.0%}".format(
+                regressions, args.threshold))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
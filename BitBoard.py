@@ -0,0 +1,528 @@
+import random
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+
+# Modulus of the board hash, a Mersenne prime
+HASH_MODULUS = (1 << 61) - 1
+
+
+if hasattr(int, "bit_count"):
+    # Python 3.10+, avoids building a string per call on large boards
+    popcount = int.bit_count
+else:
+    def popcount(mask):
+        '''
+        Returns the number of set bits in a mask
+        '''
+        return bin(mask).count("1")
+
+
+def iterBits(mask):
+    '''
+    Yields the index of each set bit in a mask, lowest first
+    '''
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def selectBit(mask, k):
+    '''
+    Returns the index of the k-th lowest set bit of a mask, counting from 0.
+    Bisects on the bit counts of the low bits, so takes a logarithmic
+    number of mask operations however many bits are set.
+    '''
+    assert(0 <= k < popcount(mask))
+    low, high = 0, mask.bit_length()
+    while (high - low > 1):
+        middle = (low + high) // 2
+        if (popcount(mask & ((1 << middle) - 1)) > k):
+            high = middle
+        else:
+            low = middle
+    return low
+
+
+def getRandomBit(mask, rng):
+    '''
+    Returns the index of a uniformly chosen set bit of a non-zero mask
+    '''
+    return selectBit(mask, rng.randrange(popcount(mask)))
+
+
+class _Masks:
+    '''
+    Precomputed masks for a given board size.
+    Shared between all boards of the same size.
+    '''
+    def __init__(self, size):
+        self.size = size
+        self.full = (1 << (size * size)) - 1
+
+        # Space (x, y) is stored at bit x*size + y
+        self.cols = [((1 << size) - 1) << (x * size) for x in range(size)]
+        firstRow = sum(1 << (x * size) for x in range(size))
+        self.rows = [firstRow << y for y in range(size)]
+
+        innerCol = ((1 << (size - 2)) - 1) << 1 if size > 2 else 0
+        self.interior = sum(innerCol << (x * size) for x in range(1, size - 1))
+
+        # Per-space forms, indexed like the masks. Kept as lists of indices
+        # rather than per-space masks so memory grows linearly with the spaces.
+        self.isInterior = [
+            0 < x < size - 1 and 0 < y < size - 1 for x in range(size) for y in range(size)]
+
+        # Neighbours of every space, including those on the border, lowest first
+        self.adjacentIndices = [
+            sorted(xAdj * size + yAdj
+                for xAdj, yAdj in [(x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)]
+                if -1 < xAdj < size and -1 < yAdj < size)
+            for x in range(size) for y in range(size)]
+
+        # Spaces on each edge, as vacated by a shift in each direction
+        self.vacatedByShift = {
+            "UP": [x * size + size - 1 for x in range(size)],
+            "DOWN": [x * size for x in range(size)],
+            "LEFT": [(size - 1) * size + y for y in range(size)],
+            "RIGHT": list(range(size)),
+        }
+
+        # Hash keys for each player's bead on each space.
+        # The board hash is the sum of the keys of its beads modulo HASH_MODULUS,
+        # with the key of space i being a player constant times base**i. A shift
+        # by d indices then multiplies the hash by base**d, so is constant time.
+        # Seeded by size so hashes agree between processes.
+        rng = random.Random(size)
+        base = rng.randrange(2, HASH_MODULUS - 1)
+        constP1 = rng.randrange(1, HASH_MODULUS)
+        constP2 = rng.randrange(1, HASH_MODULUS)
+        self.hashKeysP1 = [0] * (size * size)
+        self.hashKeysP2 = [0] * (size * size)
+        power = 1
+        for i in range(size * size):
+            self.hashKeysP1[i] = constP1 * power % HASH_MODULUS
+            self.hashKeysP2[i] = constP2 * power % HASH_MODULUS
+            power = power * base % HASH_MODULUS
+
+        self.hashShiftFactors = {
+            "UP": pow(base, HASH_MODULUS - 2, HASH_MODULUS),
+            "DOWN": base,
+            "LEFT": pow(base, (HASH_MODULUS - 2) * size, HASH_MODULUS),
+            "RIGHT": pow(base, size, HASH_MODULUS),
+        }
+
+
+_masksBySize = {}
+
+
+def getMasks(size):
+    '''
+    Returns the (cached) masks for a board size
+    '''
+    masks = _masksBySize.get(size)
+    if masks is None:
+        masks = _Masks(size)
+        _masksBySize[size] = masks
+    return masks
+
+
+class BitBoard:
+    '''
+    Stores the position as two integer bitmasks, one per player.
+    Provides the board state interface used by the game logic.
+
+    Alongside the masks, the board keeps incrementally updated:
+        hash    - hash of the position (see _Masks)
+        cells   - value of each space (1, -1 or 0), indexed x*size + y
+        sums    - sum of the values of each space's neighbours
+        nP1/nP2 - number of beads of each player
+        victory - indices of beads surrounded by the other player
+    so that reads, surround tests, counts and victory checks are constant time.
+    '''
+    def __init__(self, size=5):
+        self.size = size
+        self.masks = getMasks(size)
+        BitBoard.reset(self)
+
+
+    def reset(self):
+        '''
+        Removes all beads from the board
+        '''
+        nSpaces = self.size * self.size
+        self.p1 = 0
+        self.p2 = 0
+        self.hash = 0
+        self.cells = [0] * nSpaces
+        self.sums = [0] * nSpaces
+        self.nP1 = 0
+        self.nP2 = 0
+        self.victory = set()
+
+
+    def copy(self):
+        '''
+        Returns an independent board with the same position
+        '''
+        board = BitBoard.__new__(BitBoard)
+        board.size = self.size
+        board.masks = self.masks
+        board.setState(self.getState())
+        return board
+
+
+    def __getstate__(self):
+        # Masks are shared between boards, so are not pickled
+        state = self.__dict__.copy()
+        del state["masks"]
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.masks = getMasks(self.size)
+
+
+    def getState(self):
+        '''
+        Returns a snapshot of the position which can be restored with setState
+        '''
+        return (
+            self.p1, self.p2, self.hash, self.cells[:], self.sums[:],
+            self.nP1, self.nP2, set(self.victory) )
+
+
+    def setState(self, state):
+        p1, p2, self.hash, cells, sums, self.nP1, self.nP2, victory = state
+        self.p1, self.p2 = p1, p2
+        self.cells, self.sums, self.victory = cells[:], sums[:], set(victory)
+
+
+    def _computeHash(self):
+        '''
+        Computes the hash of the position from scratch
+        '''
+        keysP1, keysP2 = self.masks.hashKeysP1, self.masks.hashKeysP2
+        h = sum(keysP1[i] for i in iterBits(self.p1))
+        h += sum(keysP2[i] for i in iterBits(self.p2))
+        return h % HASH_MODULUS
+
+
+    @property
+    def array(self):
+        '''
+        List-of-lists view of the board, indexed [x][y]
+        '''
+        size = self.size
+        return [self.cells[x * size:(x + 1) * size] for x in range(size)]
+
+
+    ### Space-related Functions
+
+    def _getIndex(self, coor):
+        '''
+        Helper function for converting a coordinate to its bit index
+        '''
+        xCoor, yCoor = coor
+        assert(-1 < xCoor < self.size and -1 < yCoor < self.size)
+        return xCoor * self.size + yCoor
+
+
+    def _getBit(self, coor):
+        '''
+        Helper function for converting a coordinate to its bit
+        '''
+        return 1 << self._getIndex(coor)
+
+
+    def _getSpace(self, coor):
+        '''
+        Helper function for accessing the space at a specific coordinate
+        '''
+        return self.cells[self._getIndex(coor)]
+
+
+    def _setSpace(self, coor, val):
+        '''
+        Helper function for accessing the space at a specific coordinate
+        '''
+        self._setIndex(self._getIndex(coor), val)
+
+
+    def _setIndex(self, i, val):
+        '''
+        Sets space i to val, updating the masks, hash, counts, neighbour sums
+        and victory set
+        '''
+        cells = self.cells
+        old = cells[i]
+        if (old == val):
+            return
+
+        masks = self.masks
+        bit = 1 << i
+        if (old > 0):
+            self.p1 ^= bit
+            self.hash = (self.hash - masks.hashKeysP1[i]) % HASH_MODULUS
+            self.nP1 -= 1
+        elif (old < 0):
+            self.p2 ^= bit
+            self.hash = (self.hash - masks.hashKeysP2[i]) % HASH_MODULUS
+            self.nP2 -= 1
+        if (val > 0):
+            self.p1 |= bit
+            self.hash = (self.hash + masks.hashKeysP1[i]) % HASH_MODULUS
+            self.nP1 += 1
+        elif (val < 0):
+            self.p2 |= bit
+            self.hash = (self.hash + masks.hashKeysP2[i]) % HASH_MODULUS
+            self.nP2 += 1
+        cells[i] = val
+
+        # A surround can only be made or broken at this space and its neighbours
+        sums, victory, isInterior = self.sums, self.victory, masks.isInterior
+        delta = val - old
+        for j in masks.adjacentIndices[i]:
+            sums[j] += delta
+            if (cells[j] and isInterior[j] and sums[j] == -4 * cells[j]):
+                victory.add(j)
+            else:
+                victory.discard(j)
+        if (val and isInterior[i] and sums[i] == -4 * val):
+            victory.add(i)
+        else:
+            victory.discard(i)
+
+
+    def isSpaceEmpty(self, coor):
+        return self.cells[self._getIndex(coor)] == 0
+
+
+    def setMasks(self, p1, p2):
+        '''
+        Sets the position to two bitmasks, rebuilding the incremental fields.
+        Takes time in proportion to the number of beads.
+        '''
+        BitBoard.reset(self)
+        for i in iterBits(p1):
+            self._setIndex(i, 1)
+        for i in iterBits(p2):
+            self._setIndex(i, -1)
+
+
+    def setEmpty(self, coor):
+        self._setIndex(self._getIndex(coor), 0)
+
+
+    def setP1(self, coor):
+        self._setIndex(self._getIndex(coor), 1)
+
+
+    def setP2(self, coor):
+        self._setIndex(self._getIndex(coor), -1)
+
+
+    def isP1(self, coor):
+        return self.cells[self._getIndex(coor)] == 1
+
+
+    def isP2(self, coor):
+        return self.cells[self._getIndex(coor)] == -1
+
+
+    def areP1AndP2(self, coor1, coor2):
+        '''
+        Returns whether two spaces are controled by different players
+        '''
+        return (self.cells[self._getIndex(coor1)] * self.cells[self._getIndex(coor2)]) < 0
+
+
+    def iterCoors(self, mask):
+        '''
+        Yields the coordinate of each space set in a mask
+        '''
+        for i in iterBits(mask):
+            yield divmod(i, self.size)
+
+
+    def iterP1Coors(self):
+        '''
+        Yields the coordinate of each player 1 bead
+        '''
+        return self.iterCoors(self.p1)
+
+
+    def iterP2Coors(self):
+        '''
+        Yields the coordinate of each player 2 bead
+        '''
+        return self.iterCoors(self.p2)
+
+
+    ### Board-related Functions
+
+    def countP1Beads(self):
+        return self.nP1
+
+
+    def countP2Beads(self):
+        return self.nP2
+
+
+    def isFull(self):
+        '''
+        Returns whether the board has no empty spaces
+        '''
+        return self.nP1 + self.nP2 == len(self.cells)
+
+
+    def _isOnBorder(self, coor):
+        return ((0 in coor) or (self.size -1 in coor))
+
+
+    def _isSpaceSurrounded(self, coor, matches=[4, -4]):
+        # Border squares cannot be surrounded
+        i = self._getIndex(coor)
+        return self.masks.isInterior[i] and self.sums[i] in matches
+
+
+    def isSpaceSurrounded(self, coor):
+        return self._isSpaceSurrounded(coor, matches=[4, -4])
+
+
+    def isSpaceSurroundedByP1(self, coor):
+        return self._isSpaceSurrounded(coor, matches=[4])
+
+
+    def isSpaceSurroundedByP2(self, coor):
+        return self._isSpaceSurrounded(coor, matches=[-4])
+
+
+    def _isRowEmpty(self, rowNo):
+        return not ((self.p1 | self.p2) & self.masks.rows[rowNo])
+
+
+    def _isColEmpty(self, colNo):
+        return not ((self.p1 | self.p2) & self.masks.cols[colNo])
+
+
+    def canShiftUp(self):
+        return self._isRowEmpty(0)
+
+
+    def canShiftDown(self):
+        return self._isRowEmpty(self.size - 1)
+
+
+    def canShiftLeft(self):
+        return self._isColEmpty(0)
+
+
+    def canShiftRight(self):
+        return self._isColEmpty(self.size - 1)
+
+
+    # The edge being shifted towards is empty, so no bits wrap between
+    # columns or fall off the board during a shift
+
+    def _shift(self, direction, offset):
+        '''
+        Moves every bead offset indices along.
+        Neighbour sums move with the beads, except on the vacated edge.
+        '''
+        if (offset > 0):
+            self.cells = [0] * offset + self.cells[:-offset]
+            self.sums = [0] * offset + self.sums[:-offset]
+        else:
+            self.cells = self.cells[-offset:] + [0] * -offset
+            self.sums = self.sums[-offset:] + [0] * -offset
+        self.victory = {i + offset for i in self.victory}
+
+        cells, sums, adjacentIndices = self.cells, self.sums, self.masks.adjacentIndices
+        for i in self.masks.vacatedByShift[direction]:
+            sums[i] = sum(cells[j] for j in adjacentIndices[i])
+
+        self.hash = self.hash * self.masks.hashShiftFactors[direction] % HASH_MODULUS
+
+
+    def shiftUp(self):
+        assert(self.canShiftUp())
+        self.p1 >>= 1
+        self.p2 >>= 1
+        self._shift("UP", -1)
+
+
+    def shiftDown(self):
+        assert(self.canShiftDown())
+        self.p1 <<= 1
+        self.p2 <<= 1
+        self._shift("DOWN", 1)
+
+
+    def shiftLeft(self):
+        assert(self.canShiftLeft())
+        self.p1 >>= self.size
+        self.p2 >>= self.size
+        self._shift("LEFT", -self.size)
+
+
+    def shiftRight(self):
+        assert(self.canShiftRight())
+        self.p1 <<= self.size
+        self.p2 <<= self.size
+        self._shift("RIGHT", self.size)
+
+
+    def _getSurroundedBy(self, mask):
+        '''
+        Returns the mask of interior spaces with all four neighbours in mask
+        '''
+        n = self.size
+        return self.masks.interior & (mask >> 1) & (mask << 1) & (mask >> n) & (mask << n)
+
+
+    def getEmptyMask(self):
+        return self.masks.full & ~(self.p1 | self.p2)
+
+
+    def getSurroundedByP1Mask(self):
+        return self._getSurroundedBy(self.p1)
+
+
+    def getSurroundedByP2Mask(self):
+        return self._getSurroundedBy(self.p2)
+
+
+    def getCompletingMask(self, attacker, target):
+        '''
+        Returns the mask of empty spaces where an attacker bead would complete
+        the surround of a target bead
+        '''
+        n = self.size
+        empty = self.getEmptyMask()
+        candidates = target & self.masks.interior
+
+        # Bit t is set if the mask holds the neighbour of space t
+        left, right, up, down = attacker << n, attacker >> n, attacker << 1, attacker >> 1
+        return (
+            ((candidates & (empty << n) & right & up & down) >> n) |
+            ((candidates & (empty >> n) & left & up & down) << n) |
+            ((candidates & (empty << 1) & left & right & down) >> 1) |
+            ((candidates & (empty >> 1) & left & right & up) << 1) )
+
+
+    def getVictoryCoor(self):
+        '''
+        Returns the coordinate of a surrounded bead, or None
+        '''
+        if not self.victory:
+            return None
+        return divmod(min(self.victory), self.size)
+
+
+    def isVictory(self):
+        return bool(self.victory)
@@ -1,4 +1,3 @@
-import itertools
 import pygame
 
 # Setup logging
@@ -7,6 +6,7 @@ logger = logging.getLogger(__file__)
 
 # Local Imports
 import Colours as colour
+from BitBoard import BitBoard
 
 
 class Grid:
@@ -19,19 +19,40 @@ class Grid:
         self.dimensions = dimensions
         self.victoryCoor = None
 
+        # Translucent RGBA colours filling spaces, by coordinate
+        self.shades = {}
+
 
     def reset(self):
         self.victoryCoor = None
+        self.shades = {}
 
 
     def setVictoryCoor(self, coor):
         self.victoryCoor = coor
 
 
+    def setShades(self, shades):
+        self.shades = shades
+
+
     def draw(self, surface):
         '''
         Draw the game grid without side edges
         '''
+        for rect, shadeColour in self.getShadeRects():
+            shade = pygame.Surface(rect.size, pygame.SRCALPHA)
+            shade.fill(shadeColour)
+            surface.blit(shade, rect)
+        self.drawLines(surface)
+        for rect in self.getVictoryRects():
+            pygame.draw.rect(surface, colour.BLACK, rect)
+
+
+    def drawLines(self, surface):
+        '''
+        Draw the grid lines, which never change
+        '''
         xOrig, yOrig = self.origin # Coordinate of upper left corner of grid
         xDim, yDim = self.dimensions # Dimensions of grid
 
@@ -46,18 +67,49 @@ class Grid:
                 (xOrig       , yOrig + i*yDim/float(self.nSpaces)),
                 (xOrig + xDim, yOrig + i*yDim/float(self.nSpaces)))
 
-        if self.victoryCoor:
-            x, y = self.getBoxCentre(self.victoryCoor)
-            vert = pygame.locals.Rect(
-                x - 10, y - 1.5*yDim/float(self.nSpaces),
-                20, 3*yDim/float(self.nSpaces)
-                )
-            horiz = pygame.locals.Rect(
-                x - 1.5*xDim/float(self.nSpaces), y - 10,
-                3*xDim/float(self.nSpaces), 20
-                )
-            pygame.draw.rect(surface, colour.BLACK, vert)
-            pygame.draw.rect(surface, colour.BLACK, horiz)
+
+    def getVictoryRects(self):
+        '''
+        Returns the rectangles of the cross marking the surrounded bead
+        '''
+        if not self.victoryCoor:
+            return []
+        xDim, yDim = self.dimensions
+        x, y = self.getBoxCentre(self.victoryCoor)
+        # 20 pixels thick on the standard board, thinner on larger boards
+        thickness = max(2, 2*int(50/float(self.nSpaces)))
+        vert = pygame.locals.Rect(
+            x - thickness/2, y - 1.5*yDim/float(self.nSpaces),
+            thickness, 3*yDim/float(self.nSpaces)
+            )
+        horiz = pygame.locals.Rect(
+            x - 1.5*xDim/float(self.nSpaces), y - thickness/2,
+            3*xDim/float(self.nSpaces), thickness
+            )
+        return [vert, horiz]
+
+
+    def getShadeRects(self):
+        '''
+        Returns (rect, colour) for each shaded space, inside the grid lines
+        '''
+        shades = []
+        for coor, shadeColour in sorted(self.shades.items()):
+            rect = self.getBoxRect(coor)
+            shades.append((pygame.locals.Rect(rect.left + 1, rect.top + 1, rect.width - 1, rect.height - 1), shadeColour))
+        return shades
+
+
+    def getBoxRect(self, coor):
+        '''
+        Returns the rectangle of a grid box, from one grid line to the next
+        '''
+        x, y = coor
+        xOrig, yOrig = self.origin
+        xDim, yDim = self.dimensions
+        left, top = int(xOrig + x*xDim/float(self.nSpaces)), int(yOrig + y*yDim/float(self.nSpaces))
+        right, bottom = int(xOrig + (x + 1)*xDim/float(self.nSpaces)), int(yOrig + (y + 1)*yDim/float(self.nSpaces))
+        return pygame.locals.Rect(left, top, right - left, bottom - top)
 
 
     def getBoxCentre(self, coor):
@@ -98,14 +150,12 @@ class Grid:
             return xCoor, yCoor
 
 
-class Board:
+class Board(BitBoard):
     '''
     Manages and draws the game board and pieces
     '''
-    def __init__(self, surface):
-        self.size = 5
-
-        self.array = [[0 for _ in range(self.size)] for _ in range(self.size)]
+    def __init__(self, surface, size=5):
+        BitBoard.__init__(self, size)
 
         # Define grid size to be 5/7ths of the width of the window
         xMax, yMax = surface.get_size()
@@ -115,7 +165,8 @@ class Board:
             (5*xMax/float(7), 5*yMax/float(7)),
         )
 
-        self.beadRadius = int(xMax/float(20))
+        # A third of the width of a space
+        self.beadRadius = max(1, int(5*xMax/float(20*self.size)))
 
         # Used to highlight beads during removal
         self.highlight = None
@@ -126,8 +177,7 @@ class Board:
         Resets the board, removing all beads and highlights
         '''
         self.grid.reset()
-        for x, y in itertools.product(range(self.size), range(self.size)):
-            self.setEmpty((x,y))
+        BitBoard.reset(self)
         self.highlight = None
 
 
@@ -136,13 +186,18 @@ class Board:
         self.grid.draw(surface)
 
         # Draw beads
-        for x, y in itertools.product(range(self.size), range(self.size)):
-            coor = (x,y)
-            width = 1 if self.highlight == coor else 0
-            if self._getSpace(coor) > 0:
-                pygame.draw.circle(surface, colour.RED, self.grid.getBoxCentre(coor), self.beadRadius, width)
-            elif self._getSpace(coor) < 0:
-                pygame.draw.circle(surface, colour.BLUE, self.grid.getBoxCentre(coor), self.beadRadius, width)
+        for beadColour, centre, width in self.iterBeads():
+            pygame.draw.circle(surface, beadColour, centre, self.beadRadius, width)
+
+
+    def iterBeads(self):
+        '''
+        Yields the colour, pixel centre and outline width (0 for filled) of each bead
+        '''
+        for beadColour, coors in [(colour.RED, self.iterP1Coors()), (colour.BLUE, self.iterP2Coors())]:
+            for coor in coors:
+                width = 1 if self.highlight == coor else 0
+                yield beadColour, self.grid.getBoxCentre(coor), width
 
 
     ### Position Detection Functions
@@ -173,62 +228,7 @@ class Board:
             centre = self.grid.getBoxCentre(coor)
             return ((centre[0] - pos[0])**2) + ((centre[1] - pos[1])**2) < self.beadRadius**2
 
-    ### Space-related Functions
-
-    def _getSpace(self, coor):
-        '''
-        Helper function for accessing the space at a specific coordinate
-        '''
-        xCoor, yCoor = coor
-        assert(xCoor > -1)
-        assert(xCoor < self.size)
-        assert(yCoor > -1)
-        assert(yCoor < self.size)
-        return self.array[xCoor][yCoor]
-
-
-    def _setSpace(self, coor, val):
-        '''
-        Helper function for accessing the space at a specific coordinate
-        '''
-        xCoor, yCoor = coor
-        assert(xCoor > -1)
-        assert(xCoor < self.size)
-        assert(yCoor > -1)
-        assert(yCoor < self.size)
-        self.array[xCoor][yCoor] = val
-
-
-    def isSpaceEmpty(self, coor):
-        return (self._getSpace(coor) == 0)
-
-
-    def setEmpty(self, coor):
-        self._setSpace(coor, 0)
-
-
-    def setP1(self, coor):
-        self._setSpace(coor, 1)
-
-
-    def setP2(self, coor):
-        self._setSpace(coor, -1)
-
-
-    def isP1(self, coor):
-        return (self._getSpace(coor) == 1)
-
-
-    def isP2(self, coor):
-        return (self._getSpace(coor) == -1)
-
-
-    def areP1AndP2(self, coor1, coor2):
-        '''
-        Returns whether two spaces are controled by different players
-        '''
-        return ((self._getSpace(coor1) * self._getSpace(coor2)) < 0)
-
+    ### Highlight Functions
 
     def setHighlight(self, coor):
         self.highlight = coor
@@ -239,129 +239,9 @@ class Board:
 
     ### Board-related Functions
 
-    def countP1Beads(self):
-        return sum([i.count(1) for i in self.array])
-
-
-    def countP2Beads(self):
-        return sum([i.count(-1) for i in self.array])
-
-
-    def isFull(self):
-        '''
-        Returns whether the board has no empty spaces
-        '''
-        if sum([i.count(0) for i in self.array]) == 0:
-            return True
-        else:
-            return False
-
-
-    def _isOnBorder(self, coor):
-        return ((0 in coor) or (self.size -1 in coor))
-
-
-    def _isSpaceSurrounded(self, coor, matches=[4, -4]):
-        if (self._isOnBorder(coor)):
-            # Border squares cannot be surrounded
-            return False
-        else:
-            permuts = [
-                (coor[0], coor[1]+1),
-                (coor[0], coor[1]-1),
-                (coor[0]+1, coor[1]),
-                (coor[0]-1, coor[1]) ]
-            count = sum(self._getSpace(perm) for perm in permuts)
-            if count in matches:
-                return True
-            else:
-                return False
-
-
-    def isSpaceSurrounded(self, coor):
-        return self._isSpaceSurrounded(coor, matches=[4, -4])
-
-
-    def isSpaceSurroundedByP1(self, coor):
-        return self._isSpaceSurrounded(coor, matches=[4])
-
-
-    def isSpaceSurroundedByP2(self, coor):
-        return self._isSpaceSurrounded(coor, matches=[-4])
-
-
-    def _isRowEmpty(self, rowNo):
-        for x in range(self.size):
-            if (not self._getSpace((x, rowNo)) == 0):
-                return False
-        return True
-
-
-    def _isColEmpty(self, colNo):
-        for y in range(self.size):
-            if (not self._getSpace((colNo, y)) == 0):
-                return False
-        return True
-
-
-    def canShiftUp(self):
-        return self._isRowEmpty(0)
-
-
-    def canShiftDown(self):
-        return self._isRowEmpty(self.size - 1)
-
-
-    def canShiftLeft(self):
-        return self._isColEmpty(0)
-
-
-    def canShiftRight(self):
-        return self._isColEmpty(self.size - 1)
-
-
-    def shiftUp(self):
-        assert(self.canShiftUp())
-        for y in range(1, self.size):
-            for x in range(self.size):
-                self._setSpace((x,y - 1), self._getSpace((x,y)))
-                if (y == self.size - 1):
-                    self.setEmpty((x, y))
-
-
-    def shiftDown(self):
-        assert(self.canShiftDown())
-        for y in range(self.size - 1, 0, -1):
-            for x in range(self.size):
-                self._setSpace((x,y), self._getSpace((x, y - 1)))
-                if (y == 1):
-                    self.setEmpty((x, y - 1))
-
-
-    def shiftLeft(self):
-        assert(self.canShiftLeft())
-        for x in range(1, self.size):
-            for y in range(self.size):
-                self._setSpace((x - 1, y), self._getSpace((x,y)))
-                if (x == self.size - 1):
-                    self.setEmpty((x, y))
-
-
-    def shiftRight(self):
-        assert(self.canShiftRight())
-        for x in range(self.size - 1, 0, -1):
-            for y in range(self.size):
-                self._setSpace((x,y), self._getSpace((x - 1, y)))
-                if (x == 1):
-                    self.setEmpty((x - 1, y))
-
-
     def isVictory(self):
-        for x, y in itertools.product(range(1, self.size-1), range(1, self.size-1)):
-            coor = (x,y)
-            if self.isSpaceSurrounded(coor):
-                # Check if centre and outside have different coloured beads
-                if self.areP1AndP2(coor, (x, y+1)):
-                    self.grid.setVictoryCoor(coor)
-                    return True
+        coor = self.getVictoryCoor()
+        if coor:
+            self.grid.setVictoryCoor(coor)
+            return True
         return False
@@ -0,0 +1,187 @@
+import argparse
+import asyncio
+import json
+import time
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from BitBoard import BitBoard
+from Moves import Move
+from Players import RandomPlayer
+from Rules import Rules
+from Server import GameServer
+
+
+class ProtocolError(Exception):
+    '''
+    Raised when the server sends an unexpected message
+    '''
+    pass
+
+
+class GameClient:
+    '''
+    Plays on a GameServer over TCP.
+    Keeps a replica of the match's rules, updated from the server's updates,
+    which is checked against the server's board after every move.
+    '''
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.rules = None
+        self.colour = None
+
+
+    async def connect(self, host="127.0.0.1", port=8765):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+    async def send(self, message):
+        self.writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+        await self.writer.drain()
+
+
+    async def receive(self):
+        '''
+        Returns the next message, or None if the server closed the connection
+        '''
+        line = await self.reader.readline()
+        return json.loads(line) if line else None
+
+
+    async def join(self):
+        '''
+        Waits to be paired and returns the start message
+        '''
+        await self.send({"type": "join"})
+        message = await self.receive()
+        if (message is not None and message["type"] == "waiting"):
+            message = await self.receive()
+        if (message is None or message["type"] != "start"):
+            raise ProtocolError("Expected start, got {}".format(message))
+        self.colour = message["colour"]
+        self.rules = Rules(BitBoard(message["size"]), message["startingBeads"], message["clearanceRemovals"])
+        return message
+
+
+    def isMyTurn(self):
+        return (1 if self.rules.p1Turn else -1) == self.colour
+
+
+    async def sendMove(self, move):
+        await self.send({"type": "move", "move": move.toNotation()})
+
+
+    async def receiveUpdate(self):
+        '''
+        Waits for the next update, applies it to the replica and returns it.
+        Returns the message instead for errors and the end of a match.
+        '''
+        message = await self.receive()
+        if (message is None or message["type"] != "update"):
+            return message
+        self.rules.makeMove(Move.fromNotation(message["move"]))
+        self.rules.undoStack.clear()
+        board = self.rules.board
+        if ((board.p1, board.p2, self.rules.isFinished) != (message["p1"], message["p2"], message["finished"])):
+            raise ProtocolError("Replica out of step with the server after {}".format(message["move"]))
+        return message
+
+
+async def playMatch(client, player, maxPlies=400):
+    '''
+    Joins a match and plays it with a computer player.
+    Returns the winner, or None if the match ended without one.
+    The protocol has no resignation, so if the player has no legal move
+    the match is abandoned, and ends for the opponent when the connection
+    is closed.
+    '''
+    await client.join()
+    player.newGame()
+    for _ in range(maxPlies):
+        if (client.isMyTurn()):
+            move = player.chooseMove(client.rules)
+            if (move is None):
+                logging.warning("No legal move in match, abandoning it")
+                return None
+            await client.sendMove(move)
+        message = await client.receiveUpdate()
+        if (message is None or message["type"] == "end"):
+            return None
+        if (message["type"] == "error"):
+            raise ProtocolError(message["message"])
+        if (message["finished"]):
+            return message["winner"]
+    return None
+
+
+async def runLoadTest(host, port, nMatches, seed=0):
+    '''
+    Plays nMatches concurrent matches between pairs of random players,
+    each with its own connection. Returns the number finished.
+    '''
+    async def runClient(i):
+        client = GameClient()
+        await client.connect(host, port)
+        try:
+            return await playMatch(client, RandomPlayer(seed + i))
+        finally:
+            await client.close()
+
+    # Joining in order pairs consecutive clients
+    tasks = []
+    for i in range(2 * nMatches):
+        tasks.append(asyncio.create_task(runClient(i)))
+        await asyncio.sleep(0)
+    winners = await asyncio.gather(*tasks)
+    return sum(winner is not None for winner in winners) // 2
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Plays random matches on a game server, as a load test")
+    parser.add_argument("--host", default="127.0.0.1", help="Server address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Server port (default: 8765)")
+    parser.add_argument("--matches", type=int, default=1000, help="Concurrent matches to play (default: 1000)")
+    parser.add_argument("--local", action="store_true",
+        help="Run a server in this process instead of connecting to one")
+    parser.add_argument("--seed", type=int, default=0, help="Base random seed (default: 0)")
+    return parser.parse_args()
+
+
+async def run(args):
+    server = None
+    if (args.local):
+        server = await GameServer().start(args.host, args.port)
+
+    startTime = time.perf_counter()
+    nFinished = await runLoadTest(args.host, args.port, args.matches, args.seed)
+    elapsed = time.perf_counter() - startTime
+    print("{} of {} matches finished in {:.1f} s ({:.0f} matches/s)".format(
+        nFinished, args.matches, elapsed, nFinished/elapsed))
+
+    if (server is not None):
+        server.close()
+        await server.wait_closed()
+
+
+def main():
+    '''
+    Main function
+    '''
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%H:%M:%S')
+    asyncio.run(run(parseArgs()))
+
+
+if __name__ == "__main__":
+    main()
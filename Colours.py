@@ -4,3 +4,4 @@ GREY = (128,128,128)
 BLACK = (0,0,0)
 RED = (255,0,0)
 BLUE = (0,0,255)
+GREEN = (0,255,0)
@@ -1,5 +1,4 @@
 import pygame
-pygame.font.init()
 
 # Setup logging
 import logging
@@ -7,19 +6,35 @@ logger = logging.getLogger(__file__)
 
 # Local Imports
 import Colours as colour
+from Fonts import findFont, getFont
+
+
+FONT_NAME = 'Comic Sans MS'
+FONT_SIZE = 30
 
 
 class DisplayInfo:
     def __init__(self):
-        self.font = pygame.font.SysFont('Comic Sans MS', 30)
+        self._font = None
 
-        self.beadsRemaining = {1: 17, -1:17}
+        # Set by the game
+        self.beadsRemaining = {1: 0, -1:0}
         self.scores = {1: 0, -1:0}
 
         self.topStr = None
         self.bottomStr = None
 
 
+    @property
+    def font(self):
+        '''
+        Font of the text, loaded when first used, so games which are never drawn do not load it
+        '''
+        if (self._font is None):
+            self._font = getFont(findFont(FONT_NAME), FONT_SIZE)
+        return self._font
+
+
     def setTopText(self, str):
         self.topStr = str
 
@@ -49,36 +64,45 @@ class DisplayInfo:
 
 
     def draw(self, surface):
-        xMax, yMax = surface.get_size()
+        for circleColour, centre, radius, width in self.iterCircles(surface):
+            pygame.draw.circle(surface, circleColour, centre, radius, width)
 
-        # Draw active player
-        topText = self.font.render(self.topStr, False, colour.BLACK)
-        topTextRect = topText.get_rect(center=(xMax/float(2), yMax/float(14)))
-        surface.blit(topText, topTextRect)
+        for string, centre in self.iterTexts(surface):
+            text = self.font.render(string, False, colour.BLACK)
+            surface.blit(text, text.get_rect(center=centre))
 
-        if self.bottomStr:
-            bottomText = self.font.render(self.bottomStr, False, colour.BLACK)
-            bottomTextRect = bottomText.get_rect(center=(xMax/float(2), 13*yMax/float(14)))
-            surface.blit(bottomText, bottomTextRect)
 
-        # Draw beads remaining
-        for i, nBeads in self.beadsRemaining.items():
+    def iterCircles(self, surface):
+        '''
+        Yields the colour, centre, radius and width of the circles behind the
+        bead counts and scores
+        '''
+        xMax, yMax = surface.get_size()
+        radius = int(xMax/float(24))
+        for i in self.beadsRemaining:
             textPos = (int(((6 - i*5)*xMax)/float(12)), int(yMax/float(14)))
+            yield colour.RED if i == 1 else colour.BLUE, textPos, radius, 0
+        for i in self.scores:
+            textPos = (int(((6 - i*5)*xMax)/float(12)), int(13*yMax/float(14)))
+            yield colour.RED if i == 1 else colour.BLUE, textPos, radius, 1
 
-            radius = int(xMax/float(24))
-            pygame.draw.circle(surface, colour.RED if i == 1 else colour.BLUE, textPos, radius)
 
-            textBeadsRemaining = self.font.render("{}".format(nBeads), False, colour.BLACK)
-            textBeadsRemainingRect = textBeadsRemaining.get_rect(center=textPos)
-            surface.blit(textBeadsRemaining, textBeadsRemainingRect)
+    def iterTexts(self, surface):
+        '''
+        Yields each string to be drawn with the position of its centre
+        '''
+        xMax, yMax = surface.get_size()
 
-        # Draw scores remaining
-        for i, score in self.scores.items():
-            textPos = (int(((6 - i*5)*xMax)/float(12)), int(13*yMax/float(14)))
+        # Active player
+        yield self.topStr, (xMax/float(2), yMax/float(14))
 
-            radius = int(xMax/float(24))
-            pygame.draw.circle(surface, colour.RED if i == 1 else colour.BLUE, textPos, radius, 1)
+        if self.bottomStr:
+            yield self.bottomStr, (xMax/float(2), 13*yMax/float(14))
+
+        # Beads remaining
+        for i, nBeads in self.beadsRemaining.items():
+            yield "{}".format(nBeads), (int(((6 - i*5)*xMax)/float(12)), int(yMax/float(14)))
 
-            textScore = self.font.render("{}".format(score), False, colour.BLACK)
-            textScoreRect = textScore.get_rect(center=textPos)
-            surface.blit(textScore, textScoreRect)
+        # Scores
+        for i, score in self.scores.items():
+            yield "{}".format(score), (int(((6 - i*5)*xMax)/float(12)), int(13*yMax/float(14)))
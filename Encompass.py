@@ -1,10 +1,13 @@
 import sys
+import argparse
+import time
+
+# Read before anything else is imported, for --startup-time
+STARTUP_TIME = time.perf_counter()
 
 # Setup pygame
 import pygame
 import pygame.locals
-pygame.init()
-pygame.font.init()
 
 # Setup logging
 import logging
@@ -14,75 +17,209 @@ import LoggerSettings
 # Local Imports
 from Input import Input
 from Actions import *
+from BackgroundWorker import BackgroundWorker
 from Game import Game
+from Players import createPlayer, PLAYER_TYPES
 from Board import Board
+from FrameProfiler import FrameProfiler, StartupTimer
 from DisplayInfo import DisplayInfo
-import Colours as colour
+from Renderer import Renderer
 
 
 class World:
     '''
     World class
-    Manages and runs the simulation
+    Manages and runs the simulation.
+
+    By default the window is redrawn 60 times a second. In event-driven mode
+    the loop sleeps until an input arrives, unless a computer player is
+    to move, and only redraws after something has changed.
+
+    Given a FrameProfiler, each phase of every frame is timed. F3 shows the
+    timings over the board and F4 profiles the next frames with cProfile.
+
+    Given a BackgroundWorker, computer players think in another process while
+    the window keeps drawing. The worker is closed when the window is.
+
+    Only the display is initialised, as pygame.init would also start the
+    audio and joystick subsystems, which are not used. The font is loaded
+    when the first frame is drawn (see Fonts.py).
     '''
-    def __init__(self, width, height):
+    def __init__(self, width, height, players=None, eventDriven=False,
+            size=5, startingBeads=None, clearanceRemovals=None, tablebase=None, profiler=None,
+            worker=None, analysisStore=None):
+        self.eventDriven = eventDriven
+        self.profiler = profiler
+        self.worker = worker
+        if (not pygame.display.get_init()):
+            pygame.display.init()
         self.surface = pygame.display.set_mode((width, height))
+        pygame.display.set_caption("Encompass")
 
         self.clock = pygame.time.Clock()
 
         self.input = Input()
+        if (self.eventDriven):
+            self.input.blockUnusedEvents()
 
         self.display = DisplayInfo()
-        self.board = Board(self.surface)
-        self.game = Game(self.display, self.board)
+        self.board = Board(self.surface, size)
+        self.game = Game(
+            self.display, self.board, players, startingBeads, clearanceRemovals, tablebase, worker,
+            analysisStore)
+        self.renderer = Renderer(self.surface, self.display, self.board)
 
 
     def _processAction(self, action):
         if action.getActionType() == "QUIT":
+            if (self.worker is not None):
+                self.worker.close()
             pygame.quit()
             sys.exit()
         elif action.getActionType() == "MOUSEBUTTONUP":
             self.game.processClick(action.getPos(), self.surface)
         elif action.getActionType() == "KEYUP":
-            self.game.processKey(action.getKey())
+            if (self.profiler is not None and self.profiler.processKey(action.getKey())):
+                # Clear the overlay if it was hidden
+                self.renderer.invalidate()
+            else:
+                self.game.processKey(action.getKey())
+        elif action.getActionType() == "REDRAW":
+            self.renderer.invalidate()
+        elif action.getActionType() == "RESULT":
+            self.game.processResult(action)
+
+
+    def draw(self):
+        self.renderer.draw()
+
 
+    def _drawProfiled(self, profiler):
+        dirty = self.renderer.render()
+        profiler.mark("draw")
+        if (profiler.showOverlay):
+            dirty.append(profiler.drawOverlay(self.surface))
+        self.renderer.present(dirty)
+        profiler.mark("present")
 
-    def run(self):
+
+    def run(self, startupTimer=None):
         '''
-        Runs the game
+        Runs the game. Given a StartupTimer, returns once the first frame is drawn.
         '''
+        profiler = self.profiler
+        needsRedraw = True
         while True:
-            # Process user inputs
+            if (profiler):
+                profiler.startFrame()
+
+            # Process user inputs, sleeping until one arrives when idle
             actionQueue = []
             assert(len(actionQueue) == 0)
-            self.input.parseInputs(actionQueue)
+            wait = self.eventDriven and not needsRedraw and not self.game.needsUpdate()
+            self.input.parseInputs(actionQueue, wait)
+            if (profiler):
+                profiler.mark("wait" if wait else "input")
 
             for action in actionQueue:
                 self._processAction(action)
+                needsRedraw = True
+            if (profiler):
+                profiler.mark("actions")
 
-            # Draw objects
-            self.surface.fill(colour.WHITE)
-            self.display.draw(self.surface)
-            self.board.draw(self.surface)
+            # Let computer players move
+            if (self.game.update()):
+                needsRedraw = True
+            if (profiler):
+                profiler.mark("logic")
 
-            # Update display
-            pygame.display.flip()
+            # Draw objects
+            if (needsRedraw or not self.eventDriven):
+                if (profiler):
+                    self._drawProfiled(profiler)
+                else:
+                    self.draw()
+                needsRedraw = False
+                if (startupTimer is not None):
+                    startupTimer.mark("first draw")
+                    return
 
             self.clock.tick(60)
+            if (profiler):
+                profiler.mark("tick")
+                profiler.endFrame()
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="A simple game about placing beads")
+    parser.add_argument("--red", default="human", choices=sorted(PLAYER_TYPES),
+        help="Player type for red (default: human)")
+    parser.add_argument("--blue", default="human", choices=sorted(PLAYER_TYPES),
+        help="Player type for blue (default: human)")
+    parser.add_argument("--time-budget", type=float, default=0.05,
+        help="Time in seconds a computer player may think per move (default: 0.05)")
+    parser.add_argument("--size", type=int, default=5, help="Width of the square board (default: 5)")
+    parser.add_argument("--starting-beads", type=int,
+        help="Beads each player starts with (default: two thirds of the spaces, 17 on 5x5)")
+    parser.add_argument("--clearance-removals", type=int,
+        help="Beads removed when the board fills (default: a quarter of the spaces, 6 on 5x5)")
+    parser.add_argument("--event-driven", action="store_true",
+        help="Only wake on input and redraw on change, leaving the CPU idle between moves")
+    parser.add_argument("--profile", action="store_true",
+        help="Time each phase of every frame. F3 shows the timings and F4 profiles the next frames.")
+    parser.add_argument("--profile-frames", type=int, default=300,
+        help="Number of frames profiled by F4 (default: 300)")
+    parser.add_argument("--profile-output", default="frames.prof",
+        help="File to write the F4 profile to, readable with pstats or snakeviz (default: frames.prof)")
+    parser.add_argument("--blocking-ai", action="store_true",
+        help="Let computer players think in the window's loop, which stops drawing while they do. "
+            "Analysis (A key) is not available.")
+    parser.add_argument("--analysis-cache",
+        help="Analysis store file from AnalysisStore.py, to keep analysis (A key) between runs")
+    parser.add_argument("--tablebase",
+        help="Tablebase file from Tablebase.py, used by computer players and for hints (H key)")
+    parser.add_argument("--startup-time", action="store_true",
+        help="Time each phase of starting up, print the times once the first frame is drawn and exit")
+    return parser.parse_args()
 
 
 def main():
     '''
     Main function
     '''
+    startupTimer = StartupTimer(STARTUP_TIME)
+    startupTimer.mark("imports")
+    args = parseArgs()
+    if (not args.startup_time):
+        startupTimer = None
 
-    pygame.display.set_caption("Encompass")
+    players = {
+        1: createPlayer(args.red, timeBudget=args.time_budget, tablebase=args.tablebase),
+        -1: createPlayer(args.blue, timeBudget=args.time_budget, tablebase=args.tablebase),
+    }
+
+    profiler = FrameProfiler(captureFrames=args.profile_frames, capturePath=args.profile_output) if args.profile else None
+
+    # Computer players and analysis run in a separate process so the window keeps drawing
+    worker = None if args.blocking_ai else BackgroundWorker()
+    if (startupTimer):
+        startupTimer.mark("players")
 
     # Define world object
-    world = World(720, 720)
+    world = World(720, 720, players, args.event_driven,
+        args.size, args.starting_beads, args.clearance_removals, args.tablebase, profiler, worker,
+        args.analysis_cache)
+    if (startupTimer):
+        startupTimer.mark("window")
 
     # Run world
-    world.run()
+    world.run(startupTimer)
+
+    # Only reached once the startup has been timed
+    print("\n".join(startupTimer.getReport()))
+    if (worker is not None):
+        worker.close()
+    pygame.quit()
 
 
 if __name__ == "__main__":
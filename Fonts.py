@@ -0,0 +1,79 @@
+import json
+import os
+
+import pygame
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+
+# Font loading.
+#
+# pygame.font.SysFont finds a font by name by listing every font installed,
+# which can take a large part of a second, on every start. findFont looks a
+# name up once and keeps its path in a cache file, so later starts load the
+# file directly. A name with no installed font is cached as null, and falls
+# back to pygame's bundled default font as SysFont does. Deleting the cache
+# file makes the next start look the fonts up again.
+#
+# The font module is initialised by the first getFont, so programs which
+# never draw text never initialise it.
+
+FONT_CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "encompass", "fonts.json")
+
+# Fonts loaded by this process, by (path, size)
+_fonts = {}
+
+
+def _loadCache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _saveCache(path, cache):
+    '''
+    Writes the cache to a temporary file and then moves it into place, so
+    another process never reads it half written
+    '''
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tempPath = "{}.{}".format(path, os.getpid())
+        with open(tempPath, "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tempPath, path)
+    except OSError as e:
+        logging.warning("Could not write the font cache {}: {}".format(path, e))
+
+
+def findFont(name, cachePath=FONT_CACHE_PATH):
+    '''
+    Returns the path of the installed font with a name, or None if there is
+    none, from the cache if it has been looked up before
+    '''
+    cache = _loadCache(cachePath)
+    if (name in cache and (cache[name] is None or os.path.isfile(cache[name]))):
+        return cache[name]
+
+    logging.info("Looking up font {}".format(name))
+    path = pygame.font.match_font(name)
+    cache[name] = path
+    _saveCache(cachePath, cache)
+    return path
+
+
+def getFont(path, size):
+    '''
+    Returns the font in a file, or pygame's default font for None, at a size
+    '''
+    if (not pygame.font.get_init()):
+        pygame.font.init()
+    font = _fonts.get((path, size))
+    if (font is None):
+        font = _fonts[(path, size)] = pygame.font.Font(path, size)
+    return font
@@ -0,0 +1,213 @@
+import cProfile
+import time
+from bisect import bisect_left
+from collections import deque
+
+import pygame
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+import Colours as colour
+from Fonts import getFont
+
+
+class RollingHistogram:
+    '''
+    Keeps the last maxSamples durations, with a count of them in each bucket
+    '''
+    # Upper edges of the buckets in seconds, the last catching anything slower
+    BUCKET_EDGES = [0.0005, 0.001, 0.002, 0.004, 0.008, 0.016, 0.033, 0.066, float("inf")]
+
+    def __init__(self, maxSamples=600):
+        self.samples = deque(maxlen=maxSamples)
+        self.counts = [0] * len(self.BUCKET_EDGES)
+
+
+    def __len__(self):
+        return len(self.samples)
+
+
+    def add(self, value):
+        if (len(self.samples) == self.samples.maxlen):
+            self.counts[self._getBucket(self.samples[0])] -= 1
+        self.samples.append(value)
+        self.counts[self._getBucket(value)] += 1
+
+
+    def _getBucket(self, value):
+        return bisect_left(self.BUCKET_EDGES, value)
+
+
+    def getPercentiles(self, fractions):
+        '''
+        Returns the sample at each fraction (0 to 1) of the sorted samples
+        '''
+        ordered = sorted(self.samples)
+        if (not ordered):
+            return [0. for _ in fractions]
+        return [ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] for fraction in fractions]
+
+
+class FrameProfiler:
+    '''
+    Times each phase of the frames of World.run, keeping a rolling histogram
+    per phase, and draws their percentiles as an overlay.
+    It can also capture a cProfile profile of a number of frames.
+
+    The loop calls startFrame, then mark after each phase with its name, then
+    endFrame. The time from the previous mark is added to the phase.
+    World only creates a profiler when asked to, so frames are not timed otherwise.
+    '''
+    # Phases which make up the work of a frame, as opposed to sleeping
+    WORK_PHASES = ["input", "actions", "logic", "draw", "present"]
+    PHASES = WORK_PHASES + ["wait", "tick"]
+
+    OVERLAY_KEY = pygame.K_F3
+    CAPTURE_KEY = pygame.K_F4
+    PERCENTILES = [0.5, 0.95, 0.99, 1.]
+
+    def __init__(self, maxSamples=600, captureFrames=300, capturePath="frames.prof"):
+        self.histograms = {phase: RollingHistogram(maxSamples) for phase in self.PHASES + ["work"]}
+        self.captureFrames = captureFrames
+        self.capturePath = capturePath
+
+        self.showOverlay = False
+        self.font = None
+
+        self.capture = None
+        self.captureFramesLeft = 0
+
+        self.lastMark = None
+        self.current = dict.fromkeys(self.PHASES, 0.)
+
+
+    def processKey(self, key):
+        '''
+        Toggles the overlay or starts a capture.
+        Returns whether the key was used.
+        '''
+        if (key == self.OVERLAY_KEY):
+            self.showOverlay = not self.showOverlay
+            return True
+        elif (key == self.CAPTURE_KEY):
+            self.startCapture()
+            return True
+        return False
+
+
+    ### Timing functions
+
+    def startFrame(self):
+        if (self.captureFramesLeft and self.capture is None):
+            self.capture = cProfile.Profile()
+            self.capture.enable()
+        self.lastMark = time.perf_counter()
+
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.current[phase] += now - self.lastMark
+        self.lastMark = now
+
+
+    def endFrame(self):
+        current = self.current
+        for phase, duration in current.items():
+            self.histograms[phase].add(duration)
+        self.histograms["work"].add(sum(current[phase] for phase in self.WORK_PHASES))
+        self.current = dict.fromkeys(self.PHASES, 0.)
+
+        if (self.capture is not None):
+            self.captureFramesLeft -= 1
+            if (not self.captureFramesLeft):
+                self._finishCapture()
+
+
+    ### Capture functions
+
+    def startCapture(self):
+        '''
+        Profiles the next captureFrames frames with cProfile, then writes the
+        statistics to capturePath
+        '''
+        if (self.captureFramesLeft):
+            return
+        logging.info("Profiling the next {} frames".format(self.captureFrames))
+        self.captureFramesLeft = self.captureFrames
+
+
+    def _finishCapture(self):
+        self.capture.disable()
+        self.capture.dump_stats(self.capturePath)
+        self.capture = None
+        logging.info("Wrote profile of {} frames to {}".format(self.captureFrames, self.capturePath))
+
+
+    ### Report functions
+
+    def getReport(self):
+        '''
+        Returns lines of text giving the percentiles of each phase in milliseconds
+        '''
+        lines = ["{:<8}{:>7}{:>7}{:>7}{:>7}".format("ms", "p50", "p95", "p99", "max")]
+        for phase in self.PHASES + ["work"]:
+            histogram = self.histograms[phase]
+            lines.append("{:<8}".format(phase) + "".join(
+                "{:>7.2f}".format(1000 * value) for value in histogram.getPercentiles(self.PERCENTILES)))
+
+        # Distribution of frame work over the histogram buckets
+        work = self.histograms["work"]
+        total = max(1, len(work))
+        for edge, count in zip(work.BUCKET_EDGES, work.counts):
+            label = "<{:.1f}".format(1000 * edge) if edge != float("inf") else "slower"
+            lines.append("{:<8}{:<20} {:>5.1%}".format(label, "#" * int(20 * count / total), count / total))
+        if (self.captureFramesLeft):
+            lines.append("Profiling: {} frames left".format(self.captureFramesLeft))
+        return lines
+
+
+    def drawOverlay(self, surface):
+        '''
+        Draws the report in the top left corner and returns the rectangle covered
+        '''
+        if (self.font is None):
+            self.font = getFont(pygame.font.get_default_font(), 12)
+        lines = [self.font.render(line, True, colour.BLACK) for line in self.getReport()]
+        lineHeight = self.font.get_linesize()
+        rect = pygame.Rect(0, 0, max(line.get_width() for line in lines) + 8, lineHeight * len(lines) + 8)
+        # Opaque, so it can be redrawn over itself
+        surface.fill(colour.WHITE, rect)
+        pygame.draw.rect(surface, colour.BLACK, rect, 1)
+        for i, line in enumerate(lines):
+            surface.blit(line, (4, 4 + i * lineHeight))
+        return rect
+
+
+class StartupTimer:
+    '''
+    Times the phases of starting up, from startTime (a time.perf_counter
+    reading) to the first frame being presented
+    '''
+    def __init__(self, startTime):
+        self.startTime = startTime
+        self.lastMark = startTime
+        self.phases = []
+
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.lastMark))
+        self.lastMark = now
+
+
+    def getTotal(self):
+        return self.lastMark - self.startTime
+
+
+    def getReport(self):
+        lines = ["{:<16}{:>8.1f} ms".format(phase, 1000 * duration) for phase, duration in self.phases]
+        lines.append("{:<16}{:>8.1f} ms".format("first frame", 1000 * self.getTotal()))
+        return lines
@@ -1,10 +1,4 @@
-import sys
-
-# Setup pygame
 import pygame
-import pygame.locals
-pygame.init()
-pygame.font.init()
 
 # Setup logging
 import logging
@@ -12,151 +6,321 @@ logger = logging.getLogger(__file__)
 import LoggerSettings
 
 # Local Imports
-from Board import Board
-from DisplayInfo import DisplayInfo
-
-
-class ScoreKeeper:
-    def __init__(self):
-        self.scores = {1: 0, -1:0}
-
-
-    def recordP1Win(self):
-        self.scores[1] += 1
+from Analysis import AnalysisCache, analysePosition, getCellValues, getShadeColour, formatValue, MAX_ANALYSIS_DEPTH
+from GameState import GameHistory
+from Players import HumanPlayer
+from Rules import Rules
+from Tablebase import Tablebase
 
 
-    def recordP2Win(self):
-        self.scores[-1] += 1
+class Game(Rules):
+    '''
+    Handles Game Logic for the pygame front end.
+    Translates clicks into board coordinates and keeps the display up to date.
+    Either player may be a computer player, which moves when update is called.
+    Given a tablebase file, pressing H shows the best move in solved positions.
+
+    Given a BackgroundWorker, computer players think in the worker instead,
+    and their moves arrive as ActionResult actions for processResult. A move
+    is only played if the position has not changed since it was requested.
+
+    Pressing A toggles analysis on the human player's turns. Every move taking
+    the turn is scored in the worker at increasing depths, and each space is
+    shaded by the value of its best move, from green to red. Results are
+    cached by canonical position, so shifts keep the analysis and positions
+    seen before start from their deepest result. Given the path of an
+    AnalysisStore, results are also kept between runs.
+
+    Every completed turn and shift is recorded in a GameHistory. The left and
+    right arrow keys undo and redo, passing over the computer players' turns,
+    and playing a different move after undoing starts a new variation. The up
+    and down arrow keys switch between the variations of the last move.
+    '''
+    def __init__(self, display, board, players=None, startingBeads=None, clearanceRemovals=None,
+            tablebase=None, worker=None, analysisStore=None):
+        self.display = display
+        self.players = players if players else {1: HumanPlayer(), -1: HumanPlayer()}
+        self.tablebase = Tablebase(tablebase) if tablebase else None
+
+        # Request id and position hash of the move being chosen in the worker
+        self.worker = worker
+        self.pendingMove = None
+        if (self.worker is not None):
+            for key, player in self.players.items():
+                if (not player.isHuman()):
+                    self.worker.setPlayer(key, player)
+
+        self.analysing = False
+        self.analysisCache = AnalysisCache()
+        # Path of an AnalysisStore shared between runs
+        self.analysisStorePath = analysisStore
+        # Canonical hash and transform of the position analysed
+        self.analysed = None
+        # Request id, canonical hash and transform of the analysis in the worker
+        self.pendingAnalysis = None
+        self.analysisText = None
+
+        # Set once Rules.__init__ has set up the starting state
+        self.history = None
+
+        Rules.__init__(self, board, startingBeads, clearanceRemovals)
+        self.history = GameHistory(self.getGameState())
+        self.updateDisplay()
 
 
-    def getP1Score(self):
-        return self.scores[1]
+    def getActivePlayer(self):
+        return self.players[1 if self.isP1Turn() else -1]
 
 
-    def getP2Score(self):
-        return self.scores[-1]
+    def isComputerTurn(self):
+        return not (self.isFinished or self.getActivePlayer().isHuman())
 
 
-class Game:
-    '''
-    Handles Game Logic
-    '''
-    def __init__(self, display, board):
-        self.startingBeads = 17
-        self.scores = ScoreKeeper()
+    def needsUpdate(self):
+        '''
+        Returns whether update has work to do, as a computer player is to move
+        and is not already thinking in the background
+        '''
+        return self.isComputerTurn() and self.pendingMove is None
 
-        self.board = board
-        self.display = display
 
-        self.p1Turn = False # Will be set to true by processNewState call
-        self.isFinished = False
+    def update(self):
+        '''
+        Hands the turn to the active player if it is a computer player.
+        With a background worker the move is requested, to be played by processResult.
+        Returns whether a move was played.
+        '''
+        if (self.analysing):
+            self.updateAnalysis()
+        if (not self.needsUpdate()):
+            return False
+        if (self.worker is not None):
+            requestId = self.worker.requestMove(1 if self.isP1Turn() else -1, self)
+            self.pendingMove = (requestId, self.getHash())
+            return False
+        return self.playComputerMove(self.getActivePlayer().chooseMove(self))
+
+
+    def processResult(self, action):
+        '''
+        Plays a move chosen in the background worker if it is still wanted,
+        or shows the latest analysis.
+        Returns whether a move was played.
+        '''
+        if (self.pendingAnalysis is not None and action.getRequestId() == self.pendingAnalysis[0]):
+            self.processAnalysisResult(action)
+            return False
+        if (self.pendingMove is None or action.getRequestId() != self.pendingMove[0]):
+            return False
+        requestId, positionHash = self.pendingMove
+        self.pendingMove = None
+        if (positionHash != self.getHash()):
+            return False
+        return self.playComputerMove(action.getValue())
 
-        self.inRemoval = False
-        self.stagedForRemoval = None
 
-        # Used to remove beads when board is full
-        self.inClearance = False
-        self.clearanceCount = 0
+    def _checkPendingMove(self):
+        if (self.pendingMove is not None and self.pendingMove[1] != self.getHash()):
+            self.cancelPendingMove()
 
-        self.processNewState()
 
+    def cancelPendingMove(self):
+        '''
+        Stops the background worker choosing a move for a position which has changed
+        '''
+        if (self.pendingMove is not None):
+            logging.info("Cancelling background move")
+            self.worker.cancel()
+            self.pendingMove = None
 
-    def reset(self):
-        logging.info("Resetting game state")
-        self.board.reset()
-        self.isFinished = False
 
-        # Reset removal variables
-        self.inRemoval = False
-        self.stagedForRemoval = None
+    def playComputerMove(self, move):
+        if (move is None):
+            logging.warning("Computer player has no legal moves")
+            return False
+        self.playMove(move)
+        return True
 
-        # Reset clearance variables
-        self.inClearance = False
-        self.clearanceCount = 0
-        self.processNewState()
 
+    def playMove(self, move):
+        '''
+        Plays a move from Rules.getLegalMoves as if it had been clicked
+        '''
+        logging.info("Playing move: {}".format(move))
+        if (move.mType == "SHIFT"):
+            self.processShift(move.direction)
+        elif (move.mType == "REMOVE"):
+            if (not self.isStateRemoval()):
+                self.processCoor(move.coor)
+            self.processCoor(move.coor2)
+        else:
+            self.processCoor(move.coor)
 
-    ### State management functions
 
-    def isP1Turn(self):
-        return self.p1Turn
+    ### History functions
 
+    def recordState(self):
+        if (self.history is not None and not self.inRemoval):
+            self.history.record(self.getGameState())
 
-    def isP2Turn(self):
-        return not self.p1Turn
 
+    def isHistoryStop(self, state):
+        '''
+        Returns whether undo and redo stop at a state, which they do unless a
+        computer player is to move in it while the other player is human
+        '''
+        if (state.isFinished or all(not player.isHuman() for player in self.players.values())):
+            return True
+        return self.players[1 if state.p1Turn else -1].isHuman()
 
-    def getP1NBeads(self):
-        return self.startingBeads - self.board.countP1Beads()
 
+    def undo(self):
+        '''
+        Returns to the last state in which a human player was to move.
+        A bead staged for removal is unstaged first.
+        '''
+        self.cancelPendingMove()
+        if (self.getGameState() != self.history.getState()):
+            self.restoreState(self.history.getState())
+            return
+        state = self.history.undo()
+        while (state is not None and not self.isHistoryStop(state) and self.history.canUndo()):
+            state = self.history.undo()
+        if (state is not None):
+            self.restoreState(state)
+
+
+    def redo(self):
+        '''
+        Replays the last variation visited up to the next state in which a human player is to move
+        '''
+        self.cancelPendingMove()
+        state = self.history.redo()
+        while (state is not None and not self.isHistoryStop(state) and self.history.canRedo()):
+            state = self.history.redo()
+        if (state is not None):
+            self.restoreState(state)
 
-    def getP2NBeads(self):
-        return self.startingBeads - self.board.countP2Beads()
 
+    def switchVariation(self, step):
+        self.cancelPendingMove()
+        state = self.history.switchVariation(step)
+        if (state is not None):
+            self.restoreState(state)
 
-    def setStateFinished(self):
-        assert(not self.isFinished)
-        self.isFinished = True
 
+    def restoreState(self, state):
+        '''
+        Sets the game to a state from the history and updates the display to match
+        '''
+        logging.info("Restoring state {} of the history".format(self.history.getPly()))
+        self.setGameState(state)
+        self.board.grid.setVictoryCoor(self.board.getVictoryCoor() if self.isFinished else None)
+        self.board.highlight = self.stagedForRemoval
+        self.updateDisplay()
 
-    def setStateClearance(self):
-        logging.info("Entering clearance state")
-        assert(not self.inRemoval)
-        self.clearanceCount = 6
-        self.inClearance = True
 
+    ### Analysis functions
 
-    def unsetStateClearance(self):
-        logging.info("Leaving clearance state")
-        assert(self.inClearance)
-        assert(self.clearanceCount == 0)
-        self.inClearance = False
+    def toggleAnalysis(self):
+        if (self.worker is None):
+            self.display.setBottomText("Analysis needs the background worker")
+            return
+        self.analysing = not self.analysing
+        logging.info("Analysis {}".format("on" if self.analysing else "off"))
+        if (not self.analysing):
+            self.clearAnalysis()
 
 
-    def setStateRemoval(self, coor):
+    def updateAnalysis(self):
         '''
-        Stage a bead for removal and update state
+        Starts analysing the position if it has changed. If the beads were
+        only moved, redraws the analysis in the new coordinates, and only
+        starts again if some moves were not on the board before.
         '''
-        logging.info("Entering removal state")
-        assert(not self.inClearance)
-        self.board.setHighlight(coor)
-        self.stagedForRemoval = coor
-        self.inRemoval = True
-
-
-    def unsetStateRemoval(self):
-        logging.info("Leaving removal state")
-        assert(self.inRemoval)
-        self.board.unsetHighlight()
-        self.stagedForRemoval = None
-        self.inRemoval = False
+        if (self.isFinished or not self.getActivePlayer().isHuman()):
+            if (self.analysed is not None):
+                self.clearAnalysis()
+            return
+        key, transform = self.getCanonicalHash()
+        if (self.analysed == (key, transform)):
+            return
+
+        moved = self.analysed is not None and self.analysed[0] == key
+        self.analysed = (key, transform)
+        cached = self.getCachedAnalysis()
+        self.showAnalysis(cached)
+        if (moved and self.pendingAnalysis is not None and cached and cached[0]):
+            # Still analysing the same position, which has every move on the board
+            return
+        startDepth = cached[0] + 1 if cached else 1
+        if (startDepth <= MAX_ANALYSIS_DEPTH):
+            requestId = self.worker.submit(
+                analysePosition, self.copy(), startDepth, MAX_ANALYSIS_DEPTH, self.analysisStorePath)
+            self.pendingAnalysis = (requestId, key, transform)
+        else:
+            self.pendingAnalysis = None
 
 
-    def isStateFinished(self):
-        return self.isFinished
+    def getCachedAnalysis(self):
+        key, transform = self.analysed
+        return self.analysisCache.lookup(key, transform, self.getLegalMoves(includeShifts=False))
 
 
-    def isStateRegular(self):
-        return not (self.isFinished or self.inClearance or self.inRemoval)
+    def processAnalysisResult(self, action):
+        requestId, key, transform = self.pendingAnalysis
+        if (action.isDone()):
+            self.pendingAnalysis = None
+        if (action.getValue() is None):
+            return
+        depth, values = action.getValue()
+        self.analysisCache.store(key, transform, depth, values)
+        if (self.analysed is not None and self.analysed[0] == key):
+            self.showAnalysis(self.getCachedAnalysis())
 
 
-    def isStateClearance(self):
-        return self.inClearance
+    def showAnalysis(self, analysis):
+        '''
+        Shades the spaces by the given (depth, {move: value}), or clears them for None.
+        Moves whose depth is not known yet count as depth 1.
+        '''
+        if (not analysis or not analysis[1]):
+            self.board.grid.setShades({})
+            self.analysisText = None
+        else:
+            depth, values = analysis
+            best = max(values.values())
+            self.board.grid.setShades({
+                coor: getShadeColour(value, best) for coor, value in getCellValues(values).items()})
+            bestMove = max(values, key=values.get)
+            self.analysisText = "Depth {}: best {} ({})".format(
+                max(depth, 1), bestMove.toNotation(), formatValue(best))
+        self.updateDisplay()
 
 
-    def isStateRemoval(self):
-        return self.inRemoval
+    def clearAnalysis(self):
+        self.analysed = None
+        self.pendingAnalysis = None
+        self.showAnalysis(None)
 
 
-    ### State update functions
+    ### State management functions
 
-    def updateTurn(self):
+    def setStateRemoval(self, coor):
         '''
-        Alternates the players' turns each call
+        Stage a bead for removal, highlight it and update state
         '''
-        self.p1Turn = not self.p1Turn
+        Rules.setStateRemoval(self, coor)
+        self.board.setHighlight(coor)
+
+
+    def unsetStateRemoval(self):
+        Rules.unsetStateRemoval(self)
+        self.board.unsetHighlight()
 
 
+    ### State update functions
+
     def updateDisplay(self):
         '''
         Updates the display to match the current game state
@@ -175,6 +339,10 @@ class Game:
             self.display.setBottomText(f"Clearance! Removals remaining: {self.clearanceCount}")
         elif (self.isStateRemoval()):
             self.display.setBottomText(f"Removal. Please select a second bead")
+        elif (self.analysisText):
+            self.display.setBottomText(self.analysisText)
+        elif (self.history is not None and self.history.getVariation()[1] > 1):
+            self.display.setBottomText("Variation {} of {}".format(*self.history.getVariation()))
         else:
             self.display.eraseBottomText()
 
@@ -183,33 +351,28 @@ class Game:
         '''
         Updates the game state based on the state of the board
         '''
-        logging.info("Processing game state")
-        if (self.board.isVictory()):
-            self.setStateFinished()
-            if self.isP1Turn():
-                logging.info("Player 1 wins!")
-                self.scores.recordP1Win()
-            else:
-                logging.info("Player 2 wins!")
-                self.scores.recordP2Win()
-        else:
-            if (self.board.isFull()):
-                self.setStateClearance()
-            elif (self.isStateClearance() and self.clearanceCount == 0):
-                self.unsetStateClearance()
-
-            if (not self.isStateRemoval()):
-                self.updateTurn()
+        Rules.processNewState(self)
+        self._checkPendingMove()
+        self.recordState()
 
         # Update display to represent new state
         self.updateDisplay()
 
 
+    def processShift(self, direction):
+        shifted = Rules.processShift(self, direction)
+        self._checkPendingMove()
+        if (shifted):
+            self.recordState()
+            self.updateDisplay()
+        return shifted
+
+
     def processClick(self, pos, surface):
         '''
         Processes user input from the mouse
         '''
-        if (not self.isFinished):
+        if (not self.isFinished and self.getActivePlayer().isHuman()):
             logging.info("Click signal received: position ({} {})".format(*pos))
             if (self.board.isOnGrid(pos)):
                 self.processClickOnBoard(pos)
@@ -223,45 +386,7 @@ class Game:
         '''
         coor = self.board.getCoor(pos)
         logging.info("Corresponding coordinate ({} {})".format(*coor))
-        isOnBead = self.board.isOnBead(coor, pos)
-
-        if (self.isStateClearance() and isOnBead):
-            self.runClearance(coor)
-            self.processNewState()
-        else:
-            if (self.isStateRemoval() and isOnBead):
-                if (coor  == self.stagedForRemoval):
-                    # If clicked space is already staged, needs to be unstaged
-                    self.unsetStateRemoval()
-                elif (self.board.areP1AndP2(coor, self.stagedForRemoval)):
-                    # If clicked space is controlled by a different player, remove both
-                    self.board.setEmpty(coor)
-                    self.board.setEmpty(self.stagedForRemoval)
-                    self.unsetStateRemoval()
-                    self.processNewState()
-            elif (self.board.isSpaceEmpty(coor)):
-                # If space is empty, check if move is legal and add a bead if so
-                if (self.isP1Turn() and not self.board.isSpaceSurroundedByP2(coor) and self.getP1NBeads() > 0):
-                    self.board.setP1(coor)
-                    self.processNewState()
-                elif (self.isP2Turn() and not self.board.isSpaceSurroundedByP1(coor) and self.getP2NBeads() > 0):
-                    self.board.setP2(coor)
-                    self.processNewState()
-            elif (isOnBead):
-                # If space isn't empty and state isn't removal,
-                #   stage clicked bead for removal
-                self.setStateRemoval(coor)
-                self.processNewState()
-
-
-    def runClearance(self, coor):
-        '''
-        Process clearance. Can only remove own beads.
-        '''
-        if ((self.isP1Turn() and self.board.isP1(coor)) or (self.isP2Turn() and self.board.isP2(coor))):
-            self.board.setEmpty(coor)
-            self.clearanceCount -= 1
-            assert(self.clearanceCount > -1)
+        self.processCoor(coor, self.board.isOnBead(coor, pos))
 
 
     def processClickOutsideBoard(self, pos, surface):
@@ -274,23 +399,52 @@ class Game:
         xRel, yRel = pos[0] - xMax/float(2), yMax/float(2) - pos[1]
         # Detect clicks in four zones around the board
         if (xRel > 0 and abs(xRel) > abs(yRel)):
-            if (self.board.canShiftRight()):
-                logging.info("Performing shift right")
-                self.board.shiftRight()
+            self.processShift("RIGHT")
         if (xRel < 0 and abs(xRel) > abs(yRel)):
-            if (self.board.canShiftLeft()):
-                logging.info("Performing shift left")
-                self.board.shiftLeft()
+            self.processShift("LEFT")
         if (yRel > 0 and abs(yRel) > abs(xRel)):
-            if (self.board.canShiftUp()):
-                logging.info("Performing shift up")
-                self.board.shiftUp()
+            self.processShift("UP")
         if (yRel < 0 and abs(yRel) > abs(xRel)):
-            if (self.board.canShiftDown()):
-                logging.info("Performing shift down")
-                self.board.shiftDown()
+            self.processShift("DOWN")
+
+
+    def reset(self):
+        self.cancelPendingMove()
+        Rules.reset(self)
+        self.history = GameHistory(self.getGameState())
+        self.updateDisplay()
 
 
     def processKey(self, key):
         if (key == pygame.K_SPACE and self.isStateFinished()):
             self.reset()
+        elif (key == pygame.K_h):
+            self.showHint()
+        elif (key == pygame.K_a):
+            self.toggleAnalysis()
+        elif (key == pygame.K_LEFT):
+            self.undo()
+        elif (key == pygame.K_RIGHT):
+            self.redo()
+        elif (key == pygame.K_UP):
+            self.switchVariation(-1)
+        elif (key == pygame.K_DOWN):
+            self.switchVariation(1)
+
+
+    def showHint(self):
+        '''
+        Shows the tablebase's best move and result in the bottom text
+        '''
+        value = self.tablebase.probe(self) if self.tablebase else None
+        if (value is None):
+            self.display.setBottomText("No hint for this position")
+            return
+        move = self.tablebase.getBestMove(self)
+        if (value > 0):
+            result = "wins in {}".format(value)
+        elif (value < 0):
+            result = "loses in {}".format(-value)
+        else:
+            result = "draws"
+        self.display.setBottomText("Hint: {} {}".format(move.toNotation(), result))
@@ -0,0 +1,333 @@
+import json
+import struct
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from BitBoard import BitBoard
+from Moves import Move
+from Rules import Rules
+
+
+# Binary game record format.
+#
+# A file starts with MAGIC followed by a format version byte, then holds any
+# number of records. Each record is its length as a little-endian uint32
+# followed by:
+#
+#     header    - _HEADER: board size, starting beads, clearance removals,
+#                 winner (1, -1 or 0), number of moves, snapshot interval,
+#                 number of snapshots, length of the move stream in bytes
+#                 and length of the metadata in bytes
+#     metadata  - UTF-8 JSON object (optional, e.g. player names)
+#     moves     - one unsigned LEB128 varint per move, see _encodeMove
+#     snapshots - every snapshot interval moves, the position after that move:
+#                 _SNAPSHOT (offset into the move stream of the next move,
+#                 state flags, clearance count) followed by the player 1 and
+#                 player 2 bitmasks, each (size*size + 7)//8 bytes little-endian
+#
+# On the standard board a placement takes one byte and a removal pair two.
+MAGIC = b"ENCR"
+VERSION = 1
+
+_HEADER = struct.Struct("<BHHbIHIIH")
+_SNAPSHOT = struct.Struct("<IBH")
+_LENGTH = struct.Struct("<I")
+
+_MOVE_TYPES = ["PLACE", "REMOVE", "CLEAR", "SHIFT"]
+_DIRECTIONS = ["UP", "DOWN", "LEFT", "RIGHT"]
+
+# Snapshot state flags
+_P1_TURN = 1
+_IN_CLEARANCE = 2
+_FINISHED = 4
+
+
+class RecordError(Exception):
+    '''
+    Raised when a file is not a valid game record file
+    '''
+    pass
+
+
+### Move encoding functions
+
+def _encodeMove(move, size):
+    '''
+    Returns the move as an integer: its type in the lowest two bits, and
+    above them the space index, pair of space indices or shift direction
+    '''
+    mType = move.mType
+    if (mType == "SHIFT"):
+        payload = _DIRECTIONS.index(move.direction)
+    else:
+        payload = move.coor[0] * size + move.coor[1]
+        if (mType == "REMOVE"):
+            payload = payload * size * size + move.coor2[0] * size + move.coor2[1]
+    return (payload << 2) | _MOVE_TYPES.index(mType)
+
+
+def _decodeMove(code, size):
+    mType = _MOVE_TYPES[code & 3]
+    payload = code >> 2
+    if (mType == "SHIFT"):
+        return Move("SHIFT", direction=_DIRECTIONS[payload])
+    elif (mType == "REMOVE"):
+        first, second = divmod(payload, size * size)
+        return Move("REMOVE", divmod(first, size), divmod(second, size))
+    return Move(mType, divmod(payload, size))
+
+
+def _writeVarint(buffer, value):
+    while (value > 0x7f):
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _iterVarints(data, offset=0):
+    '''
+    Yields each varint in data from offset
+    '''
+    value, shift = 0, 0
+    for byte in memoryview(data)[offset:]:
+        value |= (byte & 0x7f) << shift
+        if (byte & 0x80):
+            shift += 7
+        else:
+            yield value
+            value, shift = 0, 0
+
+
+### Position functions
+
+def _encodeState(rules, offset):
+    '''
+    Returns a snapshot of the rules, whose next move starts at offset in the move stream
+    '''
+    assert(not rules.isStateRemoval())
+    board = rules.board
+    nBytes = (board.size * board.size + 7) // 8
+    flags = (
+        (_P1_TURN if rules.p1Turn else 0) |
+        (_IN_CLEARANCE if rules.inClearance else 0) |
+        (_FINISHED if rules.isFinished else 0) )
+    return (
+        _SNAPSHOT.pack(offset, flags, rules.clearanceCount) +
+        board.p1.to_bytes(nBytes, "little") + board.p2.to_bytes(nBytes, "little") )
+
+
+def _decodeState(rules, data):
+    '''
+    Sets the rules to a snapshot, returning the offset of the next move
+    '''
+    offset, flags, clearanceCount = _SNAPSHOT.unpack_from(data)
+    board = rules.board
+    nBytes = (board.size * board.size + 7) // 8
+    start = _SNAPSHOT.size
+    p1 = int.from_bytes(data[start:start + nBytes], "little")
+    p2 = int.from_bytes(data[start + nBytes:start + 2 * nBytes], "little")
+
+    board.reset()
+    for coor in board.iterCoors(p1):
+        board.setP1(coor)
+    for coor in board.iterCoors(p2):
+        board.setP2(coor)
+    rules.p1Turn = bool(flags & _P1_TURN)
+    rules.inClearance = bool(flags & _IN_CLEARANCE)
+    rules.isFinished = bool(flags & _FINISHED)
+    rules.clearanceCount = clearanceCount
+    rules.inRemoval = False
+    rules.stagedForRemoval = None
+    rules.lastMoveWasShift = False
+    rules.undoStack = []
+    return offset
+
+
+### Writing
+
+class RecordWriter:
+    '''
+    Streams game records to a file.
+    Appends to existing files, which are checked to be record files.
+    '''
+    def __init__(self, path, snapshotInterval=32):
+        assert(snapshotInterval > 0)
+        self.snapshotInterval = snapshotInterval
+        self.file = open(path, "ab+")
+        self.file.seek(0)
+        magic = self.file.read(len(MAGIC) + 1)
+        if (not magic):
+            self.file.write(MAGIC + bytes([VERSION]))
+        elif (magic != MAGIC + bytes([VERSION])):
+            self.file.close()
+            raise RecordError("{} is not a version {} game record file".format(path, VERSION))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def close(self):
+        self.file.close()
+
+
+    def flush(self):
+        self.file.flush()
+
+
+    def write(self, moves, winner=0, size=5, startingBeads=None, clearanceRemovals=None, metadata=None):
+        '''
+        Writes a game played from the start with the given moves.
+        The moves are replayed to build the snapshots, so must be legal.
+        '''
+        rules = Rules(BitBoard(size), startingBeads, clearanceRemovals)
+        moveData = bytearray()
+        snapshots = []
+        for i, move in enumerate(moves):
+            _writeVarint(moveData, _encodeMove(move, size))
+            rules.makeMove(move)
+            if ((i + 1) % self.snapshotInterval == 0):
+                snapshots.append(_encodeState(rules, len(moveData)))
+
+        metadataData = json.dumps(metadata, separators=(",", ":")).encode() if metadata else b""
+        header = _HEADER.pack(
+            size, rules.startingBeads, rules.clearanceRemovals, winner, len(moves),
+            self.snapshotInterval, len(snapshots), len(moveData), len(metadataData))
+        body = b"".join([header, metadataData, bytes(moveData)] + snapshots)
+        self.file.write(_LENGTH.pack(len(body)) + body)
+
+
+### Reading
+
+class GameRecord:
+    '''
+    A single game read from a record file.
+    Moves are decoded on demand.
+    '''
+    def __init__(self, data):
+        (self.size, self.startingBeads, self.clearanceRemovals, self.winner, self.nMoves,
+            self.snapshotInterval, nSnapshots, nMoveBytes, nMetadataBytes) = _HEADER.unpack_from(data)
+
+        offset = _HEADER.size
+        self.metadata = json.loads(bytes(data[offset:offset + nMetadataBytes])) if nMetadataBytes else {}
+        offset += nMetadataBytes
+        self.moveData = data[offset:offset + nMoveBytes]
+        offset += nMoveBytes
+
+        snapshotSize = _SNAPSHOT.size + 2 * ((self.size * self.size + 7) // 8)
+        self.snapshots = [
+            data[offset + i * snapshotSize:offset + (i + 1) * snapshotSize] for i in range(nSnapshots)]
+
+
+    def __len__(self):
+        return self.nMoves
+
+
+    def iterMoves(self, offset=0):
+        '''
+        Yields the moves from offset in the move stream (the start by default)
+        '''
+        size = self.size
+        for code in _iterVarints(self.moveData, offset):
+            yield _decodeMove(code, size)
+
+
+    def getMoves(self):
+        return list(self.iterMoves())
+
+
+    def getRules(self, nMoves=None):
+        '''
+        Returns the position after the first nMoves moves (all by default),
+        replaying from the nearest snapshot at or before it
+        '''
+        replay = Replay(self)
+        replay.seek(self.nMoves if nMoves is None else nMoves)
+        return replay.rules
+
+
+class Replay:
+    '''
+    Steps through a recorded game.
+    Seeking restores the nearest snapshot, unless the target is a short
+    way ahead of the current position, and replays the moves from there.
+    '''
+    def __init__(self, record):
+        self.record = record
+        self.rules = Rules(BitBoard(record.size), record.startingBeads, record.clearanceRemovals)
+        self.position = 0
+        self.moves = record.iterMoves()
+
+
+    def seek(self, position):
+        '''
+        Moves to the position after the given number of moves
+        '''
+        record = self.record
+        assert(0 <= position <= record.nMoves)
+        snapshot = min(position // record.snapshotInterval, len(record.snapshots))
+        snapshotPosition = snapshot * record.snapshotInterval
+
+        # Replay from the current position if no snapshot is closer
+        if (not (snapshotPosition <= self.position <= position)):
+            if (snapshot):
+                offset = _decodeState(self.rules, record.snapshots[snapshot - 1])
+            else:
+                self.rules = Rules(BitBoard(record.size), record.startingBeads, record.clearanceRemovals)
+                offset = 0
+            self.position = snapshotPosition
+            self.moves = record.iterMoves(offset)
+
+        while (self.position < position):
+            self.step()
+
+
+    def step(self):
+        '''
+        Plays the next move and returns it
+        '''
+        move = next(self.moves)
+        self.rules.makeMove(move)
+        self.position += 1
+        return move
+
+
+class RecordReader:
+    '''
+    Iterates over the games in a record file, reading one record at a time.
+    A partially written final record, left by an interruption, is skipped
+    and the offset of the end of the last complete record is kept in goodOffset.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.goodOffset = None
+
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            header = f.read(len(MAGIC) + 1)
+            if (header != MAGIC + bytes([VERSION])):
+                raise RecordError("{} is not a version {} game record file".format(self.path, VERSION))
+            self.goodOffset = f.tell()
+
+            while True:
+                lengthData = f.read(_LENGTH.size)
+                if (not lengthData):
+                    break
+                if (len(lengthData) < _LENGTH.size):
+                    logging.warning("Discarding incomplete record at end of {}".format(self.path))
+                    break
+                length, = _LENGTH.unpack(lengthData)
+                data = f.read(length)
+                if (len(data) < length):
+                    logging.warning("Discarding incomplete record at end of {}".format(self.path))
+                    break
+                self.goodOffset = f.tell()
+                yield GameRecord(data)
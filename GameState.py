@@ -0,0 +1,128 @@
+from collections import namedtuple
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+
+class GameState(namedtuple("GameState", [
+        "size", "startingBeads", "clearanceRemovals", "p1", "p2", "p1Turn", "isFinished",
+        "inRemoval", "stagedForRemoval", "inClearance", "clearanceCount", "p1Score", "p2Score",
+        "lastMoveWasShift"])):
+    '''
+    An immutable snapshot of the full state of a game, as taken by
+    Rules.getGameState and restored by Rules.setGameState.
+    The board is held as the two bead bitmasks of BitBoard, so taking a
+    snapshot copies no lists and snapshots share the unchanged integers.
+    Each player's beads left follow from the starting beads and the board.
+    '''
+    __slots__ = ()
+
+
+class HistoryNode:
+    '''
+    A state in a GameHistory, with the states which followed it
+    '''
+    __slots__ = ("state", "parent", "children", "selected")
+
+    def __init__(self, state, parent):
+        self.state = state
+        self.parent = parent
+        self.children = []
+        # Index of the child redo goes to, the last one visited
+        self.selected = None
+
+
+class GameHistory:
+    '''
+    A tree of the states of a game, for undo, redo and switching between
+    variations. Recording a state after undoing starts a new variation
+    alongside the old, rather than discarding it. Nodes only hold their
+    GameState, so the tree costs little per move.
+    '''
+    def __init__(self, state):
+        self.root = HistoryNode(state, None)
+        self.current = self.root
+
+
+    def getState(self):
+        return self.current.state
+
+
+    def record(self, state):
+        '''
+        Moves to a new state following the current one.
+        Reuses a variation already reaching the same state.
+        '''
+        node = self.current
+        if (state == node.state):
+            return
+        for i, child in enumerate(node.children):
+            if (child.state == state):
+                break
+        else:
+            node.children.append(HistoryNode(state, node))
+            i = len(node.children) - 1
+        node.selected = i
+        self.current = node.children[i]
+
+
+    def canUndo(self):
+        return self.current.parent is not None
+
+
+    def canRedo(self):
+        return self.current.selected is not None
+
+
+    def undo(self):
+        '''
+        Returns the previous state, or None at the start of the game
+        '''
+        if (not self.canUndo()):
+            return None
+        self.current = self.current.parent
+        return self.current.state
+
+
+    def redo(self):
+        '''
+        Returns the next state in the last variation visited, or None if there is none
+        '''
+        if (not self.canRedo()):
+            return None
+        self.current = self.current.children[self.current.selected]
+        return self.current.state
+
+
+    def switchVariation(self, step):
+        '''
+        Moves to the step-th next variation from the previous state, wrapping
+        around, and returns its state. Returns None if there are no others.
+        '''
+        parent = self.current.parent
+        if (parent is None or len(parent.children) < 2):
+            return None
+        parent.selected = (parent.children.index(self.current) + step) % len(parent.children)
+        self.current = parent.children[parent.selected]
+        return self.current.state
+
+
+    def getVariation(self):
+        '''
+        Returns (number, count) of the current variation among those from the previous state
+        '''
+        parent = self.current.parent
+        if (parent is None):
+            return 1, 1
+        return parent.children.index(self.current) + 1, len(parent.children)
+
+
+    def getPly(self):
+        '''
+        Returns the number of states before the current one
+        '''
+        ply, node = 0, self.current
+        while (node.parent is not None):
+            ply, node = ply + 1, node.parent
+        return ply
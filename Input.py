@@ -1,20 +1,58 @@
 import pygame
+import pygame.locals
 from Actions import *
 
+# Posted by BackgroundWorker with the results of its computations
+RESULT_EVENT = pygame.event.custom_type()
+
 class Input:
+    # Events converted into actions. Other events can be blocked so they
+    # do not wake an idle event-driven loop.
+    EVENT_TYPES = [
+        pygame.locals.QUIT,
+        pygame.MOUSEBUTTONUP,
+        pygame.KEYUP,
+        pygame.VIDEOEXPOSE,
+        pygame.WINDOWEXPOSED,
+        RESULT_EVENT,
+    ]
+
     def __init__(self):
         pass
 
 
-    def parseInputs(self, actionQueue):
-        for event in pygame.event.get():
+    def blockUnusedEvents(self):
+        '''
+        Stops pygame queueing events which are not converted into actions
+        '''
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(self.EVENT_TYPES)
+
+
+    def parseInputs(self, actionQueue, wait=False):
+        '''
+        Converts pending events into actions.
+        If wait is True and no events are pending, sleeps until one arrives.
+        '''
+        events = pygame.event.get()
+        if (wait and not events):
+            events = [pygame.event.wait()] + pygame.event.get()
+
+        for event in events:
             # Detect Quit Action
             if event.type == pygame.locals.QUIT:
                 actionQueue.append(Action("QUIT"))
 
+            # Window contents lost, e.g. after being uncovered
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                actionQueue.append(Action("REDRAW"))
+
             elif event.type == pygame.MOUSEBUTTONUP:
                 pos = pygame.mouse.get_pos()
                 actionQueue.append(ActionMouseClick(pos))
 
             elif event.type == pygame.KEYUP:
                 actionQueue.append(ActionKeyPressed(event.key))
+
+            elif event.type == RESULT_EVENT:
+                actionQueue.append(ActionResult(event.requestId, event.value, event.done))
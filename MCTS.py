@@ -0,0 +1,247 @@
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from BitBoard import getRandomBit
+from Moves import Move
+
+
+# Seconds between checks of isCancelled while workers search
+CANCEL_POLL_INTERVAL = 0.01
+
+
+class _Node:
+    '''
+    Node of the search tree.
+    Wins are counted for the player who made the move into the node.
+    '''
+    __slots__ = ("move", "parent", "children", "untried", "visits", "wins", "p1Moved")
+
+    def __init__(self, move, parent, p1Moved, untried):
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.wins = 0.
+        self.p1Moved = p1Moved
+
+
+    def selectChild(self, exploration):
+        logVisits = math.log(self.visits)
+        return max(self.children, key=lambda child:
+            child.wins/child.visits + exploration*math.sqrt(logVisits/child.visits))
+
+
+def getPlayoutMove(rules, rng, placeChance=0.8):
+    '''
+    Returns a lightly guided random move for playouts.
+    Wins are always taken, otherwise placements are preferred over removals,
+    which far outnumber them. Shifts are not played.
+    '''
+    board = rules.board
+    if (rules.isP1Turn()):
+        mine, theirs = board.p1, board.p2
+    else:
+        mine, theirs = board.p2, board.p1
+
+    if (rules.isStateClearance() and mine):
+        return Move("CLEAR", divmod(getRandomBit(mine, rng), board.size))
+
+    placements = rules.getPlacementMask()
+    winning = placements & board.getCompletingMask(mine, theirs)
+    if (winning):
+        placements = winning
+    elif (not (placements and (rng.random() < placeChance or not (mine and theirs)))):
+        placements = 0
+
+    if (placements):
+        return Move("PLACE", divmod(getRandomBit(placements, rng), board.size))
+    elif (board.p1 and board.p2):
+        return Move("REMOVE",
+            divmod(getRandomBit(board.p1, rng), board.size),
+            divmod(getRandomBit(board.p2, rng), board.size))
+    return None
+
+
+def playout(rules, rng, maxPlies=100):
+    '''
+    Plays random moves on the rules until the game finishes.
+    Returns 1 if player 1 wins, -1 if player 2 wins and 0 if no result
+    is reached within maxPlies.
+    '''
+    for _ in range(maxPlies):
+        if (rules.isFinished):
+            return 1 if rules.isP1Turn() else -1
+        move = getPlayoutMove(rules, rng)
+        if (move is None):
+            return 0
+        rules.makeMove(move)
+    if (rules.isFinished):
+        return 1 if rules.isP1Turn() else -1
+    return 0
+
+
+def runSearch(rules, timeBudget, seed=None, exploration=1.4, allowShifts=True, maxPlies=100, isCancelled=None):
+    '''
+    Runs Monte Carlo tree search on a copy of the rules for the time budget,
+    or until isCancelled (if given) returns True.
+    Returns the root statistics as {move: (visits, wins)} and the number of playouts.
+    '''
+    deadline = time.perf_counter() + timeBudget
+    rng = random.Random(seed)
+    rules = rules.copy()
+
+    root = _Node(None, None, not rules.isP1Turn(), rules.getLegalMoves(includeShifts=allowShifts))
+    nPlayouts = 0
+    while (time.perf_counter() < deadline):
+        node = root
+        depth = 0
+
+        # Selection
+        while (not node.untried and node.children):
+            node = node.selectChild(exploration)
+            rules.makeMove(node.move)
+            depth += 1
+
+        # Expansion
+        if (node.untried):
+            i = rng.randrange(len(node.untried))
+            node.untried[i], node.untried[-1] = node.untried[-1], node.untried[i]
+            move = node.untried.pop()
+
+            p1Moved = rules.isP1Turn()
+            rules.makeMove(move)
+            depth += 1
+            untried = [] if rules.isFinished else rules.getLegalMoves(includeShifts=move.takesTurn())
+            child = _Node(move, node, p1Moved, untried)
+            node.children.append(child)
+            node = child
+
+        # Simulation
+        result = playout(rules.copy(), rng, maxPlies)
+        nPlayouts += 1
+
+        # Backpropagation
+        while (node is not None):
+            node.visits += 1
+            if (result == 0):
+                node.wins += 0.5
+            elif ((result > 0) == node.p1Moved):
+                node.wins += 1
+            node = node.parent
+
+        for _ in range(depth):
+            rules.unmakeMove()
+
+        if (isCancelled is not None and isCancelled()):
+            break
+
+    stats = {child.move: (child.visits, child.wins) for child in root.children}
+    return stats, nPlayouts
+
+
+# Set by the parent to end the searches in the worker processes early
+_stopEvent = None
+
+
+def _initWorker(stopEvent):
+    global _stopEvent
+    _stopEvent = stopEvent
+
+
+def _runWorker(args):
+    '''
+    Entry point for worker processes
+    '''
+    return runSearch(*args, isCancelled=_stopEvent.is_set)
+
+
+class MCTSSearch:
+    '''
+    Monte Carlo tree search, parallelised at the root.
+    Each worker process grows an independent tree from the same position, and
+    the visit counts of the root moves are summed when the time budget ends.
+    '''
+    def __init__(self, nWorkers=None, exploration=1.4):
+        self.nWorkers = nWorkers if nWorkers else os.cpu_count() or 1
+        self.exploration = exploration
+        self.executor = None
+        self.stopEvent = None
+        self.nSearches = 0
+
+        # Statistics from the last search
+        self.playouts = 0
+        self.elapsed = 0.
+        self.playoutsPerSecondPerCore = 0.
+
+
+    def close(self):
+        if (self.executor is not None):
+            self.executor.shutdown()
+            self.executor = None
+
+
+    def findBestMove(self, rules, timeBudget=1.0, allowShifts=True, isCancelled=None):
+        '''
+        Returns the most visited move after searching for the time budget (in seconds).
+        The given rules are not modified.
+        If isCancelled returns True, the workers are stopped and the best move
+        found so far is returned.
+        '''
+        startTime = time.perf_counter()
+        self.nSearches += 1
+
+        moves = rules.getLegalMoves(includeShifts=allowShifts)
+        if (len(moves) < 2):
+            return moves[0] if moves else None
+
+        # Seeds differ between workers and searches so trees are independent
+        rules = rules.copy()
+        jobs = [
+            (rules, timeBudget, self.nSearches * self.nWorkers + i, self.exploration, allowShifts)
+            for i in range(self.nWorkers)]
+        if (self.nWorkers == 1):
+            results = [runSearch(*jobs[0], isCancelled=isCancelled)]
+        else:
+            if (self.executor is None):
+                self.stopEvent = multiprocessing.Event()
+                self.executor = ProcessPoolExecutor(
+                    self.nWorkers, initializer=_initWorker, initargs=(self.stopEvent,))
+            self.stopEvent.clear()
+            futures = [self.executor.submit(_runWorker, job) for job in jobs]
+            if (isCancelled is not None):
+                while (wait(futures, timeout=CANCEL_POLL_INTERVAL).not_done):
+                    if (isCancelled()):
+                        self.stopEvent.set()
+                        break
+            results = [future.result() for future in futures]
+
+        merged = {}
+        self.playouts = 0
+        for stats, nPlayouts in results:
+            self.playouts += nPlayouts
+            for move, (visits, wins) in stats.items():
+                totalVisits, totalWins = merged.get(move, (0, 0.))
+                merged[move] = (totalVisits + visits, totalWins + wins)
+
+        self.elapsed = time.perf_counter() - startTime
+        self.playoutsPerSecondPerCore = self.playouts / (self.elapsed * self.nWorkers)
+
+        if (not merged):
+            # Budget too short to expand the root
+            return moves[0]
+
+        bestMove = max(merged, key=lambda move: merged[move][0])
+        visits, wins = merged[bestMove]
+        logging.debug("{} playouts on {} workers ({:.0f} playouts/s per core): {} wins {:.0%}".format(
+            self.playouts, self.nWorkers, self.playoutsPerSecondPerCore, bestMove, wins/visits))
+        return bestMove
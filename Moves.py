@@ -0,0 +1,64 @@
+from collections import namedtuple
+
+
+_DIRECTIONS = {"U": "UP", "D": "DOWN", "L": "LEFT", "R": "RIGHT"}
+
+
+class Move(namedtuple("Move", ["mType", "coor", "coor2", "direction"])):
+    '''
+    A single move, as produced by Rules.getLegalMoves.
+    Move types are:
+        "PLACE"  - place a bead at coor
+        "REMOVE" - remove the pair of beads at coor and coor2
+        "CLEAR"  - remove own bead at coor during clearance
+        "SHIFT"  - shift all beads in direction
+    Moves are hashable, so can be stored in tables.
+    '''
+    __slots__ = ()
+
+    def __new__(cls, mType, coor=None, coor2=None, direction=None):
+        return super().__new__(cls, mType, coor, coor2, direction)
+
+
+    def getMoveType(self):
+        return self.mType
+
+
+    def takesTurn(self):
+        '''
+        Returns whether the move uses up the mover's turn
+        '''
+        return self.mType != "SHIFT"
+
+
+    def __str__(self):
+        if self.mType == "SHIFT":
+            return "SHIFT {}".format(self.direction)
+        elif self.mType == "REMOVE":
+            return "REMOVE ({} {}) ({} {})".format(*self.coor, *self.coor2)
+        return "{} ({} {})".format(self.mType, *self.coor)
+
+
+    def toNotation(self):
+        '''
+        Returns a short string for the move, e.g. "P2,3", "R1,1,2,2", "C0,4" or "SU"
+        '''
+        if self.mType == "SHIFT":
+            return "S" + self.direction[0]
+        elif self.mType == "REMOVE":
+            return "R{},{},{},{}".format(*self.coor, *self.coor2)
+        return "{}{},{}".format(self.mType[0], *self.coor)
+
+
+    @classmethod
+    def fromNotation(cls, notation):
+        '''
+        Inverse of toNotation
+        '''
+        kind, rest = notation[0], notation[1:]
+        if kind == "S":
+            return cls("SHIFT", direction=_DIRECTIONS[rest])
+        values = [int(i) for i in rest.split(",")]
+        if kind == "R":
+            return cls("REMOVE", (values[0], values[1]), (values[2], values[3]))
+        return cls({"P": "PLACE", "C": "CLEAR"}[kind], (values[0], values[1]))
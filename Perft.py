@@ -0,0 +1,195 @@
+import argparse
+import os
+import time
+from multiprocessing import Pool
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from BitBoard import BitBoard
+from Moves import Move
+from PositionCodec import decodePosition, encodePosition
+from Rules import Rules
+
+
+# Move tree counting, as perft is used to check chess move generators.
+#
+# perft(rules, depth) counts the sequences of depth legal moves from a
+# position, over every phase: placements, removal pairs (one move), clearance
+# removals and shifts. A finished game ends its sequence early, so counts
+# nothing at greater depths. Every move is made and unmade with
+# Rules.makeMove, leaves included, so the count exercises the board's
+# incremental updates as well as move generation, and the nodes (moves made)
+# per second is a measure of their speed.
+#
+# With deduplication the distinct states at depth are counted instead, by
+# Rules.getHash, or Rules.getCanonicalHash to count translations, rotations
+# and reflections of a position once. A subtree already searched to the same
+# depth is not searched again, so the work grows more slowly with depth.
+# Subtrees are always matched by Rules.getHash, as a translated position can
+# shift differently, so does not have the same subtree. With several workers
+# each has its own table of subtrees, and the leaves are merged at the end.
+#
+# Any change to Board, BitBoard or Rules should leave every count unchanged.
+# The counts from the start of the standard game are in README.md.
+
+
+class PerftCounter:
+    '''
+    Counts move sequences or distinct states below a position, see the top of Perft.py
+    '''
+    def __init__(self, dedup=False, canonical=False, includeShifts=True):
+        self.dedup = dedup or canonical
+        self.canonical = canonical
+        self.includeShifts = includeShifts
+        self.nodes = 0
+        # Keys of the states reached at the full depth
+        self.leaves = set()
+        # (key, depth left) of the states already searched
+        self.searched = set()
+
+
+    def getLeafKey(self, rules):
+        return rules.getCanonicalHash()[0] if self.canonical else rules.getHash()
+
+
+    def count(self, rules, depth):
+        '''
+        Returns the move sequences of length depth from the position.
+        When deduplicating, adds the states reached to leaves and returns
+        the number of them newly found.
+        '''
+        if (self.dedup):
+            if (depth == 0):
+                key = self.getLeafKey(rules)
+                if (key in self.leaves):
+                    return 0
+                self.leaves.add(key)
+                return 1
+            key = (rules.getHash(), depth)
+            if (key in self.searched):
+                return 0
+            self.searched.add(key)
+        elif (depth == 0):
+            return 1
+
+        total = 0
+        for move in rules.getLegalMoves(self.includeShifts):
+            rules.makeMove(move)
+            self.nodes += 1
+            total += self.count(rules, depth - 1)
+            rules.unmakeMove()
+        return total
+
+
+def perft(rules, depth, dedup=False, canonical=False, includeShifts=True):
+    '''
+    Returns the move sequences of length depth from the position of the
+    rules, or the distinct states at depth when deduplicating
+    '''
+    return PerftCounter(dedup, canonical, includeShifts).count(rules.copy(), depth)
+
+
+def _countSubtree(args):
+    '''
+    Counts below one root move in a worker process.
+    Returns (move, count, leaf keys, nodes).
+    '''
+    rules, move, depth, dedup, canonical, includeShifts = args
+    counter = PerftCounter(dedup, canonical, includeShifts)
+    rules.makeMove(move)
+    count = counter.count(rules, depth - 1)
+    return move, count, counter.leaves, counter.nodes + 1
+
+
+def divide(rules, depth, dedup=False, canonical=False, includeShifts=True, nWorkers=1):
+    '''
+    Splits the count at the root moves, which are counted in nWorkers processes.
+    Returns ({move: count}, total, nodes). When deduplicating, each move's
+    count is of the states below it, and the total is of the distinct
+    states below all of them.
+    '''
+    assert(depth >= 1)
+    jobs = [
+        (rules.copy(), move, depth, dedup, canonical, includeShifts)
+        for move in rules.getLegalMoves(includeShifts)]
+    if (nWorkers > 1):
+        with Pool(nWorkers) as pool:
+            results = pool.map(_countSubtree, jobs)
+    else:
+        results = map(_countSubtree, jobs)
+
+    counts = {}
+    leaves = set()
+    nodes = 0
+    for move, count, subtreeLeaves, subtreeNodes in results:
+        counts[move] = count
+        leaves |= subtreeLeaves
+        nodes += subtreeNodes
+    total = len(leaves) if (dedup or canonical) else sum(counts.values())
+    return counts, total, nodes
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Counts the move tree below a position, to check and time move generation")
+    parser.add_argument("depth", type=int, help="Number of moves to count to")
+    parser.add_argument("--size", type=int, default=5, help="Width of the square board (default: 5)")
+    parser.add_argument("--starting-beads", type=int,
+        help="Beads per player (default: two thirds of the spaces, 17 on 5x5)")
+    parser.add_argument("--clearance-removals", type=int,
+        help="Beads each player removes when the board fills (default: a quarter of the spaces, 6 on 5x5)")
+    parser.add_argument("--moves", default="",
+        help="Moves to play from the start first, in move notation separated by spaces, e.g. \"P2,2 P1,1 SU\"")
+    parser.add_argument("--position",
+        help="Position to start from, encoded by PositionCodec.encodePosition as hex (overrides the board options)")
+    parser.add_argument("--dedup", action="store_true", help="Count distinct states rather than move sequences")
+    parser.add_argument("--canonical", action="store_true",
+        help="Count distinct states, counting every translation, rotation and reflection of one once")
+    parser.add_argument("--no-shifts", action="store_true", help="Leave out shifts")
+    parser.add_argument("--divide", action="store_true", help="Show the count below each move from the position")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+        help="Number of worker processes, splitting the tree at its root (default: number of CPUs)")
+    return parser.parse_args()
+
+
+def main():
+    '''
+    Main function
+    '''
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        level=logging.WARNING,
+        datefmt='%H:%M:%S')
+    args = parseArgs()
+
+    if (args.position):
+        rules = decodePosition(bytes.fromhex(args.position))
+    else:
+        rules = Rules(BitBoard(args.size), args.starting_beads, args.clearance_removals)
+    for notation in args.moves.split():
+        move = Move.fromNotation(notation)
+        if (not rules.isLegalMove(move)):
+            raise SystemExit("Illegal move {} in position {}".format(notation, encodePosition(rules).hex()))
+        rules.makeMove(move)
+
+    print("Position {}".format(encodePosition(rules).hex()))
+    includeShifts = not args.no_shifts
+    for depth in range(1, args.depth + 1):
+        startTime = time.perf_counter()
+        counts, total, nodes = divide(
+            rules, depth, args.dedup, args.canonical, includeShifts, args.workers)
+        elapsed = time.perf_counter() - startTime
+        print("Depth {:>2}: {:>14,} {} {:>8.2f} s {:>12,.0f} nodes/s".format(
+            depth, total, "states" if (args.dedup or args.canonical) else "leaves",
+            elapsed, nodes / max(elapsed, 1e-9)))
+
+    if (args.divide and args.depth >= 1):
+        print()
+        for move, count in sorted(counts.items(), key=lambda item: item[0].toNotation()):
+            print("{:<10} {:,}".format(move.toNotation(), count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import random
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from MCTS import MCTSSearch, getPlayoutMove
+from Search import AlphaBetaSearch
+from Tablebase import Tablebase
+
+
+class Player:
+    '''
+    Base class for players
+    '''
+    # Keyword arguments accepted by the constructor, used by createPlayer
+    OPTIONS = ()
+
+    def __init__(self, name):
+        self.name = name
+
+
+    def getName(self):
+        return self.name
+
+
+    def isHuman(self):
+        return False
+
+
+    def newGame(self):
+        '''
+        Called before the player starts a new game
+        '''
+        pass
+
+
+    def close(self):
+        '''
+        Releases anything the player holds once it will not be used again, such as worker processes
+        '''
+        pass
+
+
+    def chooseMove(self, rules, isCancelled=None):
+        '''
+        Returns the move to play in the current state of the rules.
+        Players which think for a while stop early once isCancelled, if
+        given, returns True. The move returned is then to be discarded.
+        '''
+        raise NotImplementedError
+
+
+class TablebasePlayer(Player):
+    '''
+    Base class for computer players which play perfectly from the positions
+    solved in a tablebase file, opened on first use
+    '''
+    def __init__(self, name, tablebase=None):
+        Player.__init__(self, name)
+        self.tablebasePath = tablebase
+        self.tablebase = None
+
+
+    def getTablebaseMove(self, rules):
+        '''
+        Returns the best move if the tablebase has the position as a win or
+        loss, or None to search. Drawn positions are searched, so that an
+        opponent's mistakes can still be found.
+        '''
+        if (self.tablebasePath is None):
+            return None
+        if (self.tablebase is None):
+            self.tablebase = Tablebase(self.tablebasePath)
+        if (not self.tablebase.probe(rules)):
+            return None
+        return self.tablebase.getBestMove(rules)
+
+
+class HumanPlayer(Player):
+    '''
+    Player whose moves are input through the window
+    '''
+    def __init__(self):
+        Player.__init__(self, "human")
+
+
+    def isHuman(self):
+        return True
+
+
+class RandomPlayer(Player):
+    '''
+    Computer player making the lightly guided random moves used in MCTS playouts
+    '''
+    OPTIONS = ("seed",)
+
+    def __init__(self, seed=None):
+        Player.__init__(self, "random")
+        self.rng = random.Random(seed)
+
+
+    def chooseMove(self, rules, isCancelled=None):
+        if (rules.isStateRemoval()):
+            return self.rng.choice(rules.getLegalMoves())
+        return getPlayoutMove(rules, self.rng)
+
+
+class AlphaBetaPlayer(TablebasePlayer):
+    '''
+    Computer player using alpha-beta search within a per-move time budget
+    '''
+    OPTIONS = ("timeBudget", "maxDepth", "tablebase")
+
+    def __init__(self, timeBudget=0.05, maxDepth=64, tablebase=None):
+        TablebasePlayer.__init__(self, "alphabeta", tablebase)
+        self.timeBudget = timeBudget
+        self.maxDepth = maxDepth
+        self.search = AlphaBetaSearch()
+
+
+    def chooseMove(self, rules, isCancelled=None):
+        move = self.getTablebaseMove(rules)
+        if (move is None):
+            move = self.search.findBestMove(
+                rules, self.timeBudget, self.maxDepth, allowShifts=not rules.lastMoveWasShift,
+                isCancelled=isCancelled)
+        return move
+
+
+class MCTSPlayer(TablebasePlayer):
+    '''
+    Computer player using Monte Carlo tree search, spread over nWorkers processes
+    '''
+    OPTIONS = ("timeBudget", "nWorkers", "tablebase")
+
+    def __init__(self, timeBudget=1.0, nWorkers=None, tablebase=None):
+        TablebasePlayer.__init__(self, "mcts", tablebase)
+        self.timeBudget = timeBudget
+        self.search = MCTSSearch(nWorkers)
+
+
+    def close(self):
+        self.search.close()
+
+
+    def chooseMove(self, rules, isCancelled=None):
+        move = self.getTablebaseMove(rules)
+        if (move is None):
+            move = self.search.findBestMove(
+                rules, self.timeBudget, allowShifts=not rules.lastMoveWasShift, isCancelled=isCancelled)
+        return move
+
+
+PLAYER_TYPES = {
+    "human": HumanPlayer,
+    "random": RandomPlayer,
+    "alphabeta": AlphaBetaPlayer,
+    "mcts": MCTSPlayer,
+}
+
+
+def createPlayer(name, **kwargs):
+    '''
+    Creates a player from its registered name.
+    Options which the player type does not take, or which are None, are ignored.
+    '''
+    if name not in PLAYER_TYPES:
+        raise ValueError("Unknown player type '{}'. Options are: {}".format(
+            name, ", ".join(sorted(PLAYER_TYPES))))
+    playerType = PLAYER_TYPES[name]
+    return playerType(**{
+        key: value for key, value in kwargs.items()
+        if key in playerType.OPTIONS and value is not None})
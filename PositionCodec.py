@@ -0,0 +1,140 @@
+import struct
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from BitBoard import BitBoard
+from Rules import Rules
+from Symmetry import getCanonicalForm, toCanonicalCoor
+
+
+# Compact position encoding.
+#
+# A position is _HEADER (board size, starting beads, clearance removals,
+# state flags, clearance removals left and the index of the bead staged for
+# removal, or NO_STAGED) followed by the spaces packed in base 3 as a
+# little-endian integer: space i (x*size + y) is the digit of 3**i, 0 for
+# empty, 1 for player 1 and 2 for player 2. The standard board's 25 spaces
+# take 5 bytes, rather than the 7 of two bitmasks.
+#
+# The beads each player has left follow from the starting beads and those on
+# the board, so are not stored. Scores are not part of a position.
+_HEADER = struct.Struct("<BHHBHH")
+
+NO_STAGED = 0xFFFF
+
+# State flags
+_P1_TURN = 1
+_FINISHED = 2
+_IN_CLEARANCE = 4
+_IN_REMOVAL = 8
+
+# Spaces are packed _CHUNK_BITS at a time. As digits never carry, a chunk's
+# base 3 value is that of player 1's bits plus twice that of player 2's.
+_CHUNK_BITS = 8
+_CHUNK_BASE = 3 ** _CHUNK_BITS
+
+# Base 3 value of each chunk of a mask, with a digit of 1 for each set bit
+_TO_BASE3 = [sum(3 ** i for i in range(_CHUNK_BITS) if (bits >> i) & 1) for bits in range(1 << _CHUNK_BITS)]
+
+# (player 1 bits, player 2 bits) of each chunk value, built by the first
+# decode as it takes a noticeable part of starting the game
+_FROM_BASE3 = None
+
+
+def _getFromBase3():
+    global _FROM_BASE3
+    if (_FROM_BASE3 is None):
+        table = [None] * _CHUNK_BASE
+        for p1 in range(1 << _CHUNK_BITS):
+            for p2 in range(1 << _CHUNK_BITS):
+                if (not p1 & p2):
+                    table[_TO_BASE3[p1] + 2 * _TO_BASE3[p2]] = (p1, p2)
+        _FROM_BASE3 = table
+    return _FROM_BASE3
+
+
+def packSpaces(p1, p2, nSpaces):
+    '''
+    Returns the base 3 packing of two bead masks as bytes
+    '''
+    chunkMask = (1 << _CHUNK_BITS) - 1
+    value = 0
+    for shift in reversed(range(0, nSpaces, _CHUNK_BITS)):
+        value = value * _CHUNK_BASE + _TO_BASE3[(p1 >> shift) & chunkMask] + 2 * _TO_BASE3[(p2 >> shift) & chunkMask]
+    return value.to_bytes(getPackedLength(nSpaces), "little")
+
+
+def unpackSpaces(data, nSpaces):
+    '''
+    Inverse of packSpaces, returning (p1, p2)
+    '''
+    fromBase3 = _getFromBase3()
+    value = int.from_bytes(data, "little")
+    p1 = p2 = 0
+    for shift in range(0, nSpaces, _CHUNK_BITS):
+        value, digits = divmod(value, _CHUNK_BASE)
+        chunkP1, chunkP2 = fromBase3[digits]
+        p1 |= chunkP1 << shift
+        p2 |= chunkP2 << shift
+    return p1, p2
+
+
+def getPackedLength(nSpaces):
+    '''
+    Returns the bytes taken by nSpaces spaces in base 3
+    '''
+    return ((3 ** nSpaces - 1).bit_length() + 7) // 8
+
+
+def _encode(rules, p1, p2, staged):
+    size = rules.board.size
+    flags = (
+        (_P1_TURN if rules.p1Turn else 0) |
+        (_FINISHED if rules.isFinished else 0) |
+        (_IN_CLEARANCE if rules.inClearance else 0) |
+        (_IN_REMOVAL if rules.inRemoval else 0) )
+    stagedIndex = staged[0] * size + staged[1] if rules.inRemoval else NO_STAGED
+    return (
+        _HEADER.pack(size, rules.startingBeads, rules.clearanceRemovals, flags, rules.clearanceCount, stagedIndex) +
+        packSpaces(p1, p2, size * size) )
+
+
+def encodePosition(rules):
+    '''
+    Returns the position of the rules as bytes
+    '''
+    board = rules.board
+    return _encode(rules, board.p1, board.p2, rules.stagedForRemoval)
+
+
+def encodeCanonicalPosition(rules):
+    '''
+    Returns the canonical form of the position as bytes, the same for every
+    translation, rotation and reflection of it, and the transform from the
+    board to the canonical form (see Symmetry.getCanonicalForm)
+    '''
+    board = rules.board
+    p1, p2, transform = getCanonicalForm(board.p1, board.p2, board.size)
+    staged = toCanonicalCoor(rules.stagedForRemoval, transform) if rules.inRemoval else None
+    return _encode(rules, p1, p2, staged), transform
+
+
+def decodePosition(data):
+    '''
+    Returns headless rules in the encoded position, with no undo history
+    '''
+    size, startingBeads, clearanceRemovals, flags, clearanceCount, stagedIndex = _HEADER.unpack_from(data)
+    p1, p2 = unpackSpaces(data[_HEADER.size:], size * size)
+
+    rules = Rules(BitBoard(size), startingBeads, clearanceRemovals)
+    rules.board.setMasks(p1, p2)
+    rules.p1Turn = bool(flags & _P1_TURN)
+    rules.isFinished = bool(flags & _FINISHED)
+    rules.inClearance = bool(flags & _IN_CLEARANCE)
+    rules.inRemoval = bool(flags & _IN_REMOVAL)
+    rules.stagedForRemoval = divmod(stagedIndex, size) if rules.inRemoval else None
+    rules.clearanceCount = clearanceCount
+    return rules
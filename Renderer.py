@@ -0,0 +1,245 @@
+import pygame
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from BitBoard import popcount
+import Colours as colour
+
+
+class Renderer:
+    '''
+    Draws the display and board, only updating the parts of the window which changed.
+
+    The white background, grid lines and the circles around the bead counts
+    and scores never change, so are drawn once onto a background layer.
+    Everything else is blitted from cached sprites: one per bead colour and
+    outline, and one per string of text.
+
+    Changed beads are found by comparing the board masks with those last
+    drawn, so the cost of a frame depends on what changed rather than on the
+    size of the board. The victory cross, drawn under the beads, and the
+    text, drawn over them, are compared with the previous frame as sprites.
+    Only the rectangles which changed are repainted and passed to
+    pygame.display.update.
+    '''
+    # Redraw everything when more spaces than this change, e.g. after a shift
+    MAX_DIRTY_SPACES = 64
+
+    def __init__(self, surface, display, board):
+        self.surface = surface
+        self.display = display
+        self.board = board
+
+        self.background = None
+        self.beadSprites = {}
+        self.textSprites = {}
+        self.rectSprites = {}
+        self.shadeSprites = {}
+
+        # State last drawn. drawn holds {key: rect} of the overlay sprites.
+        self.drawn = None
+        self.p1 = 0
+        self.p2 = 0
+        self.highlight = None
+
+
+    def invalidate(self):
+        '''
+        Forces the whole window to be redrawn on the next call to draw
+        '''
+        self.drawn = None
+
+
+    def draw(self):
+        '''
+        Brings the window up to date.
+        Returns the rectangles which were updated.
+        '''
+        dirty = self.render()
+        self.present(dirty)
+        return dirty
+
+
+    def render(self):
+        '''
+        Redraws the changed parts of the surface without showing them.
+        Returns the rectangles which changed.
+        '''
+        board = self.board
+        if (self.background is None):
+            self.background = self._drawBackground()
+
+        under, over = self._getOverlays()
+        current = {key: rect for key, _, rect in under + over}
+
+        changed = (board.p1 ^ self.p1) | (board.p2 ^ self.p2)
+        if (board.highlight != self.highlight):
+            for coor in (board.highlight, self.highlight):
+                if (coor is not None):
+                    changed |= board._getBit(coor)
+
+        if (self.drawn is None or popcount(changed) > self.MAX_DIRTY_SPACES):
+            self.surface.blit(self.background, (0, 0))
+            for _, sprite, rect in under:
+                self.surface.blit(sprite, rect)
+            for beadColour, centre, width in board.iterBeads():
+                sprite = self._getBeadSprite(beadColour, board.beadRadius, width)
+                self.surface.blit(sprite, sprite.get_rect(center=centre))
+            for _, sprite, rect in over:
+                self.surface.blit(sprite, rect)
+            dirty = [self.surface.get_rect()]
+        else:
+            dirty = [self._getSpaceRect(coor) for coor in board.iterCoors(changed)]
+            dirty += [rect for key, rect in current.items() if key not in self.drawn]
+            dirty += [rect for key, rect in self.drawn.items() if key not in current]
+            for dirtyRect in dirty:
+                self._repaint(dirtyRect, under, over)
+
+        self.drawn = current
+        self.p1, self.p2, self.highlight = board.p1, board.p2, board.highlight
+        return dirty
+
+
+    def present(self, dirty):
+        '''
+        Shows the rectangles of the surface returned by render
+        '''
+        if (dirty == [self.surface.get_rect()]):
+            pygame.display.flip()
+        elif (dirty):
+            pygame.display.update(dirty)
+
+
+    def _repaint(self, dirtyRect, under, over):
+        '''
+        Redraws the background, beads and overlays within a rectangle
+        '''
+        board = self.board
+        self.surface.set_clip(dirtyRect)
+        self.surface.blit(self.background, dirtyRect, dirtyRect)
+        for _, sprite, rect in under:
+            if (rect.colliderect(dirtyRect)):
+                self.surface.blit(sprite, rect)
+
+        # Beads are drawn in the same order as a full redraw, player 1 first
+        coors = self._getCoorsNear(dirtyRect)
+        for beadColour, isPlayer in [(colour.RED, board.isP1), (colour.BLUE, board.isP2)]:
+            for coor in coors:
+                if (isPlayer(coor)):
+                    width = 1 if board.highlight == coor else 0
+                    sprite = self._getBeadSprite(beadColour, board.beadRadius, width)
+                    self.surface.blit(sprite, sprite.get_rect(center=board.grid.getBoxCentre(coor)))
+
+        for _, sprite, rect in over:
+            if (rect.colliderect(dirtyRect)):
+                self.surface.blit(sprite, rect)
+        self.surface.set_clip(None)
+
+
+    def _drawBackground(self):
+        background = pygame.Surface(self.surface.get_size()).convert(self.surface)
+        background.fill(colour.WHITE)
+        for circleColour, centre, radius, width in self.display.iterCircles(self.surface):
+            pygame.draw.circle(background, circleColour, centre, radius, width)
+        self.board.grid.drawLines(background)
+        return background
+
+
+    ### Geometry functions
+
+    def _getSpaceRect(self, coor):
+        '''
+        Returns the rectangle covered by a bead in a space
+        '''
+        radius = self.board.beadRadius
+        rect = pygame.Rect(0, 0, 2*radius + 2, 2*radius + 2)
+        rect.center = self.board.grid.getBoxCentre(coor)
+        return rect
+
+
+    def _getCoorsNear(self, rect):
+        '''
+        Returns the coordinates of the spaces whose beads could overlap a rectangle
+        '''
+        grid = self.board.grid
+        n = grid.nSpaces
+        reach = self.board.beadRadius + 1
+
+        def getRange(low, high, origin, dimension):
+            first = int(n * (low - reach - origin)/float(dimension)) - 1
+            last = int(n * (high + reach - origin)/float(dimension)) + 1
+            return range(max(first, 0), min(last, n - 1) + 1)
+
+        xs = getRange(rect.left, rect.right, grid.origin[0], grid.dimensions[0])
+        ys = getRange(rect.top, rect.bottom, grid.origin[1], grid.dimensions[1])
+        return [(x, y) for x in xs for y in ys]
+
+
+    ### Sprite functions
+
+    def _getOverlays(self):
+        '''
+        Returns lists of (key, sprite, rect) for the analysis shading and the
+        victory cross, which are drawn under the beads, and the text, which is
+        drawn over them.
+        The key identifies the pixels drawn.
+        '''
+        under = []
+        for rect, shadeColour in self.board.grid.getShadeRects():
+            sprite = self._getShadeSprite(rect.size, shadeColour)
+            under.append((("shade", tuple(rect), shadeColour), sprite, rect))
+        for rect in self.board.grid.getVictoryRects():
+            sprite = self._getRectSprite(rect.size)
+            under.append((("rect", tuple(rect)), sprite, rect))
+
+        over = []
+        usedText = {}
+        for string, centre in self.display.iterTexts(self.surface):
+            sprite = self._getTextSprite(string)
+            usedText[string] = sprite
+            rect = sprite.get_rect(center=centre)
+            over.append((("text", string, tuple(rect)), sprite, rect))
+        # Drop text which is no longer shown, so the cache does not grow
+        self.textSprites = usedText
+
+        return under, over
+
+
+    def _getBeadSprite(self, beadColour, radius, width):
+        key = (beadColour, radius, width)
+        sprite = self.beadSprites.get(key)
+        if (sprite is None):
+            # One spare pixel around the circle, so it is drawn as at any other centre
+            sprite = pygame.Surface((2*radius + 2, 2*radius + 2), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, beadColour, (radius + 1, radius + 1), radius, width)
+            self.beadSprites[key] = sprite
+        return sprite
+
+
+    def _getTextSprite(self, string):
+        sprite = self.textSprites.get(string)
+        if (sprite is None):
+            sprite = self.display.font.render(string, False, colour.BLACK)
+        return sprite
+
+
+    def _getRectSprite(self, size):
+        sprite = self.rectSprites.get(size)
+        if (sprite is None):
+            sprite = pygame.Surface(size)
+            sprite.fill(colour.BLACK)
+            self.rectSprites[size] = sprite
+        return sprite
+
+
+    def _getShadeSprite(self, size, shadeColour):
+        key = (size, shadeColour)
+        sprite = self.shadeSprites.get(key)
+        if (sprite is None):
+            sprite = pygame.Surface(size, pygame.SRCALPHA)
+            sprite.fill(shadeColour)
+            self.shadeSprites[key] = sprite
+        return sprite
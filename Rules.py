@@ -0,0 +1,588 @@
+import random
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from BitBoard import BitBoard
+from GameState import GameState
+from Moves import Move
+from Symmetry import getCanonicalForm, toCanonicalCoor
+
+
+class _StateKeys:
+    '''
+    Zobrist keys for the parts of the game state not stored on the board
+    '''
+    def __init__(self, nSpaces):
+        self.nSpaces = nSpaces
+        rng = random.Random(-nSpaces)
+        self.p1Turn = rng.getrandbits(64)
+        self.finished = rng.getrandbits(64)
+        self.clearance = [rng.getrandbits(64) for _ in range(nSpaces + 1)]
+        self.staged = [rng.getrandbits(64) for _ in range(nSpaces)]
+
+
+    def extendClearance(self, clearanceRemovals):
+        '''
+        Adds keys for clearance counts up to clearanceRemovals, beyond the
+        nSpaces + 1 made at first. Each comes from its own generator, so keys
+        are the same whatever order the tables are extended in.
+        '''
+        for count in range(len(self.clearance), clearanceRemovals + 1):
+            self.clearance.append(random.Random("{} {}".format(self.nSpaces, count)).getrandbits(64))
+
+
+_stateKeysBySize = {}
+
+_SHIFTS = {"UP": "shiftUp", "DOWN": "shiftDown", "LEFT": "shiftLeft", "RIGHT": "shiftRight"}
+_OPPOSITE_DIRECTIONS = {"UP": "DOWN", "DOWN": "UP", "LEFT": "RIGHT", "RIGHT": "LEFT"}
+
+
+def _getStateKeys(size, clearanceRemovals=0):
+    '''
+    Returns the keys for a board size, with a clearance key for each count up to clearanceRemovals
+    '''
+    keys = _stateKeysBySize.get(size)
+    if keys is None:
+        keys = _StateKeys(size * size)
+        _stateKeysBySize[size] = keys
+    if (clearanceRemovals >= len(keys.clearance)):
+        keys.extendClearance(clearanceRemovals)
+    return keys
+
+
+def getDefaultStartingBeads(size):
+    '''
+    Beads each player starts with on a board of the given size.
+    Two thirds of the spaces, so the board can fill (17 on the standard 5x5 board).
+    '''
+    return (2 * size * size + 2) // 3
+
+
+def getDefaultClearanceRemovals(size):
+    '''
+    Beads removed when the board of the given size fills.
+    A quarter of the spaces (6 on the standard 5x5 board).
+    '''
+    return size * size // 4
+
+
+class ScoreKeeper:
+    def __init__(self):
+        self.scores = {1: 0, -1:0}
+
+
+    def recordP1Win(self):
+        self.scores[1] += 1
+
+
+    def recordP2Win(self):
+        self.scores[-1] += 1
+
+
+    def getP1Score(self):
+        return self.scores[1]
+
+
+    def getP2Score(self):
+        return self.scores[-1]
+
+
+class Rules:
+    '''
+    Handles the game rules and state machine.
+    Has no pygame dependency, so can be driven headlessly by board coordinates.
+    Rules parameters left as None are derived from the board size.
+    '''
+    def __init__(self, board=None, startingBeads=None, clearanceRemovals=None):
+        self.board = board if board is not None else BitBoard()
+        size = self.board.size
+        self.startingBeads = startingBeads if startingBeads is not None else getDefaultStartingBeads(size)
+        self.clearanceRemovals = (
+            clearanceRemovals if clearanceRemovals is not None else getDefaultClearanceRemovals(size))
+        # getHash has a key for every clearance count
+        _getStateKeys(size, self.clearanceRemovals)
+        self.scores = ScoreKeeper()
+
+        self.p1Turn = False # Will be set to true by _advanceState call
+        self.isFinished = False
+
+        self.inRemoval = False
+        self.stagedForRemoval = None
+
+        # Used to remove beads when board is full
+        self.inClearance = False
+        self.clearanceCount = 0
+
+        # Shifts keep the turn, so computer players do not follow one with another
+        self.lastMoveWasShift = False
+
+        # Used to undo moves applied with makeMove
+        self.undoStack = []
+
+        self._advanceState()
+
+
+    def reset(self):
+        logging.info("Resetting game state")
+        self.board.reset()
+        self.isFinished = False
+
+        # Reset removal variables
+        self.inRemoval = False
+        self.stagedForRemoval = None
+
+        # Reset clearance variables
+        self.inClearance = False
+        self.clearanceCount = 0
+
+        self.lastMoveWasShift = False
+        self.undoStack = []
+        self.processNewState()
+
+
+    def copy(self):
+        '''
+        Returns an independent headless copy of the game state.
+        The undo history is not copied.
+        '''
+        rules = Rules.__new__(Rules)
+        rules.startingBeads = self.startingBeads
+        rules.clearanceRemovals = self.clearanceRemovals
+        rules.scores = ScoreKeeper()
+        rules.scores.scores = dict(self.scores.scores)
+        rules.board = self.board.copy()
+        rules.p1Turn = self.p1Turn
+        rules.isFinished = self.isFinished
+        rules.inRemoval = self.inRemoval
+        rules.stagedForRemoval = self.stagedForRemoval
+        rules.inClearance = self.inClearance
+        rules.clearanceCount = self.clearanceCount
+        rules.lastMoveWasShift = self.lastMoveWasShift
+        rules.undoStack = []
+        return rules
+
+
+    def getGameState(self):
+        '''
+        Returns an immutable snapshot of the game state, see GameState
+        '''
+        return GameState(
+            self.board.size, self.startingBeads, self.clearanceRemovals,
+            self.board.p1, self.board.p2, self.p1Turn, self.isFinished,
+            self.inRemoval, self.stagedForRemoval, self.inClearance, self.clearanceCount,
+            self.scores.scores[1], self.scores.scores[-1], self.lastMoveWasShift )
+
+
+    def setGameState(self, state):
+        '''
+        Restores a snapshot taken by getGameState on a board of the same size.
+        The undo history is cleared.
+        '''
+        assert(state.size == self.board.size)
+        self.board.setMasks(state.p1, state.p2)
+        self.startingBeads = state.startingBeads
+        self.clearanceRemovals = state.clearanceRemovals
+        _getStateKeys(state.size, self.clearanceRemovals)
+        self.p1Turn = state.p1Turn
+        self.isFinished = state.isFinished
+        self.inRemoval = state.inRemoval
+        self.stagedForRemoval = state.stagedForRemoval
+        self.inClearance = state.inClearance
+        self.clearanceCount = state.clearanceCount
+        self.scores.scores[1], self.scores.scores[-1] = state.p1Score, state.p2Score
+        self.lastMoveWasShift = state.lastMoveWasShift
+        self.undoStack = []
+
+
+    ### State management functions
+
+    def isP1Turn(self):
+        return self.p1Turn
+
+
+    def isP2Turn(self):
+        return not self.p1Turn
+
+
+    def getP1NBeads(self):
+        return self.startingBeads - self.board.countP1Beads()
+
+
+    def getP2NBeads(self):
+        return self.startingBeads - self.board.countP2Beads()
+
+
+    def setStateFinished(self):
+        assert(not self.isFinished)
+        self.isFinished = True
+
+
+    def setStateClearance(self):
+        logging.info("Entering clearance state")
+        assert(not self.inRemoval)
+        self.clearanceCount = self.clearanceRemovals
+        self.inClearance = True
+
+
+    def unsetStateClearance(self):
+        logging.info("Leaving clearance state")
+        assert(self.inClearance)
+        assert(self.clearanceCount == 0)
+        self.inClearance = False
+
+
+    def setStateRemoval(self, coor):
+        '''
+        Stage a bead for removal and update state
+        '''
+        logging.info("Entering removal state")
+        assert(not self.inClearance)
+        self.stagedForRemoval = coor
+        self.inRemoval = True
+
+
+    def unsetStateRemoval(self):
+        logging.info("Leaving removal state")
+        assert(self.inRemoval)
+        self.stagedForRemoval = None
+        self.inRemoval = False
+
+
+    def getHash(self):
+        '''
+        Returns a hash of the full game state.
+        Combines the incrementally maintained board hash with Zobrist keys
+        for the turn and phase.
+        '''
+        keys = _getStateKeys(self.board.size)
+        h = self.board.hash
+        if (self.p1Turn):
+            h ^= keys.p1Turn
+        if (self.isFinished):
+            h ^= keys.finished
+        if (self.inClearance):
+            h ^= keys.clearance[self.clearanceCount]
+        if (self.inRemoval):
+            x, y = self.stagedForRemoval
+            h ^= keys.staged[x * self.board.size + y]
+        return h
+
+
+    def getCanonicalHash(self):
+        '''
+        Returns a hash of the full game state which is the same for every
+        translation, rotation and reflection of the position, and the transform
+        from the board to its canonical form (see Symmetry.getCanonicalForm)
+        '''
+        board = self.board
+        keys = _getStateKeys(board.size)
+        p1, p2, transform = getCanonicalForm(board.p1, board.p2, board.size)
+        h = hash((p1, p2))
+        if (self.p1Turn):
+            h ^= keys.p1Turn
+        if (self.isFinished):
+            h ^= keys.finished
+        if (self.inClearance):
+            h ^= keys.clearance[self.clearanceCount]
+        if (self.inRemoval):
+            x, y = toCanonicalCoor(self.stagedForRemoval, transform)
+            h ^= keys.staged[x * board.size + y]
+        return h, transform
+
+
+    def isStateFinished(self):
+        return self.isFinished
+
+
+    def isStateRegular(self):
+        return not (self.isFinished or self.inClearance or self.inRemoval)
+
+
+    def isStateClearance(self):
+        return self.inClearance
+
+
+    def isStateRemoval(self):
+        return self.inRemoval
+
+
+    ### State update functions
+
+    def updateTurn(self):
+        '''
+        Alternates the players' turns each call
+        '''
+        self.p1Turn = not self.p1Turn
+
+
+    def processNewState(self):
+        '''
+        Updates the game state based on the state of the board
+        '''
+        logging.info("Processing game state")
+        self.lastMoveWasShift = False
+        if (self.board.isVictory()):
+            self.setStateFinished()
+            if self.isP1Turn():
+                logging.info("Player 1 wins!")
+                self.scores.recordP1Win()
+            else:
+                logging.info("Player 2 wins!")
+                self.scores.recordP2Win()
+        else:
+            if (self.board.isFull()):
+                self.setStateClearance()
+            elif (self.isStateClearance() and self.clearanceCount == 0):
+                self.unsetStateClearance()
+
+            if (not self.isStateRemoval()):
+                self.updateTurn()
+
+
+    def processCoor(self, coor, isOnBead=None):
+        '''
+        Process a selection of a board coordinate based on the game state.
+        isOnBead defaults to whether the space holds a bead.
+        '''
+        if (self.isFinished):
+            return
+
+        if (isOnBead is None):
+            isOnBead = not self.board.isSpaceEmpty(coor)
+
+        if (self.isStateClearance() and isOnBead):
+            self.runClearance(coor)
+            self.processNewState()
+        else:
+            if (self.isStateRemoval() and isOnBead):
+                if (coor  == self.stagedForRemoval):
+                    # If selected space is already staged, needs to be unstaged
+                    self.unsetStateRemoval()
+                elif (self.board.areP1AndP2(coor, self.stagedForRemoval)):
+                    # If selected space is controlled by a different player, remove both
+                    self.board.setEmpty(coor)
+                    self.board.setEmpty(self.stagedForRemoval)
+                    self.unsetStateRemoval()
+                    self.processNewState()
+            elif (self.board.isSpaceEmpty(coor)):
+                # If space is empty, check if move is legal and add a bead if so
+                if (self.isP1Turn() and not self.board.isSpaceSurroundedByP2(coor) and self.getP1NBeads() > 0):
+                    self.board.setP1(coor)
+                    self.processNewState()
+                elif (self.isP2Turn() and not self.board.isSpaceSurroundedByP1(coor) and self.getP2NBeads() > 0):
+                    self.board.setP2(coor)
+                    self.processNewState()
+            elif (isOnBead):
+                # If space isn't empty and state isn't removal,
+                #   stage selected bead for removal
+                self.setStateRemoval(coor)
+                self.processNewState()
+
+
+    def runClearance(self, coor):
+        '''
+        Process clearance. Can only remove own beads.
+        '''
+        if ((self.isP1Turn() and self.board.isP1(coor)) or (self.isP2Turn() and self.board.isP2(coor))):
+            self.board.setEmpty(coor)
+            self.clearanceCount -= 1
+            assert(self.clearanceCount > -1)
+
+
+    def processShift(self, direction):
+        '''
+        Shifts all beads one space in a direction ("UP", "DOWN", "LEFT" or "RIGHT").
+        Shifts do not take a turn. Returns whether the shift was performed.
+        '''
+        if (self.isFinished):
+            return False
+
+        canShift, shift = {
+            "UP": (self.board.canShiftUp, self.board.shiftUp),
+            "DOWN": (self.board.canShiftDown, self.board.shiftDown),
+            "LEFT": (self.board.canShiftLeft, self.board.shiftLeft),
+            "RIGHT": (self.board.canShiftRight, self.board.shiftRight),
+        }[direction]
+
+        if (canShift()):
+            logging.info("Performing shift {}".format(direction.lower()))
+            shift()
+            self.lastMoveWasShift = True
+            return True
+        return False
+
+
+    ### Move generation functions
+
+    def getPlacementMask(self):
+        '''
+        Returns the mask of spaces the active player can place a bead in
+        '''
+        if (self.isP1Turn()):
+            if (self.getP1NBeads() <= 0):
+                return 0
+            return self.board.getEmptyMask() & ~self.board.getSurroundedByP2Mask()
+        else:
+            if (self.getP2NBeads() <= 0):
+                return 0
+            return self.board.getEmptyMask() & ~self.board.getSurroundedByP1Mask()
+
+
+    def getLegalMoves(self, includeShifts=True):
+        '''
+        Returns a list of all legal moves in the current state.
+        Removal pairs are returned as single moves rather than being staged.
+        While a bead is staged for removal, only pairs including it are returned.
+        '''
+        if (self.isFinished):
+            return []
+
+        board = self.board
+        if (self.isStateRemoval()):
+            # Only the bead already staged can be paired
+            staged = self.stagedForRemoval
+            others = board.p2 if board.isP1(staged) else board.p1
+            return [Move("REMOVE", staged, coor) for coor in board.iterCoors(others)]
+
+        moves = [Move("PLACE", coor) for coor in board.iterCoors(self.getPlacementMask())]
+
+        if (self.isStateClearance()):
+            own = board.p1 if self.isP1Turn() else board.p2
+            moves.extend(Move("CLEAR", coor) for coor in board.iterCoors(own))
+        else:
+            p2Coors = list(board.iterP2Coors())
+            moves.extend(
+                Move("REMOVE", coor1, coor2)
+                for coor1 in board.iterP1Coors() for coor2 in p2Coors)
+
+        if (includeShifts):
+            for direction, canShift in [
+                    ("UP", board.canShiftUp), ("DOWN", board.canShiftDown),
+                    ("LEFT", board.canShiftLeft), ("RIGHT", board.canShiftRight)]:
+                if (canShift()):
+                    moves.append(Move("SHIFT", direction=direction))
+
+        return moves
+
+
+    def isLegalMove(self, move):
+        '''
+        Returns whether a move is in getLegalMoves, without generating them.
+        The beads of a removal pair may be given in either order.
+        '''
+        if (self.isFinished):
+            return False
+        board = self.board
+        size = board.size
+        mType = move.mType
+
+        if (mType == "SHIFT"):
+            return (not self.isStateRemoval() and move.direction in _SHIFTS and
+                getattr(board, "canShift" + move.direction.capitalize())())
+
+        coors = [move.coor, move.coor2] if mType == "REMOVE" else [move.coor]
+        for coor in coors:
+            if (not (isinstance(coor, tuple) and len(coor) == 2 and 0 <= coor[0] < size and 0 <= coor[1] < size)):
+                return False
+
+        if (self.isStateRemoval()):
+            return (mType == "REMOVE" and self.stagedForRemoval in coors and
+                board.areP1AndP2(move.coor, move.coor2))
+        elif (mType == "PLACE"):
+            return bool(self.getPlacementMask() & board._getBit(move.coor))
+        elif (mType == "CLEAR"):
+            return self.isStateClearance() and (board.isP1 if self.isP1Turn() else board.isP2)(move.coor)
+        elif (mType == "REMOVE"):
+            return not self.isStateClearance() and board.areP1AndP2(move.coor, move.coor2)
+        return False
+
+
+    def _advanceState(self):
+        '''
+        Equivalent to processNewState, but without logging.
+        Used by makeMove, which may be called millions of times during search.
+        '''
+        if (self.board.isVictory()):
+            self.isFinished = True
+            self.scores.scores[1 if self.p1Turn else -1] += 1
+        else:
+            if (self.board.isFull()):
+                assert(not self.inRemoval)
+                self.clearanceCount = self.clearanceRemovals
+                self.inClearance = True
+            elif (self.inClearance and self.clearanceCount == 0):
+                self.inClearance = False
+
+            if (not self.inRemoval):
+                self.p1Turn = not self.p1Turn
+
+
+    def makeMove(self, move):
+        '''
+        Applies a legal move in place. The move can be reverted with unmakeMove.
+        '''
+        board = self.board
+        mType = move.mType
+
+        # Record the removed beads so they can be put back
+        removed = None
+        if (mType == "REMOVE"):
+            removed = (board.isP1(move.coor), board.isP1(move.coor2))
+        elif (mType == "CLEAR"):
+            removed = (board.isP1(move.coor),)
+
+        self.undoStack.append((
+            move, removed, self.p1Turn, self.isFinished,
+            self.inRemoval, self.stagedForRemoval,
+            self.inClearance, self.clearanceCount,
+            self.scores.scores[1], self.scores.scores[-1], self.lastMoveWasShift ))
+
+        if (mType == "PLACE"):
+            if (self.p1Turn):
+                board.setP1(move.coor)
+            else:
+                board.setP2(move.coor)
+        elif (mType == "REMOVE"):
+            board.setEmpty(move.coor)
+            board.setEmpty(move.coor2)
+            self.inRemoval = False
+            self.stagedForRemoval = None
+        elif (mType == "CLEAR"):
+            board.setEmpty(move.coor)
+            self.clearanceCount -= 1
+            assert(self.clearanceCount > -1)
+        else:
+            # Shifts do not take a turn, so the state is unchanged
+            getattr(board, _SHIFTS[move.direction])()
+            self.lastMoveWasShift = True
+            return
+
+        self.lastMoveWasShift = False
+        self._advanceState()
+
+
+    def unmakeMove(self):
+        '''
+        Reverts the last move applied with makeMove by applying its inverse
+        '''
+        (move, removed, self.p1Turn, self.isFinished,
+            self.inRemoval, self.stagedForRemoval,
+            self.inClearance, self.clearanceCount,
+            self.scores.scores[1], self.scores.scores[-1], self.lastMoveWasShift) = self.undoStack.pop()
+
+        board = self.board
+        mType = move.mType
+        if (mType == "PLACE"):
+            board.setEmpty(move.coor)
+        elif (mType == "SHIFT"):
+            # The edge just vacated is empty, so the opposite shift is possible
+            getattr(board, _SHIFTS[_OPPOSITE_DIRECTIONS[move.direction]])()
+        else:
+            for coor, isP1 in zip((move.coor, move.coor2), removed):
+                if (isP1):
+                    board.setP1(coor)
+                else:
+                    board.setP2(coor)
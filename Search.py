@@ -0,0 +1,305 @@
+import time
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from BitBoard import popcount
+from Symmetry import toCanonicalMove, fromCanonicalMove
+from TranspositionTable import TranspositionTable, EXACT, LOWER, UPPER
+
+
+INFINITY = 1 << 30
+WIN_SCORE = 100000
+# Scores beyond this are forced wins, offset by their distance in plies
+WIN_THRESHOLD = WIN_SCORE - 1000
+
+# Mixed into the hash of positions reached by a shift, where shifting is not allowed
+_AFTER_SHIFT_KEY = 0x9E3779B97F4A7C15
+
+
+class SearchTimeout(Exception):
+    '''
+    Raised inside the search when the time budget has run out
+    '''
+    pass
+
+
+def _countPressure(board, attacker, target):
+    '''
+    Scores how closely the target's interior beads are surrounded by the attacker
+    '''
+    size, interior = board.size, board.masks.interior
+    left = (attacker >> size) & interior
+    right = (attacker << size) & interior
+    up = (attacker >> 1) & interior
+    down = (attacker << 1) & interior
+
+    atLeastOne = left | right | up | down
+    atLeastTwo = (left & (right | up | down)) | (right & (up | down)) | (up & down)
+    atLeastThree = (left & right & (up | down)) | (up & down & (left | right))
+
+    return (
+        popcount(atLeastOne & target) +
+        3 * popcount(atLeastTwo & target) +
+        12 * popcount(atLeastThree & target) )
+
+
+def evaluate(rules):
+    '''
+    Static evaluation of the position from the point of view of the player to move
+    '''
+    board = rules.board
+    if (rules.isP1Turn()):
+        mine, theirs = board.p1, board.p2
+    else:
+        mine, theirs = board.p2, board.p1
+    return _countPressure(board, mine, theirs) - _countPressure(board, theirs, mine)
+
+
+class AlphaBetaSearch:
+    '''
+    Negamax search with alpha-beta pruning, iterative deepening and a time budget.
+    Moves are ordered by transposition table move, killer moves, then a static score.
+
+    Shifts do not take a turn, so they are searched without reducing the depth,
+    but two shifts in a row are not searched.
+
+    With canonical set, the transposition table is keyed on the canonical form
+    of positions, so translations, rotations and reflections of a position
+    share an entry. Moves are stored in the canonical form's coordinates.
+    '''
+    def __init__(self, ttEntries=1 << 18, checkInterval=64, canonical=True):
+        self.tt = TranspositionTable(ttEntries)
+        self.canonical = canonical
+        # Check the clock every checkInterval nodes (rounded to a power of two)
+        self.checkMask = (1 << (checkInterval.bit_length() - 1)) - 1
+
+        self.killers = []
+        self.deadline = None
+        self.isCancelled = None
+        self.partialBest = None
+
+        # Statistics from the last search
+        self.nodes = 0
+        self.depthReached = 0
+        self.bestValue = 0
+        self.elapsed = 0.
+
+
+    def findBestMove(self, rules, timeBudget=0.05, maxDepth=64, allowShifts=True, isCancelled=None):
+        '''
+        Returns the best move found within the time budget (in seconds).
+        The given rules are not modified.
+        isCancelled, if given, is polled with the clock and ends the search
+        early when it returns True.
+        '''
+        startTime = time.perf_counter()
+        self.deadline = startTime + timeBudget
+        self.isCancelled = isCancelled
+        rules = rules.copy()
+
+        self.tt.newSearch()
+        self.killers = [[] for _ in range(maxDepth * 2 + 2)]
+        self.nodes = 0
+        self.depthReached = 0
+        self.bestValue = 0
+
+        moves = rules.getLegalMoves(includeShifts=allowShifts)
+        if (len(moves) < 2):
+            self.elapsed = time.perf_counter() - startTime
+            return moves[0] if moves else None
+
+        bestMove = moves[0]
+        for depth in range(1, maxDepth + 1):
+            self.partialBest = None
+            try:
+                self.bestValue, bestMove = self._searchRoot(rules, moves, depth, bestMove)
+            except SearchTimeout:
+                # Moves completed before the timeout were searched against a full
+                # window, so the best of them is at least as good as the last iteration
+                if (self.partialBest is not None):
+                    bestMove = self.partialBest
+                break
+            self.depthReached = depth
+            if (abs(self.bestValue) >= WIN_THRESHOLD):
+                # Forced result found, deeper search will not change it
+                break
+
+        self.elapsed = time.perf_counter() - startTime
+        logging.debug("Searched to depth {} ({} nodes, {:.1f} ms): {} scores {}".format(
+            self.depthReached, self.nodes, 1000 * self.elapsed, bestMove, self.bestValue))
+        return bestMove
+
+
+    def scoreMoves(self, rules, moves, depth, isCancelled=None):
+        '''
+        Returns {move: value} for each move, searched to depth with a full
+        window, from the point of view of the player to move.
+        Raises SearchTimeout if isCancelled returns True.
+        The given rules are not modified.
+        '''
+        self.deadline = float("inf")
+        self.isCancelled = isCancelled
+        rules = rules.copy()
+        self.killers = [[] for _ in range(depth * 2 + 2)]
+        return {move: self._searchChild(rules, move, depth, -INFINITY, INFINITY, 0) for move in moves}
+
+
+    ### Search functions
+
+    def _searchRoot(self, rules, moves, depth, firstMove):
+        moves = self._orderMoves(rules, moves, firstMove, 0)
+        alpha = -INFINITY
+        bestMove = moves[0]
+        for move in moves:
+            value = self._searchChild(rules, move, depth, alpha, INFINITY, 0)
+            if (value > alpha):
+                alpha = value
+                bestMove = move
+                self.partialBest = move
+        return alpha, bestMove
+
+
+    def _searchChild(self, rules, move, depth, alpha, beta, ply):
+        '''
+        Makes a move, searches the resulting position and returns its value
+        from the point of view of the player making the move
+        '''
+        mover = rules.p1Turn
+        isShift = move.mType == "SHIFT"
+        rules.makeMove(move)
+        if (rules.isFinished):
+            value = WIN_SCORE - ply - 1
+        elif (rules.p1Turn == mover):
+            value = self._search(rules, depth if isShift else depth - 1, alpha, beta, ply + 1, isShift)
+        else:
+            value = -self._search(rules, depth - 1, -beta, -alpha, ply + 1, isShift)
+        rules.unmakeMove()
+        return value
+
+
+    def _search(self, rules, depth, alpha, beta, ply, afterShift):
+        self.nodes += 1
+        if (not (self.nodes & self.checkMask) and self._isOutOfTime()):
+            raise SearchTimeout()
+
+        if (depth <= 0):
+            return evaluate(rules)
+
+        if (self.canonical):
+            key, transform = rules.getCanonicalHash()
+        else:
+            key, transform = rules.getHash(), None
+        key ^= _AFTER_SHIFT_KEY if afterShift else 0
+        ttMove = None
+        entry = self.tt.lookup(key)
+        if (entry is not None):
+            ttDepth, ttValue, ttFlag, ttMove = entry
+            if (transform is not None and ttMove is not None):
+                ttMove = fromCanonicalMove(ttMove, transform)
+            if (ttDepth >= depth):
+                ttValue = self._fromTable(ttValue, ply)
+                if (ttFlag == EXACT):
+                    return ttValue
+                elif (ttFlag == LOWER):
+                    alpha = max(alpha, ttValue)
+                else:
+                    beta = min(beta, ttValue)
+                if (alpha >= beta):
+                    return ttValue
+
+        moves = rules.getLegalMoves(includeShifts=not afterShift)
+        if (not moves):
+            # No way to continue, so count as a draw
+            return 0
+
+        alphaOrig = alpha
+        bestValue = -INFINITY
+        bestMove = None
+        for move in self._orderMoves(rules, moves, ttMove, ply):
+            value = self._searchChild(rules, move, depth, alpha, beta, ply)
+            if (value > bestValue):
+                bestValue = value
+                bestMove = move
+                if (value > alpha):
+                    alpha = value
+                    if (alpha >= beta):
+                        self._storeKiller(move, ply)
+                        break
+
+        if (bestValue <= alphaOrig):
+            flag = UPPER
+        elif (bestValue >= beta):
+            flag = LOWER
+        else:
+            flag = EXACT
+        if (transform is not None):
+            bestMove = toCanonicalMove(bestMove, transform)
+        self.tt.store(key, depth, self._toTable(bestValue, ply), flag, bestMove)
+        return bestValue
+
+
+    ### Helper functions
+
+    def _isOutOfTime(self):
+        return time.perf_counter() > self.deadline or (self.isCancelled is not None and self.isCancelled())
+
+
+    def _toTable(self, value, ply):
+        '''
+        Converts win scores to be relative to the stored position
+        '''
+        if (value >= WIN_THRESHOLD):
+            return value + ply
+        elif (value <= -WIN_THRESHOLD):
+            return value - ply
+        return value
+
+
+    def _fromTable(self, value, ply):
+        if (value >= WIN_THRESHOLD):
+            return value - ply
+        elif (value <= -WIN_THRESHOLD):
+            return value + ply
+        return value
+
+
+    def _storeKiller(self, move, ply):
+        killers = self.killers[ply]
+        if (move not in killers):
+            killers.insert(0, move)
+            del killers[2:]
+
+
+    def _orderMoves(self, rules, moves, ttMove, ply):
+        '''
+        Sorts moves so that those most likely to cause a cutoff come first
+        '''
+        board = rules.board
+        size, adjacent, cells = board.size, board.masks.adjacentIndices, board.cells
+        me = 1 if rules.isP1Turn() else -1
+        killers = self.killers[ply] if ply < len(self.killers) else []
+
+        def getScore(move):
+            if (move == ttMove):
+                return 1 << 20
+            elif (move in killers):
+                return 1 << 16
+            mType = move.mType
+            if (mType == "PLACE"):
+                x, y = move.coor
+                values = [cells[j] for j in adjacent[x * size + y]]
+                return 2000 + 4 * values.count(-me) + values.count(me)
+            elif (mType == "REMOVE" or mType == "CLEAR"):
+                # Prefer removing beads which are involved in surrounds
+                score = 1000
+                for x, y in (move.coor, move.coor2) if move.coor2 else (move.coor,):
+                    i = x * size + y
+                    # Count the neighbours of the other colour to the bead
+                    score += [cells[j] for j in adjacent[i]].count(-cells[i])
+                return score
+            return 0
+
+        return sorted(moves, key=getScore, reverse=True)
@@ -0,0 +1,319 @@
+import argparse
+import json
+import os
+import time
+from multiprocessing import Pool
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from Players import createPlayer, PLAYER_TYPES
+from BitBoard import BitBoard
+from GameRecords import RecordReader, RecordWriter
+from Moves import Move
+from Rules import Rules
+
+
+def playGame(rules, players, maxPlies=400):
+    '''
+    Plays a game between two players ({1: red, -1: blue}) from the state of the rules.
+    Returns the winner (1, -1, or 0 if maxPlies is reached first),
+    the list of moves played and the number of times clearance was triggered.
+    '''
+    for player in players.values():
+        player.newGame()
+
+    moves = []
+    nClearances = 0
+    while (not rules.isFinished and len(moves) < maxPlies):
+        move = players[1 if rules.isP1Turn() else -1].chooseMove(rules)
+        if (move is None):
+            break
+        rules.makeMove(move)
+        moves.append(move)
+        if (not rules.isFinished and rules.board.isFull()):
+            nClearances += 1
+
+    if (rules.isFinished):
+        winner = 1 if rules.isP1Turn() else -1
+    else:
+        winner = 0
+    return winner, moves, nClearances
+
+
+class OutcomeStats:
+    '''
+    Accumulates outcome statistics over game records
+    '''
+    def __init__(self):
+        self.nGames = 0
+        self.results = {1: 0, -1: 0, 0: 0}
+        self.agentWins = {}
+        self.totalPlies = 0
+        self.nGamesWithClearance = 0
+        self.nClearances = 0
+
+
+    def add(self, record):
+        self.nGames += 1
+        self.results[record["winner"]] += 1
+        if (record["winner"]):
+            agent = record["red"] if record["winner"] == 1 else record["blue"]
+            self.agentWins[agent] = self.agentWins.get(agent, 0) + 1
+        self.totalPlies += record["plies"]
+        self.nClearances += record["clearances"]
+        if (record["clearances"]):
+            self.nGamesWithClearance += 1
+
+
+    def report(self):
+        '''
+        Returns a human readable summary
+        '''
+        if (not self.nGames):
+            return "No games played"
+        n = float(self.nGames)
+        lines = [
+            "Games:                 {}".format(self.nGames),
+            "First player (red):    {:.1%} wins".format(self.results[1]/n),
+            "Second player (blue):  {:.1%} wins".format(self.results[-1]/n),
+            "Unfinished:            {:.1%}".format(self.results[0]/n),
+            "Average length:        {:.1f} plies".format(self.totalPlies/n),
+            "Clearance triggered:   {:.1%} of games ({:.2f} per game)".format(
+                self.nGamesWithClearance/n, self.nClearances/n),
+        ]
+        for agent, wins in sorted(self.agentWins.items()):
+            lines.append("Wins for {:<13} {:.1%}".format(agent + ":", wins/n))
+        return "\n".join(lines)
+
+
+### Worker functions
+
+_workerConfig = None
+
+
+def _initWorker(config):
+    global _workerConfig
+    _workerConfig = config
+
+
+def _playIndexedGame(index):
+    '''
+    Plays game number index using the worker configuration and returns its record
+    '''
+    config = _workerConfig
+    red, blue = config["red"], config["blue"]
+    if (config["alternate"] and index % 2):
+        red, blue = blue, red
+
+    seed = config["seed"] + index
+    options = {"timeBudget": config["timeBudget"], "nWorkers": 1, "tablebase": config["tablebase"]}
+    players = {
+        1: createPlayer(red, seed=seed, **options),
+        -1: createPlayer(blue, seed=seed + 1, **options),
+    }
+    rules = Rules(BitBoard(config["size"]), config["startingBeads"], config["clearanceRemovals"])
+
+    startTime = time.perf_counter()
+    winner, moves, nClearances = playGame(rules, players, config["maxPlies"])
+    return {
+        "index": index,
+        "red": red,
+        "blue": blue,
+        "winner": winner,
+        "plies": len(moves),
+        "clearances": nClearances,
+        "seconds": round(time.perf_counter() - startTime, 4),
+        "moves": [move.toNotation() for move in moves],
+    }
+
+
+### Output file functions
+
+def loadRecords(path):
+    '''
+    Returns the records already written to path.
+    A partially written final line, left by an interruption, is truncated.
+    '''
+    records = []
+    if (not os.path.exists(path)):
+        return records
+
+    with open(path, "r+") as f:
+        goodOffset = 0
+        for line in iter(f.readline, ""):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logging.warning("Discarding incomplete record at end of {}".format(path))
+                break
+            goodOffset = f.tell()
+        f.truncate(goodOffset)
+    return records
+
+
+def loadBinaryRecords(path):
+    '''
+    Returns the records already written to a binary record file, without their moves.
+    A partially written final record is truncated.
+    '''
+    records = []
+    if (not os.path.exists(path)):
+        return records
+
+    reader = RecordReader(path)
+    for gameRecord in reader:
+        record = dict(gameRecord.metadata)
+        record["winner"] = gameRecord.winner
+        record["plies"] = gameRecord.nMoves
+        records.append(record)
+    if (reader.goodOffset is not None):
+        with open(path, "r+b") as f:
+            f.truncate(reader.goodOffset)
+    return records
+
+
+class _JsonLinesOutput:
+    '''
+    Writes records from _playIndexedGame as JSON lines
+    '''
+    def __init__(self, path):
+        self.file = open(path, "a")
+
+
+    def close(self):
+        self.file.close()
+
+
+    def write(self, record):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.file.flush()
+
+
+class _BinaryOutput:
+    '''
+    Writes records from _playIndexedGame in the binary format of GameRecords
+    '''
+    def __init__(self, path, config):
+        self.writer = RecordWriter(path)
+        self.config = config
+
+
+    def close(self):
+        self.writer.close()
+
+
+    def write(self, record):
+        config = self.config
+        self.writer.write(
+            [Move.fromNotation(notation) for notation in record["moves"]],
+            record["winner"], config["size"], config["startingBeads"], config["clearanceRemovals"],
+            metadata={key: record[key] for key in ["index", "red", "blue", "clearances", "seconds"]})
+        self.writer.flush()
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Plays games between computer players and records them")
+    parser.add_argument("--games", type=int, default=100, help="Total number of games (default: 100)")
+    parser.add_argument("--red", default="random", choices=sorted(PLAYER_TYPES),
+        help="Player type for red, who moves first (default: random)")
+    parser.add_argument("--blue", default="random", choices=sorted(PLAYER_TYPES),
+        help="Player type for blue (default: random)")
+    parser.add_argument("--alternate", action="store_true",
+        help="Swap the player types on every other game")
+    parser.add_argument("--time-budget", type=float, default=0.01,
+        help="Time in seconds a searching player may think per move (default: 0.01)")
+    parser.add_argument("--size", type=int, default=5, help="Width of the square board (default: 5)")
+    parser.add_argument("--starting-beads", type=int,
+        help="Beads each player starts with (default: two thirds of the spaces, 17 on 5x5)")
+    parser.add_argument("--clearance-removals", type=int,
+        help="Beads removed when the board fills (default: a quarter of the spaces, 6 on 5x5)")
+    parser.add_argument("--max-plies", type=int, default=400,
+        help="Games longer than this are recorded as unfinished (default: 400)")
+    parser.add_argument("--tablebase",
+        help="Tablebase file from Tablebase.py for the searching players to play solved positions from")
+    parser.add_argument("--seed", type=int, default=0, help="Base random seed (default: 0)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+        help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("--output", default="selfplay.jsonl",
+        help="File to stream game records to. Existing records are kept and not replayed. (default: selfplay.jsonl)")
+    parser.add_argument("--format", default="jsonl", choices=["jsonl", "binary"],
+        help="Output format: JSON lines, or the compact binary format of GameRecords.py (default: jsonl)")
+    parser.add_argument("--report-interval", type=float, default=10.,
+        help="Seconds between progress reports (default: 10)")
+    return parser.parse_args()
+
+
+def main():
+    '''
+    Main function
+    '''
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%H:%M:%S')
+    args = parseArgs()
+
+    config = {
+        "red": args.red,
+        "blue": args.blue,
+        "alternate": args.alternate,
+        "timeBudget": args.time_budget,
+        "size": args.size,
+        "startingBeads": args.starting_beads,
+        "clearanceRemovals": args.clearance_removals,
+        "maxPlies": args.max_plies,
+        "seed": args.seed,
+        "tablebase": args.tablebase,
+    }
+
+    stats = OutcomeStats()
+    done = set()
+    load = loadBinaryRecords if args.format == "binary" else loadRecords
+    for record in load(args.output):
+        stats.add(record)
+        done.add(record["index"])
+    pending = [i for i in range(args.games) if i not in done]
+    if (done):
+        logging.info("Resuming: {} games already recorded, {} to play".format(len(done), len(pending)))
+
+    startTime = time.perf_counter()
+    lastReport = startTime
+    nPlayed = 0
+    pool = None
+    output = _BinaryOutput(args.output, config) if args.format == "binary" else _JsonLinesOutput(args.output)
+    try:
+        if (args.workers > 1):
+            pool = Pool(args.workers, initializer=_initWorker, initargs=(config,))
+            records = pool.imap_unordered(_playIndexedGame, pending)
+        else:
+            _initWorker(config)
+            records = map(_playIndexedGame, pending)
+
+        for record in records:
+            output.write(record)
+            stats.add(record)
+            nPlayed += 1
+
+            now = time.perf_counter()
+            if (now - lastReport > args.report_interval):
+                lastReport = now
+                logging.info("{}/{} games, {:.1f} games/s".format(
+                    nPlayed, len(pending), nPlayed/(now - startTime)))
+    except KeyboardInterrupt:
+        logging.info("Interrupted. Rerun the same command to resume.")
+    finally:
+        if (pool is not None):
+            pool.terminate()
+        output.close()
+
+    elapsed = time.perf_counter() - startTime
+    print("Played {} games in {:.1f} s ({:.1f} games/s)".format(
+        nPlayed, elapsed, nPlayed/elapsed if elapsed else 0.))
+    print(stats.report())
+
+
+if __name__ == "__main__":
+    main()
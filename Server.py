@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import itertools
+import json
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from BitBoard import BitBoard
+from Moves import Move
+from Rules import Rules
+
+
+# Game server protocol.
+#
+# Messages are JSON objects, one per line, each with a "type".
+#
+# Client to server:
+#     {"type": "join"}                   - wait to be paired with the next player to join
+#     {"type": "move", "move": "P2,3"}   - play a move, in the notation of Move.toNotation
+#
+# Server to client:
+#     {"type": "waiting"}                - joined, waiting for an opponent
+#     {"type": "start", "match", "colour", "size", "startingBeads", "clearanceRemovals"}
+#                                        - paired; colour 1 (red) moves first, -1 is blue
+#     {"type": "update", "move", "colour", "p1", "p2", "p1Turn", "inClearance",
+#         "clearanceCount", "finished", "winner"}
+#                                        - a move was played by colour, sent to both
+#                                          players. p1 and p2 are the bead bitmasks of
+#                                          BitBoard. winner is 1, -1 or null.
+#     {"type": "end", "reason"}          - the match ended without a winner
+#     {"type": "error", "message"}       - the last message was rejected
+#
+# A client may join again after its match ends.
+
+# Longest accepted message, in bytes
+MAX_MESSAGE_SIZE = 1024
+
+
+class Match:
+    '''
+    A game between two connected players
+    '''
+    __slots__ = ("matchId", "rules", "players")
+
+    def __init__(self, matchId, rules, players):
+        self.matchId = matchId
+        self.rules = rules
+        self.players = players
+
+
+    def getUpdate(self, move, colour):
+        rules = self.rules
+        return {
+            "type": "update",
+            "move": move.toNotation(),
+            "colour": colour,
+            "p1": rules.board.p1,
+            "p2": rules.board.p2,
+            "p1Turn": rules.p1Turn,
+            "inClearance": rules.inClearance,
+            "clearanceCount": rules.clearanceCount,
+            "finished": rules.isFinished,
+            "winner": (1 if rules.p1Turn else -1) if rules.isFinished else None,
+        }
+
+
+class Connection:
+    '''
+    A connected client and the match it is playing, if any
+    '''
+    __slots__ = ("writer", "match", "colour")
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.match = None
+        self.colour = None
+
+
+    def send(self, message):
+        '''
+        Queues a message. Writes are flushed by the connection's own loop, so
+        a slow client cannot hold up its opponent's moves.
+        '''
+        if (not self.writer.is_closing()):
+            self.writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+
+class GameServer:
+    '''
+    Runs many independent games in one process, pairing players in the order they join.
+
+    Matches are headless Rules objects, which validate each move. They keep
+    no undo history, so a match holds little more than its two bitmasks.
+    '''
+    def __init__(self, size=5, startingBeads=None, clearanceRemovals=None):
+        self.size = size
+        self.startingBeads = startingBeads
+        self.clearanceRemovals = clearanceRemovals
+
+        self.waiting = None
+        self.matches = {}
+        self.matchIds = itertools.count()
+        self.nConnections = 0
+        self.nFinished = 0
+
+
+    async def start(self, host="127.0.0.1", port=8765):
+        '''
+        Starts listening and returns the asyncio server
+        '''
+        return await asyncio.start_server(self.handleConnection, host, port, limit=MAX_MESSAGE_SIZE)
+
+
+    async def handleConnection(self, reader, writer):
+        connection = Connection(writer)
+        self.nConnections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    # Message too long or connection reset
+                    break
+                if (not line):
+                    break
+                self._processMessage(connection, line)
+                await writer.drain()
+        finally:
+            self._leave(connection)
+            self.nConnections -= 1
+            writer.close()
+
+
+    def _processMessage(self, connection, line):
+        try:
+            message = json.loads(line)
+            messageType = message["type"]
+        except (ValueError, TypeError, KeyError):
+            connection.send({"type": "error", "message": "Messages must be JSON objects with a type"})
+            return
+
+        if (messageType == "join"):
+            self._join(connection)
+        elif (messageType == "move"):
+            self._playMove(connection, message.get("move"))
+        else:
+            connection.send({"type": "error", "message": "Unknown message type '{}'".format(messageType)})
+
+
+    def _join(self, connection):
+        if (connection.match is not None or connection is self.waiting):
+            connection.send({"type": "error", "message": "Already joined"})
+            return
+        if (self.waiting is None or self.waiting.writer.is_closing()):
+            self.waiting = connection
+            connection.send({"type": "waiting"})
+            return
+
+        opponent, self.waiting = self.waiting, None
+        rules = Rules(BitBoard(self.size), self.startingBeads, self.clearanceRemovals)
+        match = Match(next(self.matchIds), rules, {1: opponent, -1: connection})
+        self.matches[match.matchId] = match
+        for colour, player in match.players.items():
+            player.match = match
+            player.colour = colour
+            player.send({
+                "type": "start",
+                "match": match.matchId,
+                "colour": colour,
+                "size": self.size,
+                "startingBeads": rules.startingBeads,
+                "clearanceRemovals": rules.clearanceRemovals,
+            })
+
+
+    def _playMove(self, connection, notation):
+        match = connection.match
+        if (match is None):
+            connection.send({"type": "error", "message": "Not in a match"})
+            return
+        rules = match.rules
+        if ((1 if rules.p1Turn else -1) != connection.colour):
+            connection.send({"type": "error", "message": "Not your turn"})
+            return
+        try:
+            move = Move.fromNotation(notation)
+        except (ValueError, TypeError, KeyError, IndexError):
+            connection.send({"type": "error", "message": "Invalid move notation '{}'".format(notation)})
+            return
+        if (not rules.isLegalMove(move)):
+            connection.send({"type": "error", "message": "Illegal move {}".format(notation)})
+            return
+
+        rules.makeMove(move)
+        rules.undoStack.clear()
+        update = match.getUpdate(move, connection.colour)
+        for player in match.players.values():
+            player.send(update)
+        if (rules.isFinished):
+            self.nFinished += 1
+            self._endMatch(match)
+
+
+    def _endMatch(self, match):
+        del self.matches[match.matchId]
+        for player in match.players.values():
+            player.match = None
+            player.colour = None
+
+
+    def _leave(self, connection):
+        if (self.waiting is connection):
+            self.waiting = None
+        match = connection.match
+        if (match is not None):
+            self._endMatch(match)
+            for player in match.players.values():
+                if (player is not connection):
+                    player.send({"type": "end", "reason": "Opponent disconnected"})
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Hosts games between players connecting over TCP")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument("--size", type=int, default=5, help="Width of the square board (default: 5)")
+    parser.add_argument("--starting-beads", type=int,
+        help="Beads each player starts with (default: two thirds of the spaces, 17 on 5x5)")
+    parser.add_argument("--clearance-removals", type=int,
+        help="Beads removed when the board fills (default: a quarter of the spaces, 6 on 5x5)")
+    parser.add_argument("--report-interval", type=float, default=60.,
+        help="Seconds between status reports (default: 60)")
+    return parser.parse_args()
+
+
+async def serve(args):
+    gameServer = GameServer(args.size, args.starting_beads, args.clearance_removals)
+    server = await gameServer.start(args.host, args.port)
+    logging.info("Listening on {}:{}".format(args.host, args.port))
+    async with server:
+        while True:
+            await asyncio.sleep(args.report_interval)
+            logging.info("{} connections, {} matches in progress, {} finished".format(
+                gameServer.nConnections, len(gameServer.matches), gameServer.nFinished))
+
+
+def main():
+    '''
+    Main function
+    '''
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%H:%M:%S')
+    try:
+        asyncio.run(serve(parseArgs()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
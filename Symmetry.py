@@ -0,0 +1,252 @@
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from Moves import Move
+
+
+# Canonical forms of positions.
+#
+# Shifts are free, so a position is equivalent to every translation of it,
+# and the rules are unchanged by the 8 rotations and reflections of the board.
+# The canonical form translates the beads' bounding box to the origin, applies
+# each symmetry of the square to the box and takes the smallest (p1, p2)
+# result, which is again translated to the origin.
+#
+# A symmetry is (swap, flipX, flipY): the axes are swapped first, then each
+# flipped within the box.
+SYMMETRIES = [(swap, flipX, flipY) for swap in (False, True) for flipX in (False, True) for flipY in (False, True)]
+
+# Unit vectors of the shift directions, with x across columns and y along them
+_DIRECTION_VECTORS = {"UP": (0, -1), "DOWN": (0, 1), "LEFT": (-1, 0), "RIGHT": (1, 0)}
+_VECTOR_DIRECTIONS = {vector: direction for direction, vector in _DIRECTION_VECTORS.items()}
+
+# Largest board whose symmetries are applied with per-column lookup tables.
+# Larger boards map each bead in turn.
+MAX_TABLE_SIZE = 8
+
+# Canonical forms remembered per board size, as searches revisit positions.
+# The cache is emptied when full.
+MAX_CACHE_ENTRIES = 1 << 16
+
+
+def getExtent(occupied, size):
+    '''
+    Returns the lowest and highest column and row holding a bead of a non-empty mask
+    '''
+    colMask = (1 << size) - 1
+    minX = ((occupied & -occupied).bit_length() - 1) // size
+    maxX = (occupied.bit_length() - 1) // size
+    rowsFolded = 0
+    for x in range(minX, maxX + 1):
+        rowsFolded |= (occupied >> (x * size)) & colMask
+    return minX, maxX, (rowsFolded & -rowsFolded).bit_length() - 1, rowsFolded.bit_length() - 1
+
+
+class _SymmetryTables:
+    '''
+    Precomputed symmetries of the whole board for a given size.
+    Flips are about the board's centre, so a flipped box must be shifted back
+    to the origin afterwards.
+    '''
+    def __init__(self, size):
+        self.size = size
+        n = size * size
+        # Index each space is mapped to by each symmetry
+        self.permutations = []
+        for swap, flipX, flipY in SYMMETRIES:
+            permutation = []
+            for i in range(n):
+                a, b = divmod(i, size)
+                if (swap):
+                    a, b = b, a
+                if (flipX):
+                    a = size - 1 - a
+                if (flipY):
+                    b = size - 1 - b
+                permutation.append(a * size + b)
+            self.permutations.append(permutation)
+
+        # Canonical forms by (p1, p2)
+        self.cache = {}
+
+        # Shifts returning each symmetry's flipped box to the origin, by box size
+        self.backs = {}
+        for width in range(1, size + 1):
+            for height in range(1, size + 1):
+                backs = []
+                for swap, flipX, flipY in SYMMETRIES:
+                    w, h = (height, width) if swap else (width, height)
+                    backs.append(((size - w) * size if flipX else 0) + ((size - h) if flipY else 0))
+                self.backs[(width, height)] = backs
+
+        # columns[s][x][v] is column x holding v mapped by symmetry s
+        self.columns = None
+        if (size <= MAX_TABLE_SIZE):
+            self.columns = [
+                [[sum(1 << permutation[x * size + y] for y in range(size) if (v >> y) & 1)
+                    for v in range(1 << size)]
+                    for x in range(size)]
+                for permutation in self.permutations]
+
+
+    def apply(self, s, mask, width):
+        '''
+        Returns a mask mapped by symmetry s, for beads in the first width columns
+        '''
+        size = self.size
+        if (self.columns is not None):
+            columns = self.columns[s]
+            colMask = (1 << size) - 1
+            result = 0
+            for x in range(width):
+                result |= columns[x][(mask >> (x * size)) & colMask]
+            return result
+        permutation = self.permutations[s]
+        result = 0
+        while mask:
+            low = mask & -mask
+            result |= 1 << permutation[low.bit_length() - 1]
+            mask ^= low
+        return result
+
+
+_tablesBySize = {}
+
+
+def _getTables(size):
+    tables = _tablesBySize.get(size)
+    if tables is None:
+        tables = _SymmetryTables(size)
+        _tablesBySize[size] = tables
+    return tables
+
+
+def getCanonicalForm(p1, p2, size, symmetries=True):
+    '''
+    Returns (p1, p2, transform) for the canonical form of a position, where
+    transform maps coordinates to it (see toCanonicalCoor).
+    If symmetries is False only translations are considered.
+    '''
+    occupied = p1 | p2
+    if (not occupied):
+        return p1, p2, (0, 0, 0, size, size)
+    if (symmetries):
+        tables = _getTables(size)
+        key = (p1, p2)
+        form = tables.cache.get(key)
+        if (form is None):
+            if (len(tables.cache) >= MAX_CACHE_ENTRIES):
+                tables.cache.clear()
+            form = _getSymmetricForm(tables, p1, p2, size)
+            tables.cache[key] = form
+        return form
+
+    minX, maxX, minY, maxY = getExtent(occupied, size)
+    offset = minX * size + minY
+    return p1 >> offset, p2 >> offset, (0, minX, minY, maxX - minX + 1, maxY - minY + 1)
+
+
+def _getSymmetricForm(tables, p1, p2, size):
+    minX, maxX, minY, maxY = getExtent(p1 | p2, size)
+    offset = minX * size + minY
+    p1 >>= offset
+    p2 >>= offset
+    width, height = maxX - minX + 1, maxY - minY + 1
+    backs = tables.backs[(width, height)]
+
+    # Compare player 1's beads first, and only map player 2's for the best
+    if (tables.columns is not None):
+        colMask = (1 << size) - 1
+        values = [(p1 >> (x * size)) & colMask for x in range(width)]
+        candidates = []
+        for s, columns in enumerate(tables.columns):
+            mapped = 0
+            for column, v in zip(columns, values):
+                mapped |= column[v]
+            candidates.append(mapped >> backs[s])
+    else:
+        candidates = [tables.apply(s, p1, width) >> backs[s] for s in range(len(SYMMETRIES))]
+    best = min(candidates)
+
+    bestForm = None
+    for s, mapped in enumerate(candidates):
+        if (mapped == best):
+            form = (mapped, tables.apply(s, p2, width) >> backs[s], s)
+            if (bestForm is None or form < bestForm):
+                bestForm = form
+    canonicalP1, canonicalP2, s = bestForm
+    return canonicalP1, canonicalP2, (s, minX, minY, width, height)
+
+
+### Coordinate mapping
+
+def toCanonicalCoor(coor, transform):
+    '''
+    Maps a coordinate to the canonical form given by getCanonicalForm.
+    Spaces outside the beads' bounding box may map to negative coordinates.
+    '''
+    s, minX, minY, width, height = transform
+    swap, flipX, flipY = SYMMETRIES[s]
+    a, b = coor[0] - minX, coor[1] - minY
+    if (swap):
+        a, b = b, a
+        width, height = height, width
+    if (flipX):
+        a = width - 1 - a
+    if (flipY):
+        b = height - 1 - b
+    return a, b
+
+
+def fromCanonicalCoor(coor, transform):
+    '''
+    Inverse of toCanonicalCoor
+    '''
+    s, minX, minY, width, height = transform
+    swap, flipX, flipY = SYMMETRIES[s]
+    a, b = coor
+    if (swap):
+        width, height = height, width
+    if (flipX):
+        a = width - 1 - a
+    if (flipY):
+        b = height - 1 - b
+    if (swap):
+        a, b = b, a
+    return a + minX, b + minY
+
+
+def _mapDirection(direction, transform, inverse):
+    swap, flipX, flipY = SYMMETRIES[transform[0]]
+    dx, dy = _DIRECTION_VECTORS[direction]
+    if (inverse):
+        dx, dy = (-dx if flipX else dx), (-dy if flipY else dy)
+        if (swap):
+            dx, dy = dy, dx
+    else:
+        if (swap):
+            dx, dy = dy, dx
+        dx, dy = (-dx if flipX else dx), (-dy if flipY else dy)
+    return _VECTOR_DIRECTIONS[(dx, dy)]
+
+
+def toCanonicalMove(move, transform):
+    '''
+    Maps a move to the canonical form given by getCanonicalForm
+    '''
+    if (move.mType == "SHIFT"):
+        return Move("SHIFT", direction=_mapDirection(move.direction, transform, False))
+    coor2 = toCanonicalCoor(move.coor2, transform) if move.coor2 is not None else None
+    return Move(move.mType, toCanonicalCoor(move.coor, transform), coor2)
+
+
+def fromCanonicalMove(move, transform):
+    '''
+    Inverse of toCanonicalMove
+    '''
+    if (move.mType == "SHIFT"):
+        return Move("SHIFT", direction=_mapDirection(move.direction, transform, True))
+    coor2 = fromCanonicalCoor(move.coor2, transform) if move.coor2 is not None else None
+    return Move(move.mType, fromCanonicalCoor(move.coor, transform), coor2)
@@ -0,0 +1,515 @@
+import argparse
+import mmap
+import os
+import shutil
+import struct
+import time
+from array import array
+from itertools import combinations
+from math import comb
+from multiprocessing import Pool
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from BitBoard import BitBoard, getMasks, iterBits, popcount
+from Symmetry import getCanonicalForm, getExtent
+
+
+# Tablebase file format.
+#
+# A header (_HEADER: MAGIC, format version, board size, starting beads,
+# log2 of the number of slots and the number of entries) followed by an
+# open-addressed hash table of _SLOT entries: position key plus one (0 marks
+# an empty slot) and value. Slots are probed linearly from _getSlot(key).
+#
+# Values are from the point of view of the player to move: +d wins in d
+# turns, -d loses in d turns. Draws are not stored.
+#
+# Positions are stored in the canonical form of Symmetry.getCanonicalForm.
+# Shifts are free and can be repeated, so every translation of a position
+# which fits on the board is available to the player to move, and they all
+# have the same value, as do its rotations and reflections.
+MAGIC = b"ENTB"
+VERSION = 2
+
+_HEADER = struct.Struct("<4sBBHBQ")
+_SLOT = struct.Struct("<Qh")
+_VALUE = struct.Struct("<h")
+_VALUE_OFFSET = 8
+
+_MASK64 = (1 << 64) - 1
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+class TablebaseError(Exception):
+    '''
+    Raised when a file is not a valid tablebase
+    '''
+    pass
+
+
+### Position functions
+
+def _getSlot(key, slotBits):
+    return ((key * _HASH_MULTIPLIER) & _MASK64) >> (64 - slotBits)
+
+
+def canonicalise(p1, p2, size):
+    '''
+    Returns the canonical form of a position under translation, rotation and reflection
+    '''
+    return getCanonicalForm(p1, p2, size)[:2]
+
+
+def getKey(p1, p2, p1Turn, size):
+    '''
+    Returns the table key of a position, which must be canonical
+    '''
+    nSpaces = size * size
+    return p1 | (p2 << nSpaces) | (int(p1Turn) << (2 * nSpaces))
+
+
+def _iterTranslations(p1, p2, size):
+    '''
+    Yields every translation of a canonical position which fits on the board
+    '''
+    occupied = p1 | p2
+    if (not occupied):
+        yield p1, p2
+        return
+    _, maxX, _, maxY = getExtent(occupied, size)
+    for dx in range(size - maxX):
+        for dy in range(size - maxY):
+            offset = dx * size + dy
+            yield p1 << offset, p2 << offset
+
+
+def _getSuccessors(p1, p2, p1Turn, size, startingBeads):
+    '''
+    Returns the keys of the positions reachable by one turn from a canonical
+    position, or None if the player to move can win immediately
+    '''
+    board = BitBoard.__new__(BitBoard)
+    board.size = size
+    board.masks = getMasks(size)
+
+    mine, theirs = (p1, p2) if p1Turn else (p2, p1)
+    successors = set()
+
+    # Placements differ between translations, as beads can be placed beyond the
+    # edge of the current position's extent
+    if (popcount(mine) < startingBeads):
+        for myTranslation, theirTranslation in _iterTranslations(mine, theirs, size):
+            # Player 2 of the board stands in for the opponent
+            board.p1, board.p2 = myTranslation, theirTranslation
+            placements = board.getEmptyMask() & ~board.getSurroundedByP2Mask()
+            if (placements & board.getCompletingMask(myTranslation, theirTranslation)):
+                return None
+            for i in iterBits(placements):
+                newMine, newTheirs = myTranslation | (1 << i), theirTranslation
+                newP1, newP2 = (newMine, newTheirs) if p1Turn else (newTheirs, newMine)
+                successors.add(getKey(*canonicalise(newP1, newP2, size), not p1Turn, size))
+
+    # Removals commute with translation
+    for i in iterBits(mine):
+        for j in iterBits(theirs):
+            newMine, newTheirs = mine ^ (1 << i), theirs ^ (1 << j)
+            newP1, newP2 = (newMine, newTheirs) if p1Turn else (newTheirs, newMine)
+            successors.add(getKey(*canonicalise(newP1, newP2, size), not p1Turn, size))
+
+    return successors
+
+
+def _isVictory(p1, p2, size):
+    board = BitBoard.__new__(BitBoard)
+    board.size = size
+    board.masks = getMasks(size)
+    board.p1, board.p2 = p1, p2
+    return bool((board.getSurroundedByP1Mask() & p2) | (board.getSurroundedByP2Mask() & p1))
+
+
+def _iterColourings(occupied, startingBeads):
+    '''
+    Yields each split of the occupied spaces into player 1 and player 2 beads
+    with no more than startingBeads each
+    '''
+    spaces = list(iterBits(occupied))
+    for nP1 in range(max(0, len(spaces) - startingBeads), min(startingBeads, len(spaces)) + 1):
+        for chosen in combinations(spaces, nP1):
+            p1 = sum(1 << i for i in chosen)
+            yield p1, occupied ^ p1
+
+
+def _iterPositions(occupied, size, startingBeads):
+    '''
+    Yields the canonical positions with the given occupied spaces which are not already won
+    '''
+    for p1, p2 in _iterColourings(occupied, startingBeads):
+        if (canonicalise(p1, p2, size) == (p1, p2) and not _isVictory(p1, p2, size)):
+            yield p1, p2
+
+
+def _iterCanonicalOccupancies(size, startingBeads):
+    '''
+    Yields the occupied spaces translated to the origin, empty first
+    '''
+    yield 0
+    colMask = (1 << size) - 1
+    firstRow = sum(1 << (x * size) for x in range(size))
+    for nBeads in range(1, 2 * startingBeads + 1):
+        for spaces in combinations(range(size * size), nBeads):
+            occupied = sum(1 << i for i in spaces)
+            if ((occupied & colMask) and (occupied & firstRow)):
+                yield occupied
+
+
+### Tablebase file
+
+def _openTable(path, writable):
+    f = open(path, "r+b" if writable else "rb")
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+    f.close()
+    magic, version, size, startingBeads, slotBits, nEntries = _HEADER.unpack_from(data)
+    if (magic != MAGIC or version != VERSION):
+        data.close()
+        raise TablebaseError("{} is not a version {} tablebase".format(path, VERSION))
+    return data, size, startingBeads, slotBits, nEntries
+
+
+def _createTable(path, size, startingBeads, slotBits):
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, size, startingBeads, slotBits, 0))
+        # Sparse on most file systems until written
+        f.truncate(_HEADER.size + _SLOT.size * (1 << slotBits))
+
+
+def _findSlot(data, slotBits, key):
+    '''
+    Returns the slot holding a key, or the empty slot where it would be inserted
+    '''
+    mask = (1 << slotBits) - 1
+    slot = _getSlot(key, slotBits)
+    stored = key + 1
+    while True:
+        slotKey, _ = _SLOT.unpack_from(data, _HEADER.size + _SLOT.size * slot)
+        if (slotKey == stored or slotKey == 0):
+            return slot
+        slot = (slot + 1) & mask
+
+
+def _getValue(data, slot):
+    return _VALUE.unpack_from(data, _HEADER.size + _SLOT.size * slot + _VALUE_OFFSET)[0]
+
+
+def _setValue(data, slot, value):
+    _VALUE.pack_into(data, _HEADER.size + _SLOT.size * slot + _VALUE_OFFSET, value)
+
+
+def _lookup(data, slotBits, key):
+    '''
+    Returns the stored value of a key, or 0 if it has none
+    '''
+    return _getValue(data, _findSlot(data, slotBits, key))
+
+
+def _insert(data, slotBits, key, value):
+    '''
+    Stores the value of a key and returns its slot
+    '''
+    slot = _findSlot(data, slotBits, key)
+    _SLOT.pack_into(data, _HEADER.size + _SLOT.size * slot, key + 1, value)
+    return slot
+
+
+class Tablebase:
+    '''
+    Read-only view of a solved tablebase file, memory mapped so that probes
+    cost a hash and a few slot reads.
+    Covers games with the tablebase's board size and starting beads.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.data, self.size, self.startingBeads, self.slotBits, self.nEntries = _openTable(path, False)
+
+
+    def close(self):
+        self.data.close()
+
+
+    def __getstate__(self):
+        # Reopened in other processes rather than pickled
+        return self.path
+
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+
+    def covers(self, rules):
+        '''
+        Returns whether the tablebase can be probed in the state of the rules
+        '''
+        return (
+            rules.board.size == self.size and
+            rules.startingBeads == self.startingBeads and
+            not rules.isFinished and
+            not rules.inClearance and
+            not rules.inRemoval )
+
+
+    def probe(self, rules):
+        '''
+        Returns the value of the position for the player to move: d > 0 wins
+        and d < 0 loses in abs(d) turns, 0 draws. Returns None if not covered.
+        '''
+        if (not self.covers(rules)):
+            return None
+        board = rules.board
+        p1, p2 = canonicalise(board.p1, board.p2, self.size)
+        return _lookup(self.data, self.slotBits, getKey(p1, p2, rules.p1Turn, self.size))
+
+
+    def getBestMove(self, rules):
+        '''
+        Returns a move keeping the best result for the player to move, or None
+        if the position is not covered. When the best move needs the beads in
+        another place, the first shift towards it is returned.
+        '''
+        value = self.probe(rules)
+        if (value is None):
+            return None
+
+        rules = rules.copy()
+        visited = set()
+        pending = [(rules.board.getState(), None)]
+        while (pending):
+            state, firstShift = pending.pop(0)
+            rules.board.setState(state)
+            move = self._getBestTurn(rules, value)
+            if (move is not None):
+                return firstShift or move
+            for shift in [move for move in rules.getLegalMoves() if move.mType == "SHIFT"]:
+                rules.makeMove(shift)
+                key = (rules.board.p1, rules.board.p2)
+                if (key not in visited):
+                    visited.add(key)
+                    pending.append((rules.board.getState(), firstShift or shift))
+                rules.unmakeMove()
+        return None
+
+
+    def _getBestTurn(self, rules, value):
+        '''
+        Returns a turn-taking move achieving value, or None if there is none
+        without shifting first
+        '''
+        for move in rules.getLegalMoves(includeShifts=False):
+            rules.makeMove(move)
+            if (rules.isFinished):
+                result = 1
+            else:
+                reply = self.probe(rules)
+                result = 0 if reply == 0 else (-reply + 1 if reply < 0 else -reply - 1)
+            rules.unmakeMove()
+            if (result == value):
+                return move
+        return None
+
+
+### Solving
+
+_workerTable = None
+
+
+def _initWorker(path):
+    global _workerTable
+    _workerTable = _openTable(path, False)
+
+
+def _expandChunk(args):
+    '''
+    Generates the moves of the positions with the given occupied spaces.
+    Writes each position's slot, number of successors and successor slots
+    to the chunk file, and returns the slots of positions won immediately.
+    Positions without moves are draws so are not written.
+    '''
+    chunkPath, occupancies, size, startingBeads = args
+    data, _, _, slotBits, _ = _workerTable
+
+    records = array("I")
+    wins = []
+    for occupied in occupancies:
+        for p1, p2 in _iterPositions(occupied, size, startingBeads):
+            for p1Turn in (True, False):
+                slot = _findSlot(data, slotBits, getKey(p1, p2, p1Turn, size))
+                successors = _getSuccessors(p1, p2, p1Turn, size, startingBeads)
+                if (successors is None):
+                    wins.append(slot)
+                elif (successors):
+                    records.append(slot)
+                    records.append(len(successors))
+                    records.extend(_findSlot(data, slotBits, key) for key in successors)
+
+    with open(chunkPath, "wb") as f:
+        records.tofile(f)
+    return wins
+
+
+def _solveChunk(chunkPath):
+    '''
+    Resolves the positions in a chunk file whose successors' values now decide them.
+    Returns the new (slot, value) entries, and rewrites the chunk file with
+    the positions left unresolved.
+    '''
+    data = _workerTable[0]
+    records = array("I")
+    with open(chunkPath, "rb") as f:
+        records.frombytes(f.read())
+
+    found = []
+    remaining = array("I")
+    i = 0
+    while (i < len(records)):
+        start, slot, nSuccessors = i, records[i], records[i + 1]
+        i += 2 + nSuccessors
+        values = [_getValue(data, successor) for successor in records[start + 2:i]]
+        losses = [v for v in values if v < 0]
+        if (losses):
+            # Win by moving to the quickest opponent loss
+            found.append((slot, -max(losses) + 1))
+        elif (all(v > 0 for v in values)):
+            # Every move lets the opponent win, so delay it as long as possible
+            found.append((slot, -max(values) - 1))
+        else:
+            remaining.extend(records[start:i])
+
+    with open(chunkPath, "wb") as f:
+        remaining.tofile(f)
+    return found
+
+
+def solve(path, size, startingBeads, nWorkers=None, chunkSize=500):
+    '''
+    Solves every position of the game variant and writes the tablebase to path.
+
+    Every position is first stored in a working table, fixing its slot, and
+    the workers write the successor slots of their positions to chunk files.
+    Positions are then solved in rounds, each reading the values of earlier
+    rounds: round 1 finds the wins by surrounding a bead, and round d the
+    positions won or lost in d turns. Positions still unresolved when a round
+    finds nothing are draws.
+    '''
+    assert(2 * startingBeads < size * size), "The board must not be able to fill, so clearance never starts"
+    assert(2 * size * size + 1 <= 64), "Keys must fit in 64 bits"
+    nWorkers = nWorkers if nWorkers else os.cpu_count() or 1
+    startTime = time.perf_counter()
+
+    occupancies = list(_iterCanonicalOccupancies(size, startingBeads))
+    maxPositions = 2 * sum(
+        sum(comb(k, nP1) for nP1 in range(max(0, k - startingBeads), min(startingBeads, k) + 1))
+        for k in (popcount(occupied) for occupied in occupancies))
+    slotBits = max(4, (2 * maxPositions).bit_length())
+    assert(slotBits <= 32), "Slots must fit in the chunk files"
+
+    workDir = path + ".work"
+    os.makedirs(workDir, exist_ok=True)
+    tablePath = os.path.join(workDir, "table")
+    _createTable(tablePath, size, startingBeads, slotBits)
+    data, _, _, _, _ = _openTable(tablePath, True)
+
+    nPositions = 0
+    for occupied in occupancies:
+        for p1, p2 in _iterPositions(occupied, size, startingBeads):
+            _insert(data, slotBits, getKey(p1, p2, True, size), 0)
+            _insert(data, slotBits, getKey(p1, p2, False, size), 0)
+            nPositions += 2
+    data.flush()
+    logging.info("{} canonical positions ({:.0f} s)".format(nPositions, time.perf_counter() - startTime))
+
+    pool = Pool(nWorkers, initializer=_initWorker, initargs=(tablePath,)) if nWorkers > 1 else None
+    if (pool is None):
+        _initWorker(tablePath)
+    mapper = pool.map if pool is not None else lambda function, jobs: [function(job) for job in jobs]
+
+    nEntries = 0
+    try:
+        jobs = [
+            (os.path.join(workDir, "chunk{}".format(i)), occupancies[start:start + chunkSize], size, startingBeads)
+            for i, start in enumerate(range(0, len(occupancies), chunkSize))]
+        chunkPaths = [job[0] for job in jobs]
+        for wins in mapper(_expandChunk, jobs):
+            for slot in wins:
+                _setValue(data, slot, 1)
+            nEntries += len(wins)
+        data.flush()
+        logging.info("Depth 1: {} positions resolved ({:.0f} s)".format(nEntries, time.perf_counter() - startTime))
+
+        depth = 1
+        while True:
+            depth += 1
+            # Every chunk sees only the values of earlier rounds
+            nFound = 0
+            for found in mapper(_solveChunk, chunkPaths):
+                for slot, value in found:
+                    _setValue(data, slot, value)
+                nFound += len(found)
+            data.flush()
+            nEntries += nFound
+            logging.info("Depth {}: {} positions resolved ({:.0f} s)".format(
+                depth, nFound, time.perf_counter() - startTime))
+            if (not nFound):
+                break
+    finally:
+        if (pool is not None):
+            pool.terminate()
+        if (_workerTable is not None):
+            _workerTable[0].close()
+
+    # Rewrite with a table holding only the decisive positions
+    finalBits = max(4, (2 * nEntries).bit_length())
+    _createTable(path, size, startingBeads, finalBits)
+    final, _, _, _, _ = _openTable(path, True)
+    for slot in range(1 << slotBits):
+        slotKey, value = _SLOT.unpack_from(data, _HEADER.size + _SLOT.size * slot)
+        if (value):
+            _insert(final, finalBits, slotKey - 1, value)
+    _HEADER.pack_into(final, 0, MAGIC, VERSION, size, startingBeads, finalBits, nEntries)
+    final.close()
+    data.close()
+    shutil.rmtree(workDir)
+
+    logging.info("{} decisive positions of {} written to {} ({:.0f} s)".format(
+        nEntries, nPositions, path, time.perf_counter() - startTime))
+    return nEntries
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Solves small game variants by retrograde analysis")
+    parser.add_argument("--size", type=int, default=4, help="Width of the square board (default: 4)")
+    parser.add_argument("--starting-beads", type=int, default=4,
+        help="Beads each player starts with. The board must not be able to fill. (default: 4)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+        help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("--output", default=None,
+        help="Tablebase file to write (default: tablebase_<size>x<size>_<beads>.tb)")
+    return parser.parse_args()
+
+
+def main():
+    '''
+    Main function
+    '''
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%H:%M:%S')
+    args = parseArgs()
+    output = args.output or "tablebase_{0}x{0}_{1}.tb".format(args.size, args.starting_beads)
+    solve(output, args.size, args.starting_beads, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import time
+from multiprocessing import Pool
+
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+# Local Imports
+from BitBoard import BitBoard
+from Players import createPlayer, PLAYER_TYPES
+from Rules import Rules
+from SelfPlay import loadRecords, playGame
+
+
+# Round robin tournaments between computer players.
+#
+# An agent is a named player type with options, given on the command line as
+# "name=type,option=value,...", e.g. "ab-depth2=alphabeta,maxDepth=2".
+# Every pair of agents plays gamesPerPair games, alternating which of them
+# is red and moves first. Games are played in chunks on a process pool, and
+# each finished chunk is appended to the output file as a JSON line:
+#
+#     {"a", "b", "chunk", "games", "aWins", "bWins", "draws", "plies", "seconds",
+#      "aSpec", "bSpec"}
+#
+# where the specs are the agents' definitions. Rerunning with the same agents
+# only plays the chunks missing from the file. Unfinished games count as draws.
+
+# Agents used when none are given
+DEFAULT_AGENTS = [
+    "random=random",
+    "ab-depth1=alphabeta,maxDepth=1",
+    "ab-depth2=alphabeta,maxDepth=2",
+]
+
+# Virtual draws added to every pair played, so ratings stay finite when an
+# agent wins or loses every game
+PRIOR_DRAWS = 1
+
+ELO_SCALE = 400. / math.log(10)
+
+
+def parseAgent(text):
+    '''
+    Returns (name, spec) for an agent given as "name=type,option=value,...".
+    Values are read as JSON where possible, e.g. numbers, and as strings otherwise.
+    '''
+    name, _, definition = text.partition("=")
+    fields = definition.split(",")
+    if (not name or fields[0] not in PLAYER_TYPES or fields[0] == "human"):
+        raise ValueError("Agents are given as name=type,option=value,... with a computer player type, not '{}'".format(text))
+    options = {}
+    for field in fields[1:]:
+        key, _, value = field.partition("=")
+        if (key not in PLAYER_TYPES[fields[0]].OPTIONS):
+            raise ValueError("Player type {} has no option '{}'".format(fields[0], key))
+        try:
+            options[key] = json.loads(value)
+        except ValueError:
+            options[key] = value
+    return name, {"type": fields[0], "options": options}
+
+
+def createAgent(spec, seed):
+    '''
+    Creates an agent's player. Searches run on one process, as the games are
+    already spread over the pool.
+    '''
+    options = dict(spec["options"])
+    options.setdefault("seed", seed)
+    options.setdefault("nWorkers", 1)
+    return createPlayer(spec["type"], **options)
+
+
+### Worker functions
+
+_workerConfig = None
+
+
+def _initWorker(config):
+    global _workerConfig
+    _workerConfig = config
+
+
+def _playChunk(task):
+    '''
+    Plays one chunk of a pair's games and returns its record
+    '''
+    config = _workerConfig
+    a, b, chunk = task
+    aSpec, bSpec = config["agents"][a], config["agents"][b]
+    first = chunk * config["chunkSize"]
+    nGames = min(config["chunkSize"], config["gamesPerPair"] - first)
+
+    # Seeds depend only on the pair and game, so resumed runs play the same games
+    seed = config["seed"] + 2 * (config["pairIndex"][(a, b)] * config["gamesPerPair"] + first)
+    agents = {a: createAgent(aSpec, seed), b: createAgent(bSpec, seed + 1)}
+
+    record = {"a": a, "b": b, "chunk": chunk, "games": nGames, "aWins": 0, "bWins": 0, "draws": 0, "plies": 0}
+    startTime = time.perf_counter()
+    for game in range(first, first + nGames):
+        red, blue = (a, b) if game % 2 == 0 else (b, a)
+        rules = Rules(BitBoard(config["size"]), config["startingBeads"], config["clearanceRemovals"])
+        winner, moves, _ = playGame(rules, {1: agents[red], -1: agents[blue]}, config["maxPlies"])
+        if (winner == 0):
+            record["draws"] += 1
+        elif ((red if winner == 1 else blue) == a):
+            record["aWins"] += 1
+        else:
+            record["bWins"] += 1
+        record["plies"] += len(moves)
+    record["seconds"] = round(time.perf_counter() - startTime, 4)
+    record["aSpec"], record["bSpec"] = aSpec, bSpec
+    return record
+
+
+### Rating functions
+
+class Results:
+    '''
+    Accumulates wins, losses and draws between each pair of agents
+    '''
+    def __init__(self, names):
+        self.names = names
+        # scores[(a, b)] is [a's wins, b's wins, draws]
+        self.scores = {}
+
+
+    def add(self, record):
+        score = self.scores.setdefault((record["a"], record["b"]), [0, 0, 0])
+        score[0] += record["aWins"]
+        score[1] += record["bWins"]
+        score[2] += record["draws"]
+
+
+    def getGames(self, name):
+        return sum(sum(score) for pair, score in self.scores.items() if name in pair)
+
+
+    def getScore(self, name):
+        '''
+        Returns the fraction of points won by an agent, counting draws as half
+        '''
+        points = 0.
+        for (a, b), (aWins, bWins, draws) in self.scores.items():
+            if (name == a):
+                points += aWins + 0.5 * draws
+            elif (name == b):
+                points += bWins + 0.5 * draws
+        games = self.getGames(name)
+        return points / games if games else 0.
+
+
+def fitElo(names, scores, iterations=200, tolerance=1e-6):
+    '''
+    Returns {name: Elo} fitting the Bradley-Terry model to the results by
+    maximum likelihood, with the ratings averaging 0.
+    scores is as in Results.scores.
+    '''
+    index = {name: i for i, name in enumerate(names)}
+    n = len(names)
+    # Points won and games played by each agent, counting draws as half a win
+    points = [0.] * n
+    games = {}
+    for (a, b), (aWins, bWins, draws) in scores.items():
+        draws += PRIOR_DRAWS
+        i, j = index[a], index[b]
+        points[i] += aWins + 0.5 * draws
+        points[j] += bWins + 0.5 * draws
+        total = aWins + bWins + draws
+        games[(i, j)] = games.get((i, j), 0) + total
+        games[(j, i)] = games.get((j, i), 0) + total
+
+    opponents = [[] for _ in range(n)]
+    for (i, j), total in games.items():
+        opponents[i].append((j, total))
+
+    # Minorisation-maximisation updates of the strengths
+    strengths = [1.] * n
+    for _ in range(iterations):
+        newStrengths = []
+        for i in range(n):
+            denominator = sum(total / (strengths[i] + strengths[j]) for j, total in opponents[i])
+            newStrengths.append(points[i] / denominator if denominator else strengths[i])
+        # Normalise the geometric mean to 1
+        logMean = sum(math.log(s) for s in newStrengths) / n
+        newStrengths = [s / math.exp(logMean) for s in newStrengths]
+        change = max(abs(new - old) / old for new, old in zip(newStrengths, strengths))
+        strengths = newStrengths
+        if (change < tolerance):
+            break
+    return {name: ELO_SCALE * math.log(strengths[index[name]]) for name in names}
+
+
+def getEloIntervals(names, scores, samples=200, confidence=0.95, seed=0):
+    '''
+    Returns {name: (low, high)}, the confidence interval of each Elo from a
+    parametric bootstrap: each pair's results are redrawn from the observed
+    frequencies of wins, losses and draws (with the prior draws), and the Elo refitted.
+    '''
+    rng = random.Random(seed)
+    fits = {name: [] for name in names}
+    for _ in range(samples):
+        resampled = {}
+        for pair, (aWins, bWins, draws) in scores.items():
+            total = aWins + bWins + draws
+            counts = [0, 0, 0]
+            weights = (aWins, bWins, draws + PRIOR_DRAWS)
+            for outcome in rng.choices(range(3), weights=weights, k=total):
+                counts[outcome] += 1
+            resampled[pair] = counts
+        for name, elo in fitElo(names, resampled).items():
+            fits[name].append(elo)
+
+    tail = (1. - confidence) / 2.
+    intervals = {}
+    for name, values in fits.items():
+        values.sort()
+        intervals[name] = (values[int(tail * (samples - 1))], values[int((1. - tail) * (samples - 1))])
+    return intervals
+
+
+def formatTable(results, elos, intervals):
+    '''
+    Returns the agents ranked by Elo as lines of text
+    '''
+    lines = ["{:<4}{:<20}{:>7}{:>16}{:>8}{:>8}".format("", "Agent", "Elo", "95% interval", "Games", "Score")]
+    ranked = sorted(results.names, key=lambda name: -elos[name])
+    for rank, name in enumerate(ranked, 1):
+        low, high = intervals[name]
+        lines.append("{:<4}{:<20}{:>7.0f}{:>16}{:>8}{:>8.1%}".format(
+            rank, name, elos[name], "[{:.0f}, {:.0f}]".format(low, high),
+            results.getGames(name), results.getScore(name)))
+    return lines
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Plays a round robin tournament between computer players and rates them")
+    parser.add_argument("--agent", action="append", dest="agents",
+        help="An agent as name=type,option=value,..., e.g. ab2=alphabeta,maxDepth=2. "
+            "Repeat for each agent (default: {})".format(" ".join(DEFAULT_AGENTS)))
+    parser.add_argument("--games", type=int, default=100,
+        help="Games between each pair of agents, each starting half of them (default: 100)")
+    parser.add_argument("--chunk-size", type=int, default=20,
+        help="Games played by a worker at a time, and the unit saved for resuming (default: 20)")
+    parser.add_argument("--size", type=int, default=5, help="Width of the square board (default: 5)")
+    parser.add_argument("--starting-beads", type=int,
+        help="Beads each player starts with (default: two thirds of the spaces, 17 on 5x5)")
+    parser.add_argument("--clearance-removals", type=int,
+        help="Beads removed when the board fills (default: a quarter of the spaces, 6 on 5x5)")
+    parser.add_argument("--max-plies", type=int, default=400,
+        help="Games longer than this count as draws (default: 400)")
+    parser.add_argument("--seed", type=int, default=0, help="Base random seed (default: 0)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+        help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("--output", default="tournament.jsonl",
+        help="File to save finished chunks of games to. Rerun with the same file to resume. (default: tournament.jsonl)")
+    parser.add_argument("--bootstrap", type=int, default=200,
+        help="Resamples used for the Elo confidence intervals (default: 200)")
+    parser.add_argument("--report-interval", type=float, default=10.,
+        help="Seconds between progress reports (default: 10)")
+    return parser.parse_args()
+
+
+def main():
+    '''
+    Main function
+    '''
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%H:%M:%S')
+    args = parseArgs()
+
+    agents = dict(parseAgent(text) for text in (args.agents or DEFAULT_AGENTS))
+    names = list(agents)
+    if (len(names) < 2):
+        raise SystemExit("A tournament needs at least two agents")
+    pairs = list(itertools.combinations(names, 2))
+    config = {
+        "agents": agents,
+        "pairIndex": {pair: i for i, pair in enumerate(pairs)},
+        "gamesPerPair": args.games,
+        "chunkSize": args.chunk_size,
+        "size": args.size,
+        "startingBeads": args.starting_beads,
+        "clearanceRemovals": args.clearance_removals,
+        "maxPlies": args.max_plies,
+        "seed": args.seed,
+    }
+
+    # Chunks already played by the same agents are kept
+    results = Results(names)
+    done = set()
+    for record in loadRecords(args.output):
+        a, b = record["a"], record["b"]
+        if ((a, b) in config["pairIndex"] and (record["aSpec"], record["bSpec"]) == (agents[a], agents[b])):
+            results.add(record)
+            done.add((a, b, record["chunk"]))
+    nChunks = (args.games + args.chunk_size - 1) // args.chunk_size
+    pending = [(a, b, chunk) for chunk in range(nChunks) for a, b in pairs if (a, b, chunk) not in done]
+    if (done):
+        logging.info("Resuming: {} chunks already played, {} to play".format(len(done), len(pending)))
+    nTotal = len(pairs) * args.games
+    nDone = nTotal - sum(min(args.chunk_size, args.games - chunk * args.chunk_size) for _, _, chunk in pending)
+
+    startTime = time.perf_counter()
+    lastReport = startTime
+    nGames = 0
+    nPlies = 0
+    pool = None
+    output = open(args.output, "a")
+    try:
+        if (args.workers > 1):
+            pool = Pool(args.workers, initializer=_initWorker, initargs=(config,))
+            records = pool.imap_unordered(_playChunk, pending)
+        else:
+            _initWorker(config)
+            records = map(_playChunk, pending)
+
+        for record in records:
+            output.write(json.dumps(record, separators=(",", ":")) + "\n")
+            output.flush()
+            results.add(record)
+            nGames += record["games"]
+            nPlies += record["plies"]
+
+            now = time.perf_counter()
+            if (now - lastReport > args.report_interval):
+                lastReport = now
+                logging.info("{}/{} games, {:.1f} games/s".format(
+                    nDone + nGames, nTotal, nGames/(now - startTime)))
+    except KeyboardInterrupt:
+        logging.info("Interrupted. Rerun the same command to resume.")
+    finally:
+        if (pool is not None):
+            pool.terminate()
+        output.close()
+
+    elapsed = time.perf_counter() - startTime
+    print("Played {} games in {:.1f} s ({:.1f} games/s, {:.0f} plies/s)".format(
+        nGames, elapsed, nGames/elapsed if elapsed else 0., nPlies/elapsed if elapsed else 0.))
+    elos = fitElo(names, results.scores)
+    intervals = getEloIntervals(names, results.scores, args.bootstrap, seed=args.seed)
+    print("\n".join(formatTable(results, elos, intervals)))
+
+
+if __name__ == "__main__":
+    main()
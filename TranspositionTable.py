@@ -0,0 +1,93 @@
+# Setup logging
+import logging
+logger = logging.getLogger(__file__)
+
+
+# Bound types for stored values
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+class TranspositionTable:
+    '''
+    Fixed-size table of evaluated positions, keyed by Rules.getHash.
+
+    Slots are grouped into buckets of two. A new entry replaces, in order of
+    preference: an entry for the same position, an empty slot, an entry left
+    over from an earlier search, then the entry searched to the lowest depth.
+    '''
+    def __init__(self, nEntries=1 << 16):
+        assert(nEntries >= 2)
+        # Round down to a power of two so the index is a mask of the hash
+        self.nEntries = 1 << (nEntries.bit_length() - 1)
+        self.bucketMask = (self.nEntries - 1) & ~1
+
+        # Each entry is (key, depth, value, flag, move, generation)
+        self.entries = [None] * self.nEntries
+        self.generation = 0
+
+        self.probes = 0
+        self.hits = 0
+
+
+    def clear(self):
+        self.entries = [None] * self.nEntries
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+
+    def newSearch(self):
+        '''
+        Marks existing entries as belonging to an earlier search.
+        They remain usable, but are replaced first.
+        '''
+        self.generation += 1
+
+
+    def lookup(self, key):
+        '''
+        Returns (depth, value, flag, move) for a position, or None
+        '''
+        self.probes += 1
+        i = key & self.bucketMask
+        for entry in (self.entries[i], self.entries[i + 1]):
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[1:5]
+        return None
+
+
+    def store(self, key, depth, value, flag, move=None):
+        i = key & self.bucketMask
+        entries = self.entries
+        first, second = entries[i], entries[i + 1]
+
+        if (first is not None and first[0] == key):
+            slot = i
+        elif (second is not None and second[0] == key):
+            slot = i + 1
+        elif (first is None):
+            slot = i
+        elif (second is None):
+            slot = i + 1
+        elif (first[5] != self.generation and second[5] == self.generation):
+            slot = i
+        elif (second[5] != self.generation and first[5] == self.generation):
+            slot = i + 1
+        else:
+            slot = i if first[1] <= second[1] else i + 1
+
+        entries[slot] = (key, depth, value, flag, move, self.generation)
+
+
+    def getFill(self):
+        '''
+        Returns the fraction of slots in use
+        '''
+        return sum(1 for entry in self.entries if entry is not None) / float(self.nEntries)
+
+
+    def __len__(self):
+        return self.nEntries